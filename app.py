@@ -1,13 +1,36 @@
+import io
+import json
 import os
-from typing import List, Optional
-from flask import Flask, request, jsonify
+import tempfile
+import time
+from collections import deque
+from functools import partial
+from typing import Generator, Iterator, List, Optional
+from flask import Flask, request, jsonify, url_for
 from flask_cors import CORS
-from lib.app_logger import logger, trim_log_file
-from lib.query_generation import generate_search_queries, check_ollama_connection_health
-from lib.text_processing import extract_keywords, detect_language
+from lib.startup import startup_step, mark_startup_complete, get_startup_report
+from lib.app_logger import logger
+from lib.log_reader import read_log_tail, read_log_forward, get_log_end_cursor, parse_log_cursor, parse_log_level, \
+    parse_log_since, LOGS_DEFAULT_TAIL, LOGS_MAX_LINES
+from lib.cache import get_cache_stats
+from lib.pipeline_cache import extracted_text_cache, keywords_cache, queries_cache, videos_cache, \
+    get_extracted_text_cache_key, get_keywords_cache_key, get_queries_cache_items, get_queries_cache_scope, \
+    get_videos_cache_key
+from lib.query_generation import generate_search_queries, generate_search_queries_stream, complete_queries, \
+    ollama_model_name, build_fallback_queries, ollama_gateway, \
+    query_batcher, generation_stats
+from lib.health import health_monitor
+from lib.jobs import job_queue, JobQueueFullError, JOB_FINISHED_STATUSES, JOBS_EVENTS_MAX_SECONDS, JOBS_POLL_SECONDS
+from lib.ollama_lifecycle import model_lifecycle, OLLAMA_PRELOAD_ON_STARTUP
+from lib.pipeline_executor import pipeline_executor, PipelineBusyError, PipelineTaskTimeoutError, \
+    PIPELINE_PDF_CHUNK_PAGES
+from lib.text_processing import extract_keywords, detect_language, warm_up_keyword_extractors, \
+    LARGE_DOCUMENT_THRESHOLD_CHARS, KEYWORD_SECTION_SIZE_CHARS, KEYWORD_MAX_SECTIONS
 from lib.types.StreamResponse import StreamResponse, StreamProcessStatus
-from lib.word_extraction import read_file_from_bytes
-from lib.youtube_interactions import search_youtube_videos, Video
+from lib.word_extraction import read_file_from_bytes, iter_pdf_pages_text, extract_pdf_pages_text, join_pdf_pages, \
+    get_text_extraction_config
+from lib.youtube_interactions import ConcurrentYouTubeSearch, Video, warm_up_youtube_client_pool, \
+    youtube_client_pool
 
 app = Flask(__name__)
 CORS(app, origins=["http://localhost:3000", "http://127.0.0.1:3000", "https://yt-reference-finder-frontend.vercel.app"])  # Allow requests only from http://localhost:3000
@@ -15,6 +38,28 @@ CORS(app, origins=["http://localhost:3000", "http://127.0.0.1:3000", "https://yt
 MAX_QUERIES_TO_GENERATE = 4  # Numero massimo di query da generare, che poi verranno passate a youtube per la ricerca
 MIN_LIKES = 500 # Numero minimo di like per considerare un video rilevante
 MIN_SUBSCRIBERS = 10000 # Numero minimo di iscritti al canale per considerare un video rilevante
+KEYWORDS_TOP_N = 15 # Numero di keywords estratte dal testo
+KEYWORDS_N_WORD_RANGE = (1, 5) # Numero minimo e massimo di parole per keyword
+KEYWORDS_ALGORITHM = 'yake'
+WARM_UP_KEYWORD_EXTRACTORS = os.environ.get("WARM_UP_KEYWORD_EXTRACTORS", "True").lower() == "true"
+PARTIAL_KEYWORDS_MIN_PAGES = int(os.environ.get("PARTIAL_KEYWORDS_MIN_PAGES", "30"))  # PDF da cui inviare le keywords parziali
+PARTIAL_KEYWORDS_PAGES = int(os.environ.get("PARTIAL_KEYWORDS_PAGES", "10"))  # Pagine analizzate per le keywords parziali
+LOGS_FOLLOW_POLL_SECONDS = float(os.environ.get("LOGS_FOLLOW_POLL_SECONDS", "1"))  # Intervallo di lettura dei nuovi log
+LOGS_FOLLOW_MAX_SECONDS = float(os.environ.get("LOGS_FOLLOW_MAX_SECONDS", "300"))  # Durata massima di /logs?follow=true
+
+with startup_step('youtube_client_pool'):
+    warm_up_youtube_client_pool()
+if WARM_UP_KEYWORD_EXTRACTORS:
+    with startup_step('keyword_extractors'):
+        warm_up_keyword_extractors(max_ngram_size=KEYWORDS_N_WORD_RANGE[1], top_n=KEYWORDS_TOP_N)
+with startup_step('pipeline_pool'):
+    pipeline_executor.start(warm_up=partial(warm_up_keyword_extractors, max_ngram_size=KEYWORDS_N_WORD_RANGE[1],
+                                            top_n=KEYWORDS_TOP_N) if WARM_UP_KEYWORD_EXTRACTORS else None)
+if OLLAMA_PRELOAD_ON_STARTUP:
+    with startup_step('ollama_model_preload_started'):
+        model_lifecycle.start()
+health_monitor.start()
+mark_startup_complete()
 
 def rank_videos(notes_text, videos: List[Video]):
     # Ordina i video per punteggio di engagement
@@ -32,6 +77,94 @@ def filter_unique_videos(all_videos: List[Video]) -> List[Video]:
     return unique_videos
 
 
+def read_file_cached(file_bytes: bytes, filename: str) -> tuple[bool, str]:
+    """Estrae il testo dal file, riutilizzando il risultato se lo stesso file è già stato elaborato"""
+    cache_key = get_extracted_text_cache_key(file_bytes, filename, *get_text_extraction_config())
+    cached_text = extracted_text_cache.get(cache_key)
+    if cached_text is not None:
+        logger.info(f"Extracted text of {filename} found in cache")
+        return True, cached_text
+
+    read_suc, text = pipeline_executor.run(read_file_from_bytes, file_bytes, filename)
+    if read_suc and text.strip():
+        extracted_text_cache.set(cache_key, text)
+    return read_suc, text
+
+
+def extract_keywords_cached(text: str) -> tuple[str, list[tuple[str, float]]]:
+    """Rileva la lingua ed estrae le keywords del testo, usando la cache quando possibile"""
+    cache_key = get_keywords_cache_key(text, KEYWORDS_TOP_N, KEYWORDS_N_WORD_RANGE, KEYWORDS_ALGORITHM,
+                                       LARGE_DOCUMENT_THRESHOLD_CHARS, KEYWORD_SECTION_SIZE_CHARS, KEYWORD_MAX_SECTIONS)
+    cached_keywords = keywords_cache.get(cache_key)
+    if cached_keywords is not None:
+        logger.info("Language and keywords found in cache")
+        return cached_keywords['language'], cached_keywords['keywords']
+
+    detected_language = detect_language(text)
+    keywords = pipeline_executor.run(extract_keywords, text=text, top_n=KEYWORDS_TOP_N,
+                                     n_word_range=KEYWORDS_N_WORD_RANGE, algorithm=KEYWORDS_ALGORITHM,
+                                     language=detected_language)
+    if keywords:
+        keywords_cache.set(cache_key, {'language': detected_language, 'keywords': keywords})
+    return detected_language, keywords
+
+
+def get_cached_search_queries(keywords: list[tuple[str, float]], detected_language: str) -> Optional[list[str]]:
+    """Restituisce le query già generate per keywords uguali o molto simili, None se non sono in cache"""
+    cached_queries, similarity = queries_cache.get(get_queries_cache_items(keywords),
+                                                   get_queries_cache_scope(detected_language, MAX_QUERIES_TO_GENERATE,
+                                                                           ollama_model_name))
+    if cached_queries is not None:
+        logger.info(f"Generated queries found in cache, keywords similarity: {similarity:.2f}")
+    return cached_queries
+
+
+def set_cached_search_queries(keywords: list[tuple[str, float]], detected_language: str, queries: list[str]):
+    queries_cache.set(get_queries_cache_items(keywords),
+                      get_queries_cache_scope(detected_language, MAX_QUERIES_TO_GENERATE, ollama_model_name), queries)
+
+
+def generate_search_queries_cached(keywords: list[tuple[str, float]], detected_language: str) -> list[str]:
+    """Genera le query di ricerca, riutilizzando quelle già generate per le stesse keywords"""
+    cached_queries = get_cached_search_queries(keywords, detected_language)
+    if cached_queries is not None:
+        return cached_queries
+
+    try:
+        queries = generate_search_queries(keywords=keywords, num_queries=MAX_QUERIES_TO_GENERATE,
+                                          query_language=detected_language, fallback_on_error=False)
+    except Exception:
+        # Le query di ripiego non vengono salvate, così la prossima richiesta riproverà con il modello
+        return build_fallback_queries(keywords, MAX_QUERIES_TO_GENERATE)
+
+    if queries:
+        set_cached_search_queries(keywords, detected_language, queries)
+    return queries
+
+
+def generate_search_queries_incremental(keywords: list[tuple[str, float]], detected_language: str) -> Iterator[str]:
+    """
+    Restituisce le query man mano che il modello le genera; al termine le completa con le keywords se sono meno
+    di MAX_QUERIES_TO_GENERATE e le salva in cache. Se la generazione fallisce, le query mancanti vengono
+    sostituite da quelle di ripiego, che non vengono salvate.
+    """
+    queries = []
+    try:
+        for query in generate_search_queries_stream(keywords=keywords, num_queries=MAX_QUERIES_TO_GENERATE,
+                                                    query_language=detected_language):
+            queries.append(query)
+            yield query
+    except Exception as e:
+        logger.error(f"Error generating search queries: {e}, model: {ollama_model_name}")
+        yield from complete_queries(queries, keywords, MAX_QUERIES_TO_GENERATE)[len(queries):]
+        return
+
+    completed_queries = complete_queries(queries, keywords, MAX_QUERIES_TO_GENERATE)
+    yield from completed_queries[len(queries):]
+    if completed_queries:
+        set_cached_search_queries(keywords, detected_language, completed_queries)
+
+
 @app.route('/')
 @app.route('/about', methods=['GET'])
 def about():
@@ -39,32 +172,209 @@ def about():
         {'about': 'This is a simple API to extract keywords from a text and search YouTube videos based on them.'})
 
 
+def build_health_response(checks: dict[str, dict]):
+    ollama_check = checks['ollama']
+    return jsonify(
+        {'status': 'ok' if all(check['healthy'] is not False for check in checks.values()) else 'degraded',
+         'message': 'API is running', 'ollama_connection_healthy': ollama_check['healthy'],
+         'ollama_model': ollama_check.get('details', {}).get('model'), 'checks': checks,
+         'startup': get_startup_report()})
+
+
 @app.route('/health', methods=['GET'])
 def health_check():
-    is_ollama_connection_healthy = check_ollama_connection_health()
-    return jsonify(
-        {'status': 'ok', 'message': 'API is running', 'ollama_connection_healthy': is_ollama_connection_healthy})
+    """Risponde con l'ultimo risultato dei controlli eseguiti in background, senza contattare i servizi"""
+    return build_health_response(health_monitor.get_results())
+
+
+@app.route('/health/deep', methods=['GET'])
+def deep_health_check():
+    """Esegue subito tutti i controlli (Ollama, API key di YouTube, NLTK, tesseract)"""
+    return build_health_response(health_monitor.run_all())
+
+
+@app.route('/stats', methods=['GET'])
+def get_stats():
+    return jsonify({'caches': get_cache_stats(), 'ollama': ollama_gateway.stats(),
+                    'ollama_batching': query_batcher.stats(), 'ollama_generation': generation_stats.stats(),
+                    'pipeline': pipeline_executor.stats(), 'jobs': job_queue.stats(),
+                    'youtube_clients': youtube_client_pool.stats()})
+
+
+@app.errorhandler(PipelineBusyError)
+def pipeline_busy(error):
+    logger.warning(f"Request rejected: {error}")
+    return jsonify({'error': 'Server busy, retry later'}), 503
+
+
+@app.errorhandler(PipelineTaskTimeoutError)
+def pipeline_timeout(error):
+    logger.warning(f"Request timed out in the pipeline: {error}")
+    return jsonify({'error': 'Processing timed out'}), 504
 
 
 @app.route('/logs', methods=['GET'])
 def get_api_logs():
+    """
+    Restituisce il log senza caricarlo tutto in memoria.
+
+    Query parameters:
+        tail: numero di record restituiti (default LOGS_DEFAULT_TAIL, massimo LOGS_MAX_LINES)
+        since: timestamp ISO 8601 o secondi epoch; solo i record successivi
+        level: livello minimo (DEBUG, INFO, WARNING, ERROR, CRITICAL)
+        cursor: restituisce i record successivi al cursore (`next_cursor` di una risposta precedente)
+        before: restituisce i record precedenti al cursore (`prev_cursor` di una risposta precedente)
+        follow: se "true" restituisce un flusso NDJSON con i nuovi record, a partire da `cursor` o dalla fine del log
+    """
     try:
-        with open('app.log', 'r', encoding='utf-8') as f:
-            logs = f.readlines()
-        return jsonify({'logs': logs})
+        limit = min(int(request.args.get('tail', LOGS_DEFAULT_TAIL)), LOGS_MAX_LINES)
+        since = parse_log_since(request.args['since']) if request.args.get('since') else None
+        min_level = parse_log_level(request.args['level']) if request.args.get('level') else None
+        cursor = request.args.get('cursor')
+        before = request.args.get('before')
+        if cursor:
+            parse_log_cursor(cursor)
+        if before:
+            parse_log_cursor(before)
+        if limit < 1:
+            raise ValueError("tail must be positive")
+    except ValueError as e:
+        return jsonify({'error': f'Invalid parameter: {e}'}), 400
+
+    try:
+        if request.args.get('follow', 'false').lower() == 'true':
+            return app.response_class(generate_log_follow(cursor or get_log_end_cursor(), since, min_level),
+                                      mimetype='application/x-ndjson')
+        if cursor:
+            page = read_log_forward(cursor, limit=limit, since=since, min_level=min_level)
+        else:
+            page = read_log_tail(limit=limit, since=since, min_level=min_level, before=before)
+        return jsonify({'logs': [record.text for record in page.records],
+                        'next_cursor': page.next_cursor,
+                        'prev_cursor': page.prev_cursor})
     except Exception as e:
         logger.error(f"Error reading logs: {e}")
         return jsonify({'error': 'Could not read logs'}), 500
 
 
+def generate_log_follow(cursor: Optional[str], since: Optional[str], min_level: Optional[int]):
+    """Invia i nuovi record del log man mano che vengono scritti, per al massimo LOGS_FOLLOW_MAX_SECONDS"""
+    deadline = time.monotonic() + LOGS_FOLLOW_MAX_SECONDS
+    while True:
+        page = read_log_forward(cursor, limit=LOGS_MAX_LINES, since=since, min_level=min_level)
+        for record in page.records:
+            yield json.dumps({'timestamp': record.timestamp, 'level': record.level, 'log': record.text,
+                              'cursor': record.cursor}) + '\n'
+        cursor = page.next_cursor
+        if time.monotonic() >= deadline:
+            # L'ultima riga permette al client di riprendere da dove si è fermato
+            yield json.dumps({'cursor': cursor, 'follow_ended': True}) + '\n'
+            return
+        if not page.records:
+            time.sleep(LOGS_FOLLOW_POLL_SECONDS)
+
+
+def iter_pdf_pages_pipeline(file_bytes: bytes) -> Iterator[tuple[int, int, str]]:
+    """
+    Come iter_pdf_pages_text, ma il testo viene estratto nel pool della pipeline a blocchi di
+    PIPELINE_PDF_CHUNK_PAGES pagine, con al massimo un blocco in corso per processo del pool.
+    I blocchi successivi vengono estratti mentre le pagine del blocco corrente vengono restituite.
+    Il PDF viene scritto una sola volta in un file temporaneo, letto dai processi del pool, e l'attesa di tutti
+    i blocchi è limitata da un'unica scadenza (PIPELINE_REQUEST_TIMEOUT_SECONDS).
+    """
+    if not pipeline_executor.enabled:
+        yield from iter_pdf_pages_text(io.BytesIO(file_bytes))
+        return
+
+    deadline = pipeline_executor.request_deadline()
+    with tempfile.NamedTemporaryFile(prefix='pipeline-', suffix='.pdf') as pdf_file:
+        pdf_file.write(file_bytes)
+        pdf_file.flush()
+
+        # Il primo blocco restituisce anche il numero di pagine, necessario per dividere le altre
+        total_pages, page_texts = pipeline_executor.result(
+            pipeline_executor.submit(extract_pdf_pages_text, pdf_file.name, 0, PIPELINE_PDF_CHUNK_PAGES), deadline)
+        first_page, next_page = 0, PIPELINE_PDF_CHUNK_PAGES
+        chunks = deque()
+        try:
+            while True:
+                while next_page < total_pages and len(chunks) < pipeline_executor.max_workers:
+                    try:
+                        chunk_future = pipeline_executor.submit(extract_pdf_pages_text, pdf_file.name, next_page,
+                                                                next_page + PIPELINE_PDF_CHUNK_PAGES)
+                    except PipelineBusyError:
+                        if not chunks:
+                            raise
+                        break  # Si riprova dopo aver atteso i blocchi già in corso
+                    chunks.append((next_page, chunk_future))
+                    next_page += PIPELINE_PDF_CHUNK_PAGES
+
+                for offset, page_text in enumerate(page_texts):
+                    yield first_page + offset, total_pages, page_text
+                if not chunks:
+                    return
+                first_page, chunk_future = chunks.popleft()
+                _, page_texts = pipeline_executor.result(chunk_future, deadline)
+        finally:
+            # Se l'estrazione si interrompe (errore o client disconnesso) i blocchi ancora in coda non servono più
+            for _, chunk_future in chunks:
+                chunk_future.cancel()
+
+
+def read_pdf_with_progress(file_bytes: bytes, filename: str) -> Generator[str, None, tuple[bool, str]]:
+    """
+    Estrae il testo del PDF pagina per pagina inviando un evento di avanzamento per ogni pagina; restituisce
+    (successo, testo) come valore di ritorno del generatore. Per i documenti lunghi invia anche le keywords
+    delle prime pagine, prima che l'estrazione del testo sia terminata.
+    """
+    cache_key = get_extracted_text_cache_key(file_bytes, filename, *get_text_extraction_config())
+    cached_text = extracted_text_cache.get(cache_key)
+    if cached_text is not None:
+        logger.info(f"Extracted text of {filename} found in cache")
+        return True, cached_text
+
+    page_texts = []
+    try:
+        for page_index, total_pages, page_text in iter_pdf_pages_pipeline(file_bytes):
+            page_texts.append(page_text)
+            yield StreamResponse(status=StreamProcessStatus.FILE_PAGE_PROCESSED, filename=filename,
+                                 progress={'page': page_index + 1, 'total_pages': total_pages}).to_json()
+
+            if total_pages >= PARTIAL_KEYWORDS_MIN_PAGES and page_index + 1 == PARTIAL_KEYWORDS_PAGES:
+                partial_text = join_pdf_pages(page_texts).strip()
+                if partial_text:
+                    partial_keywords = pipeline_executor.run(extract_keywords, text=partial_text, top_n=KEYWORDS_TOP_N,
+                                                             n_word_range=KEYWORDS_N_WORD_RANGE,
+                                                             algorithm=KEYWORDS_ALGORITHM,
+                                                             language=detect_language(partial_text))
+                    yield StreamResponse(status=StreamProcessStatus.PARTIAL_KEYWORDS_EXTRACTED, keywords=partial_keywords,
+                                         progress={'page': page_index + 1, 'total_pages': total_pages}).to_json()
+    except (PipelineBusyError, PipelineTaskTimeoutError):
+        raise  # Non dipendono dal file: gestiti da chi invia lo stream
+    except Exception as e:
+        logger.error(f"Error extracting text from file {filename}: {e}", exc_info=True)
+        return False, ""
+
+    text = join_pdf_pages(page_texts)
+    # Un testo vuoto (ad esempio una scansione senza OCR disponibile) non viene salvato, per riprovare in seguito
+    if text.strip():
+        extracted_text_cache.set(cache_key, text)
+    return True, text
+
+
 def generate_process_stream(file_bytes_arg: Optional[bytes], original_filename_arg: Optional[str], form_text_arg: str):
     text_from_file = ""
+    youtube_search = None
     try:
         if file_bytes_arg is not None and original_filename_arg:
             logger.info(f"Received file for streaming: {original_filename_arg} ({len(file_bytes_arg)} bytes)")
             yield StreamResponse(status=StreamProcessStatus.FILE_RECEIVED, filename=original_filename_arg).to_json()
 
-            read_suc, text_from_file_content = read_file_from_bytes(file_bytes_arg, original_filename_arg)
+            if original_filename_arg.endswith('.pdf'):
+                read_suc, text_from_file_content = yield from read_pdf_with_progress(file_bytes_arg,
+                                                                                     original_filename_arg)
+            else:
+                read_suc, text_from_file_content = read_file_cached(file_bytes_arg, original_filename_arg)
             if not read_suc:
                 yield StreamResponse(status=StreamProcessStatus.ERROR,
                                      message='File format not supported or error reading file content',
@@ -91,34 +401,66 @@ def generate_process_stream(file_bytes_arg: Optional[bytes], original_filename_a
         logger.info(f"Processing text: {text[:100]}\n...\n{text[-100:]}")
         yield StreamResponse(status=StreamProcessStatus.EXTRACTING_KEYWORDS).to_json()
 
-        detected_language = detect_language(text)
-
-        keywords_data = extract_keywords(text=text, top_n=15, n_word_range=(1, 5), algorithm='yake', language=detected_language)
+        detected_language, keywords_data = extract_keywords_cached(text)
         logger.info(f"Extracted Keywords: {keywords_data}")
         yield StreamResponse(status=StreamProcessStatus.KEYWORDS_EXTRACTED, keywords=keywords_data).to_json()
 
         yield StreamResponse(status=StreamProcessStatus.GENERATING_QUERIES).to_json()
-        queries = generate_search_queries(keywords=keywords_data, num_queries=MAX_QUERIES_TO_GENERATE, query_language=detected_language)
+        youtube_search = ConcurrentYouTubeSearch(video_language=detected_language, min_likes=MIN_LIKES,
+                                                 min_subscribers=MIN_SUBSCRIBERS)
+        queries = get_cached_search_queries(keywords_data, detected_language)
+        ranked_videos = None
+        if queries is not None:
+            yield StreamResponse(status=StreamProcessStatus.QUERIES_GENERATED, queries=queries).to_json()
+            yield StreamResponse(status=StreamProcessStatus.YOUTUBE_SEARCH_STARTED, queries=queries).to_json()
+            ranked_videos = videos_cache.get(get_videos_cache_key(queries, detected_language, MIN_LIKES,
+                                                                  MIN_SUBSCRIBERS))
+            if ranked_videos is None:
+                for query in queries:
+                    youtube_search.submit(query)
+        else:
+            # La ricerca di ogni query parte appena il modello ne ha completato la riga, mentre scrive le successive
+            queries = []
+            for query in generate_search_queries_incremental(keywords_data, detected_language):
+                queries.append(query)
+                youtube_search.submit(query)
+                yield StreamResponse(status=StreamProcessStatus.QUERIES_GENERATED, queries=list(queries)).to_json()
+                if len(queries) == 1:
+                    yield StreamResponse(status=StreamProcessStatus.YOUTUBE_SEARCH_STARTED,
+                                         queries=list(queries)).to_json()
+                for completed_query, search_results in youtube_search.poll_completed():
+                    logger.info(f"Found {len(search_results)} search results for query '{completed_query}'")
+                    yield StreamResponse(status=StreamProcessStatus.YOUTUBE_QUERY_COMPLETED,
+                                         queries=[completed_query], videos=search_results,
+                                         message=f"{len(search_results)} search results").to_json()
         logger.info(f"Generated Queries: {queries}")
+        youtube_search.start_deadline()  # Tutte le query sono state accodate
 
         if not queries or len(queries) == 0:
             logger.warning(f"No queries generated from keywords, MAX_QUERIES_TO_GENERATE={MAX_QUERIES_TO_GENERATE}")
-
-        yield StreamResponse(status=StreamProcessStatus.QUERIES_GENERATED, queries=queries).to_json()
-
-        yield StreamResponse(status=StreamProcessStatus.YOUTUBE_SEARCH_STARTED, queries=queries).to_json()
-        all_videos = []
-        with app.app_context():
-            for i, query in enumerate(queries):
-                try:
-                    videos = search_youtube_videos(query=query, video_language=detected_language, min_likes=MIN_LIKES, min_subscribers=MIN_SUBSCRIBERS)
-                    all_videos.extend(videos)
-                    logger.info(f"Found {len(videos)} videos for query '{query}'")
-                except Exception as e:
-                    logger.error(f"Error searching YouTube for query '{query}': {e}")
-
-        unique_videos = filter_unique_videos(all_videos)
-        ranked_videos = rank_videos(text, unique_videos)
+            yield StreamResponse(status=StreamProcessStatus.QUERIES_GENERATED, queries=queries).to_json()
+
+        videos_cache_key = get_videos_cache_key(queries, detected_language, MIN_LIKES, MIN_SUBSCRIBERS)
+        if ranked_videos is None:
+            all_videos = []
+            with app.app_context():
+                for query, search_results in youtube_search.as_completed():
+                    logger.info(f"Found {len(search_results)} search results for query '{query}'")
+                    yield StreamResponse(status=StreamProcessStatus.YOUTUBE_QUERY_COMPLETED, queries=[query],
+                                         videos=search_results,
+                                         message=f"{len(search_results)} search results").to_json()
+
+            # Statistiche di canali e video recuperate una sola volta per tutte le query
+            for query, videos in youtube_search.enrich_results().items():
+                all_videos.extend(videos)
+                logger.info(f"Found {len(videos)} videos for query '{query}'")
+
+            unique_videos = filter_unique_videos(all_videos)
+            ranked_videos = rank_videos(text, unique_videos)
+            if youtube_search.is_complete:
+                videos_cache.set(videos_cache_key, ranked_videos)
+        else:
+            logger.info("Ranked videos found in cache")
         logger.info(f"Ranked Videos (first 10): {[v.title for v in ranked_videos[:10]]}")
 
         yield StreamResponse(status=StreamProcessStatus.YOUTUBE_SEARCH_COMPLETED, videos=ranked_videos[:10]).to_json()
@@ -126,16 +468,27 @@ def generate_process_stream(file_bytes_arg: Optional[bytes], original_filename_a
         yield StreamResponse(status=StreamProcessStatus.PROCESSING_COMPLETE, keywords=keywords_data, queries=queries,
                              videos=ranked_videos[:10]).to_json()
         logger.info("Streamed all processing steps.")
+    except PipelineBusyError as e:
+        logger.warning(f"Stream rejected: {e}")
+        yield StreamResponse(status=StreamProcessStatus.ERROR, message='Server busy, retry later',
+                             error_code='pipeline_busy').to_json()
+    except PipelineTaskTimeoutError as e:
+        logger.warning(f"Stream timed out in the pipeline: {e}")
+        yield StreamResponse(status=StreamProcessStatus.ERROR, message='Processing timed out',
+                             error_code='pipeline_timeout').to_json()
     except Exception as e:
         logger.error(f"Error during stream generation: {e}")
         yield StreamResponse(status=StreamProcessStatus.ERROR,
                              message=f'An internal error occurred during processing: {str(e)}').to_json()
     finally:
-        trim_log_file()
+        # Se il client si disconnette prima della fine, le ricerche ancora in corso non servono più
+        if youtube_search is not None:
+            youtube_search.cancel()
 
 
 @app.route('/process', methods=['POST'])
 def process():
+    model_lifecycle.record_traffic()
     is_stream = request.form.get('response_as_stream', 'false').lower() == 'true'
 
     file_bytes_from_request: Optional[bytes] = None
@@ -171,7 +524,7 @@ def process():
     # Percorso non in streaming
     text_from_file_content = ""
     if file_bytes_from_request and filename_from_request:
-        read_suc, text_from_file_content = read_file_from_bytes(file_bytes_from_request, filename_from_request)
+        read_suc, text_from_file_content = read_file_cached(file_bytes_from_request, filename_from_request)
         if not read_suc:
             return jsonify({'error': 'Formato file non supportato o errore nella lettura del contenuto del file',
                             'filename': filename_from_request}), 400
@@ -191,28 +544,31 @@ def process():
 
     logger.info(f"Processing text: {text[:100]}\n...\n{text[-100:]}")
 
-    detected_language = detect_language(text)
-
-    keywords = extract_keywords(text=text, top_n=15, n_word_range=(1, 5), algorithm='yake', language=detected_language)
+    detected_language, keywords = extract_keywords_cached(text)
     logger.info(f"Extracted Keywords: {keywords}")
 
-    queries = generate_search_queries(keywords=keywords, num_queries=MAX_QUERIES_TO_GENERATE, query_language=detected_language)
+    queries = generate_search_queries_cached(keywords, detected_language)
     logger.info(f"Generated Queries: {queries}")
 
     if not queries or len(queries) == 0:
         logger.warning(f"No queries generated from keywords, MAX_QUERIES_TO_GENERATE={MAX_QUERIES_TO_GENERATE}")
 
-    # Cerca video
-    all_videos = []
-    for query in queries:
-        try:
-            videos = search_youtube_videos(query=query, video_language=detected_language, min_likes=MIN_LIKES, min_subscribers=MIN_SUBSCRIBERS)
+    # Cerca video, eseguendo le query in parallelo
+    videos_cache_key = get_videos_cache_key(queries, detected_language, MIN_LIKES, MIN_SUBSCRIBERS)
+    ranked_videos = videos_cache.get(videos_cache_key)
+    if ranked_videos is None:
+        all_videos = []
+        youtube_search = ConcurrentYouTubeSearch(video_language=detected_language, min_likes=MIN_LIKES, min_subscribers=MIN_SUBSCRIBERS)
+        for query in queries:
+            youtube_search.submit(query)
+        youtube_search.wait_all()
+        for query, videos in youtube_search.enrich_results().items():
             all_videos.extend(videos)
-        except Exception as e:
-            logger.error(f"Error searching YouTube for query '{query}': {e}")
 
-    unique_videos = filter_unique_videos(all_videos)
-    ranked_videos = rank_videos(text, unique_videos)
+        unique_videos = filter_unique_videos(all_videos)
+        ranked_videos = rank_videos(text, unique_videos)
+        if youtube_search.is_complete:
+            videos_cache.set(videos_cache_key, ranked_videos)
     logger.info(f"Ranked Videos (first 10): {[v.title for v in ranked_videos[:10]]}")
 
     response_data = {
@@ -226,13 +582,113 @@ def process():
     except Exception as e:
         logger.error(f"Error creating and getting JSON from response: {e}")
 
-    trim_log_file()
     return response
 
 
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    """
+    Accoda l'elaborazione di un documento con gli stessi input di /process (`file` e/o `text`) e restituisce
+    subito l'id del job; lo stato si legge da /jobs/<id> e gli eventi da /jobs/<id>/events.
+    """
+    model_lifecycle.record_traffic()
+    file_bytes: Optional[bytes] = None
+    filename: Optional[str] = None
+    if 'file' in request.files:
+        file_storage_obj = request.files['file']
+        if file_storage_obj and file_storage_obj.filename:
+            filename = file_storage_obj.filename
+            try:
+                file_bytes = file_storage_obj.read()
+            except Exception as e:
+                logger.error(f"Error reading file {filename} from request: {e}", exc_info=True)
+                return jsonify({'error': f'Error reading file: {str(e)}', 'filename': filename}), 500
+
+    text = request.form.get('text', '')
+    if file_bytes is None and not text.strip():
+        return jsonify({'error': 'Nessun testo fornito'}), 400
+
+    try:
+        job_id = job_queue.submit(file_bytes, filename, text)
+    except JobQueueFullError as e:
+        logger.warning(f"Job rejected: {e}")
+        return jsonify({'error': 'Server busy, retry later'}), 503
+    return jsonify({'id': job_id, 'status': 'queued', 'status_url': url_for('get_job', job_id=job_id),
+                    'events_url': url_for('get_job_events', job_id=job_id)}), 202
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id: str):
+    """
+    Stato del job, con il numero di eventi e l'ultimo evento (per un job completato, il risultato).
+
+    Query parameters:
+        after: include in `new_events` gli eventi successivi ai primi `after`
+    """
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if 'after' in request.args:
+        try:
+            after = int(request.args['after'])
+        except ValueError:
+            return jsonify({'error': 'Invalid after'}), 400
+        job['new_events'] = [json.loads(event) for _, event in job_queue.get_events(job_id, after)]
+    return jsonify(job)
+
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def get_job_events(job_id: str):
+    """
+    Eventi del job in NDJSON, identici a quelli dello stream di /process. Con `follow=true` (default) lo stream
+    resta aperto finché il job termina, per al massimo JOBS_EVENTS_MAX_SECONDS.
+
+    Query parameters:
+        after: salta i primi `after` eventi, per riprendere uno stream interrotto
+        follow: false per restituire solo gli eventi già disponibili
+    """
+    try:
+        after = int(request.args.get('after', '0'))
+    except ValueError:
+        return jsonify({'error': 'Invalid after'}), 400
+    follow = request.args.get('follow', 'true').lower() == 'true'
+    if job_queue.get(job_id) is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return app.response_class(generate_job_events(job_id, after, follow), mimetype='application/x-ndjson')
+
+
+def generate_job_events(job_id: str, after: int, follow: bool):
+    deadline = time.monotonic() + JOBS_EVENTS_MAX_SECONDS
+    while True:
+        # Lo stato va letto prima degli eventi, per non perdere quelli scritti subito prima della fine del job
+        job = job_queue.get(job_id)
+        events = job_queue.get_events(job_id, after)
+        for seq, event in events:
+            after = seq
+            yield event + '\n'
+        if events:
+            continue
+        if not follow or job is None or job['status'] in JOB_FINISHED_STATUSES or time.monotonic() > deadline:
+            return
+        time.sleep(JOBS_POLL_SECONDS)
+
+
+def start_job_queue():
+    """
+    Avvia i thread che eseguono i job. Non all'import del modulo, che con il reloader di Flask avviene anche nel
+    processo che sorveglia i file: gunicorn la chiama in ogni worker (post_worker_init in gunicorn.conf.py),
+    `python app.py` solo nel processo che serve le richieste.
+    """
+    job_queue.start(pipeline=generate_process_stream)
+
+
 if __name__ == '__main__':
     prod_env = os.environ.get("PRODUCTION_ENVIROMENT", "False")  # Set to True in production
-    if prod_env.lower() == "true":
+    debug = prod_env.lower() != "true"
+    # Con debug il reloader esegue l'app in un processo figlio, riconoscibile da WERKZEUG_RUN_MAIN
+    if not debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_job_queue()
+    if not debug:
         logger.info("Starting Flask app in PRODUCTION mode")
         app.run(host='0.0.0.0', port=5000, debug=False)
     else:
@@ -0,0 +1,31 @@
+import os
+
+# Configurazione di gunicorn: `gunicorn --config gunicorn.conf.py app:app`
+#
+# Con i worker `gevent` ogni connessione è una greenlet: mentre una richiesta attende Ollama o l'API di YouTube
+# (socket resi cooperativi dal monkey patching di gevent) il worker serve le altre, invece di restare occupato
+# per tutta la durata dello stream come un worker `sync`. Le fasi CPU-bound (estrazione del testo, OCR,
+# keywords) girano nel pool di processi della pipeline (PIPELINE_WORKERS) e non bloccano il ciclo di gevent.
+# GUNICORN_WORKER_CLASS=sync ripristina la modalità precedente, una richiesta alla volta per worker.
+
+GUNICORN_WORKER_CLASS = os.environ.get("GUNICORN_WORKER_CLASS", "gevent")  # gevent oppure sync
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:5000")
+workers = int(os.environ.get("GUNICORN_WORKERS", "2"))
+worker_class = GUNICORN_WORKER_CLASS
+worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", "200"))  # Connessioni contemporanee per worker gevent
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "120"))  # Con i worker sync è anche la durata massima di una richiesta
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+
+if worker_class == "gevent":
+    # Le ricerche su YouTube di tutte le richieste di un worker condividono un pool: con molte connessioni
+    # contemporanee serve più ampio (i thread del pool sono greenlet e costano poco)
+    os.environ.setdefault("YOUTUBE_SEARCH_MAX_WORKERS", "64")
+    # Allo stesso modo arrivano al pool della pipeline molti più task insieme: meglio attendere che rifiutarli
+    os.environ.setdefault("PIPELINE_MAX_QUEUE_SIZE", "64")
+
+
+def post_worker_init(worker):
+    # I thread dei job (/jobs) partono in ogni worker dopo il caricamento dell'app, non all'import del modulo
+    from app import start_job_queue
+    start_job_queue()
@@ -1,26 +1,99 @@
+import atexit
 import logging
+import os
+import queue
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 
-logging.basicConfig(level=logging.INFO,
-                    format='%(asctime)s %(levelname)s %(name)s %(module)s %(funcName)s : %(message)s',
-                    handlers=[logging.FileHandler("app.log", encoding='utf-8'),
-                              logging.StreamHandler()])
+try:
+    import fcntl
+except ImportError:  # Windows: nessun lock tra processi
+    fcntl = None
 
-logger = logging.getLogger(__name__)
+LOG_FILE_PATH = os.environ.get("LOG_FILE_PATH", "app.log")
+LOG_MAX_BYTES = int(os.environ.get("LOG_MAX_BYTES", str(5 * 1024 * 1024)))  # Dimensione massima di un file di log
+LOG_BACKUP_COUNT = int(os.environ.get("LOG_BACKUP_COUNT", "5"))  # Numero di file ruotati conservati (app.log.1, ...)
+LOG_FORMAT = '%(asctime)s %(levelname)s %(name)s %(module)s %(funcName)s : %(message)s'
+
+
+class MultiProcessRotatingFileHandler(RotatingFileHandler):
+    """
+    RotatingFileHandler utilizzabile da più processi (i worker di gunicorn) sullo stesso file di log.
+
+    Ogni scrittura, e l'eventuale rotazione, avviene sotto un lock esclusivo su un file `.lock` accanto al log.
+    Prima di scrivere il file viene riaperto se un altro processo lo ha ruotato nel frattempo, così nessun
+    processo continua a scrivere su un file già rinominato.
+    """
+
+    def __init__(self, filename, max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8', delay=True)
+        self._lock_file = None
+        self.reopen_lock_file()
+
+    def reopen_lock_file(self):
+        """Apre il file di lock; va richiamato dopo un fork, perché il lock è condiviso con il processo padre"""
+        if fcntl is None:
+            return
+        if self._lock_file is not None:
+            self._lock_file.close()
+        self._lock_file = open(self.baseFilename + '.lock', 'a')
+
+    def _reopen_if_rotated(self):
+        if self.stream is None:
+            return
+        try:
+            rotated = os.stat(self.baseFilename).st_ino != os.fstat(self.stream.fileno()).st_ino
+        except FileNotFoundError:
+            rotated = True
+        if rotated:
+            self.stream.close()
+            self.stream = None
+
+    def emit(self, record):
+        if self._lock_file is None:
+            super().emit(record)
+            return
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        try:
+            self._reopen_if_rotated()
+            super().emit(record)
+        finally:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
 
 
-def trim_log_file(max_lines=5000):
+# Il thread della richiesta si limita ad accodare il record; un thread in background lo scrive su file e console
+_formatter = logging.Formatter(LOG_FORMAT)
+_file_handler = MultiProcessRotatingFileHandler(LOG_FILE_PATH)
+_file_handler.setFormatter(_formatter)
+_stream_handler = logging.StreamHandler()
+_stream_handler.setFormatter(_formatter)
+
+_queue_handler = QueueHandler(queue.Queue(-1))
+_queue_handler.setFormatter(logging.Formatter('%(message)s'))  # Il formato completo è applicato dal listener
+_log_listener = QueueListener(_queue_handler.queue, _file_handler, _stream_handler, respect_handler_level=True)
+_log_listener.start()
+
+
+def _stop_log_listener():
+    """Scrive i record ancora in coda prima dell'uscita del processo"""
+    _log_listener.stop()
+
+
+def _restart_log_listener_after_fork():
     """
-    Trims the log file to keep only the last `max_lines` lines.
+    Nei processi figli (pool di processi) il thread di scrittura non esiste più e la coda potrebbe essere
+    rimasta bloccata: si crea una nuova coda con un nuovo thread e si riapre il file di lock.
     """
-    try:
-        with open("app.log", "r+", encoding='utf-8') as f:
-            lines = f.readlines()
-            if len(lines) > max_lines:
-                f.seek(0)
-                f.writelines(lines[-max_lines:])
-                f.truncate()
-                logger.info(f"Log file trimmed to last {max_lines} lines.")
-            else:
-                logger.info("Log file does not need trimming.")
-    except Exception as e:
-        logger.error(f"Error trimming log file: {e}")
\ No newline at end of file
+    global _log_listener
+    _file_handler.reopen_lock_file()
+    _queue_handler.queue = queue.Queue(-1)
+    _log_listener = QueueListener(_queue_handler.queue, _file_handler, _stream_handler, respect_handler_level=True)
+    _log_listener.start()
+
+
+atexit.register(_stop_log_listener)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_log_listener_after_fork)
+
+logging.basicConfig(level=logging.INFO, handlers=[_queue_handler])
+
+logger = logging.getLogger(__name__)
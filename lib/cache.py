@@ -0,0 +1,411 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Callable, Iterable, Optional
+from lib.app_logger import logger
+
+CACHE_DB_PATH = os.environ.get("CACHE_DB_PATH", "cache.sqlite3")  # Database SQLite condiviso tra i worker
+CACHE_DB_TIMEOUT_SECONDS = 5
+CACHE_PURGE_EVERY_WRITES = 200  # Ogni quante scritture eliminare le voci scadute dal database
+
+_cache_registry: dict[str, Any] = {}
+_cache_registry_lock = threading.Lock()
+
+
+def register_cache(cache):
+    """Registra una cache (qualsiasi oggetto con `name` e `stats()`) per esporne le statistiche"""
+    with _cache_registry_lock:
+        _cache_registry[cache.name] = cache
+
+
+def get_cache_stats() -> dict[str, dict]:
+    """Restituisce le statistiche (hit, miss, dimensione...) di tutte le cache registrate"""
+    with _cache_registry_lock:
+        caches = list(_cache_registry.values())
+    return {cache.name: cache.stats() for cache in caches}
+
+
+class SQLiteCacheBackend:
+    """
+    Backend di cache condiviso tra i processi, salvato in un database SQLite.
+
+    Tutte le cache usano la stessa tabella, separate per namespace. Ogni thread apre una propria
+    connessione; gli errori del database vengono registrati nel log e trattati come cache miss.
+    Se `max_entries` è impostato, dopo ogni scrittura vengono eliminate le voci più vecchie in eccesso.
+    """
+
+    def __init__(self, namespace: str, db_path: str = CACHE_DB_PATH, max_entries: Optional[int] = None):
+        self.namespace = namespace
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._initialize_schema()
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        # Dopo un fork la connessione ereditata non va riutilizzata
+        if connection is None or getattr(self._local, 'pid', None) != os.getpid():
+            connection = sqlite3.connect(self.db_path, timeout=CACHE_DB_TIMEOUT_SECONDS, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def _initialize_schema(self):
+        try:
+            self._connection().execute(
+                'CREATE TABLE IF NOT EXISTS cache_entries ('
+                'namespace TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL, '
+                'expires_at REAL NOT NULL, created_at REAL NOT NULL, '
+                'PRIMARY KEY (namespace, key))')
+            self._connection().execute(
+                'CREATE INDEX IF NOT EXISTS cache_entries_created_at ON cache_entries (namespace, created_at)')
+        except sqlite3.Error as e:
+            logger.error(f"Error initializing cache database {self.db_path}: {e}")
+
+    def get_many(self, keys: list[str]) -> dict[str, tuple[bytes, float]]:
+        """Restituisce (value, expires_at) delle voci valide tra quelle richieste"""
+        if not keys:
+            return {}
+        try:
+            placeholders = ','.join('?' * len(keys))
+            rows = self._connection().execute(
+                f'SELECT key, value, expires_at FROM cache_entries '
+                f'WHERE namespace = ? AND expires_at > ? AND key IN ({placeholders})',
+                [self.namespace, time.time(), *keys]).fetchall()
+            return {key: (value, expires_at) for key, value, expires_at in rows}
+        except sqlite3.Error as e:
+            logger.error(f"Error reading cache '{self.namespace}' from {self.db_path}: {e}")
+            return {}
+
+    def set_many(self, items: dict[str, bytes], ttl_seconds: float):
+        if not items:
+            return
+        now = time.time()
+        try:
+            connection = self._connection()
+            connection.executemany(
+                'INSERT OR REPLACE INTO cache_entries (namespace, key, value, expires_at, created_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                [(self.namespace, key, value, now + ttl_seconds, now) for key, value in items.items()])
+            self._writes += 1
+            if self._writes % CACHE_PURGE_EVERY_WRITES == 0:
+                connection.execute('DELETE FROM cache_entries WHERE namespace = ? AND expires_at <= ?',
+                                   (self.namespace, now))
+            if self.max_entries is not None:
+                connection.execute(
+                    'DELETE FROM cache_entries WHERE namespace = ? AND key IN ('
+                    'SELECT key FROM cache_entries WHERE namespace = ? ORDER BY created_at DESC LIMIT -1 OFFSET ?)',
+                    (self.namespace, self.namespace, self.max_entries))
+        except sqlite3.Error as e:
+            logger.error(f"Error writing cache '{self.namespace}' to {self.db_path}: {e}")
+
+    def get_created_since(self, since: float, limit: int) -> list[tuple[str, bytes, float, float]]:
+        """Restituisce (key, value, created_at, expires_at) delle voci valide create dopo `since`, le più recenti prima"""
+        try:
+            return self._connection().execute(
+                'SELECT key, value, created_at, expires_at FROM cache_entries '
+                'WHERE namespace = ? AND created_at > ? AND expires_at > ? ORDER BY created_at DESC LIMIT ?',
+                (self.namespace, since, time.time(), limit)).fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"Error reading new entries of cache '{self.namespace}' from {self.db_path}: {e}")
+            return []
+
+    def count(self) -> int:
+        try:
+            row = self._connection().execute(
+                'SELECT COUNT(*) FROM cache_entries WHERE namespace = ? AND expires_at > ?',
+                (self.namespace, time.time())).fetchone()
+            return row[0]
+        except sqlite3.Error as e:
+            logger.error(f"Error counting entries of cache '{self.namespace}' in {self.db_path}: {e}")
+            return 0
+
+
+class TTLCache:
+    """
+    Cache LRU in memoria con scadenza delle voci (TTL), thread-safe.
+
+    Se è configurato un backend condiviso, i miss locali vengono cercati anche nel backend e ogni scrittura
+    viene propagata, così che i worker di gunicorn condividano i valori. Poiché il backend salva JSON,
+    `serialize` e `deserialize` convertono i valori da e verso tipi serializzabili; con `compress` il JSON
+    viene anche compresso con zlib.
+    """
+
+    def __init__(self, name: str, max_size=1024, ttl_seconds: float = 3600, backend: Optional[SQLiteCacheBackend] = None,
+                 serialize: Callable[[Any], Any] = None, deserialize: Callable[[Any], Any] = None, compress=False):
+        self.name = name
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.backend = backend
+        self.compress = compress
+        self._serialize = serialize or (lambda value: value)
+        self._deserialize = deserialize or (lambda value: value)
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    def _get_local(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _encode(self, value) -> bytes:
+        encoded_value = json.dumps(self._serialize(value), ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        return zlib.compress(encoded_value) if self.compress else encoded_value
+
+    def _decode(self, raw_value: bytes):
+        if self.compress:
+            raw_value = zlib.decompress(raw_value)
+        return self._deserialize(json.loads(raw_value))
+
+    def _set_local(self, key: str, value, ttl_seconds: float):
+        self._entries[key] = (time.monotonic() + ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def get_many(self, keys: Iterable[str]) -> dict[str, Any]:
+        """Restituisce i valori presenti in cache per le chiavi richieste; le chiavi mancanti sono omesse"""
+        found = {}
+        local_misses = []
+        with self._lock:
+            for key in keys:
+                entry = self._get_local(key)
+                if entry is None:
+                    local_misses.append(key)
+                else:
+                    found[key] = entry[1]
+            self.hits += len(found)
+
+        shared_found = {}
+        shared_ttl_seconds = {}
+        if self.backend is not None and local_misses:
+            now = time.time()
+            for key, (raw_value, expires_at) in self.backend.get_many(local_misses).items():
+                try:
+                    shared_found[key] = self._decode(raw_value)
+                except (ValueError, TypeError, zlib.error) as e:
+                    logger.error(f"Could not decode entry '{key}' of cache '{self.name}': {e}")
+                    continue
+                # La copia locale scade insieme alla voce condivisa, che può avere un TTL diverso
+                shared_ttl_seconds[key] = min(self.ttl_seconds, expires_at - now)
+
+        with self._lock:
+            for key, value in shared_found.items():
+                self._set_local(key, value, shared_ttl_seconds[key])
+            self.hits += len(shared_found)
+            self.shared_hits += len(shared_found)
+            self.misses += len(local_misses) - len(shared_found)
+
+        found.update(shared_found)
+        return found
+
+    def get(self, key: str, default=None):
+        return self.get_many([key]).get(key, default)
+
+    def set_many(self, items: dict[str, Any], ttl_seconds: Optional[float] = None):
+        """Salva i valori in cache; `ttl_seconds` sostituisce il TTL della cache per queste voci"""
+        if ttl_seconds is None:
+            ttl_seconds = self.ttl_seconds
+        with self._lock:
+            for key, value in items.items():
+                self._set_local(key, value, ttl_seconds)
+
+        if self.backend is not None and items:
+            self.backend.set_many({key: self._encode(value) for key, value in items.items()}, ttl_seconds)
+
+    def set(self, key: str, value, ttl_seconds: Optional[float] = None):
+        self.set_many({key: value}, ttl_seconds)
+
+    def stats(self) -> dict:
+        with self._lock:
+            requests_count = self.hits + self.misses
+            stats = {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'shared_hits': self.shared_hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / requests_count, 4) if requests_count else 0.0,
+            }
+        if self.backend is not None:
+            stats['shared_backend'] = self.backend.db_path
+            stats['shared_size'] = self.backend.count()
+            stats['shared_max_size'] = self.backend.max_entries
+        else:
+            stats['shared_backend'] = None
+        return stats
+
+
+class SetSimilarityCache:
+    """
+    Cache i cui valori sono associati ad un insieme di elementi (es. le keywords di un documento) all'interno
+    di uno scope (es. lingua e modello): `get` restituisce il valore dell'insieme più simile a quello cercato,
+    se la somiglianza di Jaccard è almeno `min_similarity`. L'ordine degli elementi non conta.
+
+    Un indice inverso (scope, elemento) -> voci limita il confronto alle voci con almeno un elemento in comune.
+    Se è configurato un backend condiviso, le voci scritte dagli altri worker vengono caricate nell'indice
+    locale ad ogni ricerca, leggendo solo quelle create dopo l'ultima sincronizzazione.
+    """
+
+    def __init__(self, name: str, max_size=1024, ttl_seconds: float = 3600, min_similarity=0.7,
+                 backend: Optional[SQLiteCacheBackend] = None):
+        self.name = name
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.min_similarity = min_similarity
+        self.backend = backend
+        self._entries: OrderedDict[str, tuple[float, str, frozenset, Any]] = OrderedDict()
+        self._index: dict[tuple[str, str], set[str]] = {}
+        self._lock = threading.Lock()
+        self._last_sync = 0.0
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _make_key(items: frozenset, scope: str) -> str:
+        return hashlib.sha256(json.dumps([scope, sorted(items)], ensure_ascii=False).encode('utf-8')).hexdigest()
+
+    def _remove_local(self, key: str):
+        _, scope, items, _ = self._entries.pop(key)
+        for item in items:
+            keys = self._index.get((scope, item))
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._index[(scope, item)]
+
+    def _set_local(self, key: str, items: frozenset, scope: str, value, expires_at: float):
+        if key in self._entries:
+            self._remove_local(key)
+        self._entries[key] = (expires_at, scope, items, value)
+        for item in items:
+            self._index.setdefault((scope, item), set()).add(key)
+        while len(self._entries) > self.max_size:
+            self._remove_local(next(iter(self._entries)))
+
+    def _sync_from_backend(self):
+        now = time.time()
+        rows = self.backend.get_created_since(self._last_sync, self.max_size)
+        new_entries = []
+        for key, raw_value, created_at, expires_at in rows:
+            try:
+                entry = json.loads(raw_value)
+                new_entries.append((key, frozenset(entry['items']), entry['scope'], entry['value'],
+                                    time.monotonic() + expires_at - now, created_at))
+            except (ValueError, KeyError, TypeError) as e:
+                logger.error(f"Could not decode entry '{key}' of cache '{self.name}': {e}")
+        with self._lock:
+            # Dalla più vecchia alla più recente, così l'ordine LRU rispecchia quello di creazione
+            for key, items, scope, value, expires_at, created_at in reversed(new_entries):
+                self._set_local(key, items, scope, value, expires_at)
+                self._last_sync = max(self._last_sync, created_at)
+
+    def get(self, items: Iterable[str], scope: str) -> tuple[Any, float]:
+        """Restituisce (valore, somiglianza) dell'insieme più simile, oppure (None, 0.0) se nessuno è abbastanza simile"""
+        items = frozenset(items)
+        if self.backend is not None:
+            self._sync_from_backend()
+
+        with self._lock:
+            now = time.monotonic()
+            shared_counts: dict[str, int] = {}
+            for item in items:
+                for key in self._index.get((scope, item), ()):
+                    shared_counts[key] = shared_counts.get(key, 0) + 1
+
+            best_key, best_similarity = None, 0.0
+            for key, shared_count in shared_counts.items():
+                expires_at, _, entry_items, _ = self._entries[key]
+                if expires_at <= now:
+                    continue
+                similarity = shared_count / (len(items) + len(entry_items) - shared_count)
+                if similarity > best_similarity:
+                    best_key, best_similarity = key, similarity
+
+            if best_key is None or best_similarity < self.min_similarity:
+                self.misses += 1
+                return None, 0.0
+            self._entries.move_to_end(best_key)
+            if best_similarity == 1.0:
+                self.exact_hits += 1
+            else:
+                self.similar_hits += 1
+            return self._entries[best_key][3], best_similarity
+
+    def set(self, items: Iterable[str], scope: str, value):
+        items = frozenset(items)
+        key = self._make_key(items, scope)
+        with self._lock:
+            self._set_local(key, items, scope, value, time.monotonic() + self.ttl_seconds)
+        if self.backend is not None:
+            encoded_value = json.dumps({'items': sorted(items), 'scope': scope, 'value': value},
+                                       ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+            self.backend.set_many({key: encoded_value}, self.ttl_seconds)
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self.exact_hits + self.similar_hits
+            requests_count = hits + self.misses
+            stats = {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl_seconds': self.ttl_seconds,
+                'min_similarity': self.min_similarity,
+                'hits': hits,
+                'exact_hits': self.exact_hits,
+                'similar_hits': self.similar_hits,
+                'misses': self.misses,
+                'hit_rate': round(hits / requests_count, 4) if requests_count else 0.0,
+            }
+        if self.backend is not None:
+            stats['shared_backend'] = self.backend.db_path
+            stats['shared_size'] = self.backend.count()
+            stats['shared_max_size'] = self.backend.max_entries
+        else:
+            stats['shared_backend'] = None
+        return stats
+
+
+def create_cache(name: str, max_size=1024, ttl_seconds: float = 3600, shared=False, shared_max_size: Optional[int] = None,
+                 serialize: Callable[[Any], Any] = None, deserialize: Callable[[Any], Any] = None,
+                 compress=False) -> TTLCache:
+    """
+    Crea e registra una cache, con backend SQLite condiviso e persistente se `shared` è True.
+    `shared_max_size` limita il numero di voci conservate nel backend.
+    """
+    backend = SQLiteCacheBackend(namespace=name, max_entries=shared_max_size) if shared else None
+    cache = TTLCache(name, max_size=max_size, ttl_seconds=ttl_seconds, backend=backend,
+                     serialize=serialize, deserialize=deserialize, compress=compress)
+    register_cache(cache)
+    return cache
+
+
+def create_similarity_cache(name: str, max_size=1024, ttl_seconds: float = 3600, min_similarity=0.7, shared=False,
+                            shared_max_size: Optional[int] = None) -> SetSimilarityCache:
+    """Crea e registra una SetSimilarityCache, con backend SQLite condiviso se `shared` è True"""
+    backend = SQLiteCacheBackend(namespace=name, max_entries=shared_max_size) if shared else None
+    cache = SetSimilarityCache(name, max_size=max_size, ttl_seconds=ttl_seconds, min_similarity=min_similarity,
+                               backend=backend)
+    register_cache(cache)
+    return cache
@@ -0,0 +1,174 @@
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from datetime import datetime, timezone
+from typing import Callable, Optional
+import httpx
+import ollama
+import pytesseract
+from lib.app_logger import logger
+from lib.ollama_lifecycle import model_lifecycle
+from lib.query_generation import ollama_model_name, OLLAMA_API_URL
+from lib.startup import get_startup_report, probe_nltk_resources
+from lib.youtube_interactions import check_youtube_api_key
+
+HEALTH_CHECK_INTERVAL_SECONDS = float(os.environ.get("HEALTH_CHECK_INTERVAL_SECONDS", "30"))  # Controlli di Ollama, NLTK e tesseract
+# La verifica della API key di YouTube consuma quota, quindi viene eseguita più di rado
+YOUTUBE_HEALTH_CHECK_INTERVAL_SECONDS = float(os.environ.get("YOUTUBE_HEALTH_CHECK_INTERVAL_SECONDS", "900"))
+HEALTH_CHECK_TIMEOUT_SECONDS = float(os.environ.get("HEALTH_CHECK_TIMEOUT_SECONDS", "5"))  # Durata massima di ogni controllo
+
+# Client dedicato ai controlli, con timeout brevi: quello delle generazioni attende fino a OLLAMA_REQUEST_TIMEOUT_SECONDS
+health_ollama_client = ollama.Client(host=OLLAMA_API_URL, timeout=httpx.Timeout(HEALTH_CHECK_TIMEOUT_SECONDS))
+
+
+class HealthMonitor:
+    """
+    Esegue periodicamente i controlli di salute in un thread in background e ne conserva l'ultimo risultato,
+    così /health risponde dalla memoria senza contattare i servizi esterni.
+
+    Ogni controllo è una funzione che restituisce (healthy, details) oppure solleva un'eccezione, e ha un
+    proprio intervallo e un proprio timeout. I controlli vengono eseguiti in parallelo in un pool di thread;
+    uno che non risponde entro il timeout viene segnalato come fallito, e finché non termina non ne viene
+    avviato un altro. Un risultato più vecchio di tre intervalli viene segnalato come `stale`.
+    Nel log vengono registrati solo i cambi di stato di ogni controllo.
+    """
+
+    def __init__(self, tick_seconds: float = 1.0):
+        self.tick_seconds = tick_seconds
+        self._checks: dict[str, tuple[Callable[[], tuple[bool, dict]], float, float]] = {}
+        self._results: dict[str, dict] = {}
+        self._next_run: dict[str, float] = {}
+        self._in_progress: dict[str, Future] = {}
+        self._executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="health-check")
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def register(self, name: str, check: Callable[[], tuple[bool, dict]], interval_seconds: float,
+                 timeout_seconds: float = HEALTH_CHECK_TIMEOUT_SECONDS):
+        with self._lock:
+            self._checks[name] = (check, interval_seconds, timeout_seconds)
+            self._next_run[name] = 0.0
+
+    def _start_check(self, name: str) -> Future:
+        """Avvia un controllo nel pool, o restituisce quello ancora in corso"""
+        with self._lock:
+            future = self._in_progress.get(name)
+            if future is None or future.done():
+                future = self._executor.submit(self._checks[name][0])
+                self._in_progress[name] = future
+            return future
+
+    def _log_state_change(self, name: str, previous: Optional[dict], result: dict):
+        if previous is not None and previous['healthy'] == result['healthy']:
+            return
+        if result['healthy']:
+            logger.info(f"Health check '{name}' is healthy")
+        else:
+            logger.error(f"Health check '{name}' failed: {result['error'] or result['details']}")
+
+    def _collect_result(self, name: str, future: Future, start: float) -> dict:
+        """Attende il controllo avviato in `start` al massimo per il suo timeout e ne aggiorna il risultato"""
+        timeout_seconds = self._checks[name][2]
+        try:
+            healthy, details = future.result(timeout=max(0.0, timeout_seconds - (time.perf_counter() - start)))
+            error = None
+        except FutureTimeoutError:
+            healthy, details, error = False, {}, f"Health check timed out after {timeout_seconds:g}s"
+        except Exception as e:
+            healthy, details, error = False, {}, str(e)
+        result = {
+            'healthy': healthy,
+            'latency_ms': round((time.perf_counter() - start) * 1000, 2),
+            'checked_at': datetime.now(timezone.utc).isoformat(),
+            'error': error,
+            'details': details,
+            '_checked_monotonic': time.monotonic(),
+        }
+        with self._lock:
+            previous = self._results.get(name)
+            self._results[name] = result
+        self._log_state_change(name, previous, result)
+        return result
+
+    def run_check(self, name: str) -> dict:
+        """Esegue subito un controllo, attendendolo al massimo per il suo timeout, e ne aggiorna il risultato"""
+        start = time.perf_counter()
+        return self._collect_result(name, self._start_check(name), start)
+
+    def run_checks(self, names: list[str]):
+        """Esegue subito i controlli indicati in parallelo e ne attende i risultati"""
+        start = time.perf_counter()
+        futures = {name: self._start_check(name) for name in names}
+        for name, future in futures.items():
+            self._collect_result(name, future, start)
+
+    def run_all(self) -> dict:
+        """Esegue subito tutti i controlli (per /health/deep)"""
+        self.run_checks(list(self._checks))
+        return self.get_results()
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            now = time.monotonic()
+            with self._lock:
+                due_checks = [name for name, next_run in self._next_run.items() if next_run <= now]
+                for name in due_checks:
+                    self._next_run[name] = now + self._checks[name][1]
+            self.run_checks(due_checks)
+            self._stop_event.wait(self.tick_seconds)
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="health-monitor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def get_results(self) -> dict[str, dict]:
+        """Ultimo risultato di ogni controllo, senza eseguire nulla"""
+        now = time.monotonic()
+        with self._lock:
+            results = {}
+            for name, (_, interval_seconds, _) in self._checks.items():
+                result = self._results.get(name)
+                if result is None:
+                    results[name] = {'healthy': None, 'status': 'pending'}
+                    continue
+                result = {key: value for key, value in result.items() if not key.startswith('_')}
+                result['stale'] = now - self._results[name]['_checked_monotonic'] > 3 * interval_seconds
+                results[name] = result
+            return results
+
+
+def check_ollama() -> tuple[bool, dict]:
+    health_ollama_client.show(ollama_model_name)
+    return True, {'model': model_lifecycle.report(client=health_ollama_client)}
+
+
+def check_youtube() -> tuple[bool, dict]:
+    check_youtube_api_key()
+    return True, {}
+
+
+def check_nltk() -> tuple[bool, dict]:
+    """Cerca di nuovo le risorse NLTK: possono essere state rimosse o installate dopo l'avvio"""
+    nltk_resources = probe_nltk_resources()
+    return all(status != 'missing' for status in nltk_resources.values()), {
+        'resources': nltk_resources, 'startup_resources': get_startup_report()['nltk_resources']}
+
+
+def check_tesseract() -> tuple[bool, dict]:
+    languages = pytesseract.get_languages(config='')
+    return True, {'version': str(pytesseract.get_tesseract_version()), 'languages': languages}
+
+
+health_monitor = HealthMonitor()
+health_monitor.register('ollama', check_ollama, HEALTH_CHECK_INTERVAL_SECONDS)
+health_monitor.register('youtube', check_youtube, YOUTUBE_HEALTH_CHECK_INTERVAL_SECONDS)
+health_monitor.register('nltk', check_nltk, HEALTH_CHECK_INTERVAL_SECONDS)
+health_monitor.register('tesseract', check_tesseract, HEALTH_CHECK_INTERVAL_SECONDS)
@@ -0,0 +1,319 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Callable, Iterator, Optional
+from lib.app_logger import logger
+
+JOBS_DB_PATH = os.environ.get("JOBS_DB_PATH", "jobs.sqlite3")  # Coda persistente dei job, condivisa tra i worker
+JOBS_WORKERS = int(os.environ.get("JOBS_WORKERS", "2"))  # Job eseguiti contemporaneamente da ogni worker di gunicorn
+JOBS_MAX_QUEUED = int(os.environ.get("JOBS_MAX_QUEUED", "100"))  # Job in attesa oltre i quali i nuovi vengono rifiutati
+JOBS_MAX_ATTEMPTS = int(os.environ.get("JOBS_MAX_ATTEMPTS", "2"))  # Esecuzioni di un job interrotte prima di considerarlo fallito
+JOBS_POLL_SECONDS = float(os.environ.get("JOBS_POLL_SECONDS", "1"))  # Intervallo di controllo di nuovi job ed eventi
+JOBS_HEARTBEAT_SECONDS = float(os.environ.get("JOBS_HEARTBEAT_SECONDS", "15"))
+# Un job in esecuzione senza heartbeat da questo tempo appartiene ad un processo terminato e viene ripreso
+JOBS_STALE_AFTER_SECONDS = float(os.environ.get("JOBS_STALE_AFTER_SECONDS", "120"))
+JOBS_RETENTION_SECONDS = float(os.environ.get("JOBS_RETENTION_SECONDS", str(60 * 60 * 24)))  # Conservazione dei job terminati
+JOBS_EVENTS_MAX_SECONDS = float(os.environ.get("JOBS_EVENTS_MAX_SECONDS", "600"))  # Durata massima di /jobs/<id>/events
+JOBS_DB_TIMEOUT_SECONDS = 10
+
+JOB_STATUS_QUEUED = 'queued'
+JOB_STATUS_RUNNING = 'running'
+JOB_STATUS_COMPLETED = 'completed'
+JOB_STATUS_FAILED = 'failed'
+JOB_FINISHED_STATUSES = (JOB_STATUS_COMPLETED, JOB_STATUS_FAILED)
+
+# La pipeline riceve (byte del file, nome del file, testo) e restituisce gli eventi StreamResponse in JSON
+JobPipeline = Callable[[Optional[bytes], Optional[str], str], Iterator[str]]
+
+
+class JobQueueFullError(Exception):
+    """Ci sono già JOBS_MAX_QUEUED job in attesa"""
+
+
+class JobQueue:
+    """
+    Coda persistente di job di elaborazione dei documenti, salvata in SQLite.
+
+    Ogni worker di gunicorn esegue `max_workers` thread che prelevano i job in ordine di arrivo: il prelievo
+    avviene in una transazione, quindi ogni job viene eseguito da un solo processo. Gli eventi della pipeline
+    (le stesse righe JSON dello stream di /process) vengono salvati man mano, numerati da 1, così possono essere
+    letti mentre il job è in corso.
+
+    I processi aggiornano periodicamente l'heartbeat dei propri job; un job in esecuzione senza heartbeat da
+    `stale_after_seconds` (il processo è terminato) viene rimesso in coda, oppure segnato come fallito dopo
+    `max_attempts` esecuzioni. Gli eventi dell'esecuzione interrotta vengono eliminati, quindi quelli della nuova
+    esecuzione sono di nuovo numerati da 1 e non si sommano ai precedenti.
+    """
+
+    def __init__(self, db_path: str = JOBS_DB_PATH, max_workers: int = JOBS_WORKERS,
+                 max_queued: int = JOBS_MAX_QUEUED, max_attempts: int = JOBS_MAX_ATTEMPTS,
+                 stale_after_seconds: float = JOBS_STALE_AFTER_SECONDS):
+        self.db_path = db_path
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.max_attempts = max_attempts
+        self.stale_after_seconds = stale_after_seconds
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop_event = threading.Event()
+        self._threads: list[threading.Thread] = []
+        self._pipeline: Optional[JobPipeline] = None
+        self._running_jobs: set[str] = set()
+        self.completed = 0
+        self.failed = 0
+        self.recovered = 0
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._initialize_schema()
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        # Dopo un fork la connessione ereditata non va riutilizzata
+        if connection is None or getattr(self._local, 'pid', None) != os.getpid():
+            connection = sqlite3.connect(self.db_path, timeout=JOBS_DB_TIMEOUT_SECONDS, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def _initialize_schema(self):
+        try:
+            connection = self._connection()
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS jobs ('
+                'id TEXT PRIMARY KEY, status TEXT NOT NULL, filename TEXT, file BLOB, text TEXT NOT NULL, '
+                'created_at REAL NOT NULL, started_at REAL, finished_at REAL, heartbeat_at REAL, worker TEXT, '
+                'attempts INTEGER NOT NULL DEFAULT 0, error TEXT)')
+            connection.execute('CREATE INDEX IF NOT EXISTS jobs_status_created_at ON jobs (status, created_at)')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS job_events ('
+                'job_id TEXT NOT NULL, seq INTEGER NOT NULL, event TEXT NOT NULL, created_at REAL NOT NULL, '
+                'PRIMARY KEY (job_id, seq))')
+        except sqlite3.Error as e:
+            logger.error(f"Error initializing job database {self.db_path}: {e}")
+
+    def submit(self, file_bytes: Optional[bytes], filename: Optional[str], text: str) -> str:
+        """Accoda un job e ne restituisce l'id; solleva JobQueueFullError se la coda è piena"""
+        job_id = uuid.uuid4().hex
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            queued = connection.execute('SELECT COUNT(*) FROM jobs WHERE status = ?', (JOB_STATUS_QUEUED,)).fetchone()[0]
+            if queued >= self.max_queued:
+                raise JobQueueFullError(f"Job queue is full ({queued} jobs queued)")
+            connection.execute('INSERT INTO jobs (id, status, filename, file, text, created_at) VALUES (?, ?, ?, ?, ?, ?)',
+                               (job_id, JOB_STATUS_QUEUED, filename, file_bytes, text, time.time()))
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        self._wakeup.set()
+        logger.info(f"Job {job_id} queued ({filename or 'text only'})")
+        return job_id
+
+    def get(self, job_id: str) -> Optional[dict]:
+        """Stato del job, con il numero di eventi e l'ultimo evento; None se il job non esiste"""
+        connection = self._connection()
+        row = connection.execute(
+            'SELECT status, filename, created_at, started_at, finished_at, attempts, error FROM jobs WHERE id = ?',
+            (job_id,)).fetchone()
+        if row is None:
+            return None
+        status, filename, created_at, started_at, finished_at, attempts, error = row
+        last_event = connection.execute(
+            'SELECT seq, event FROM job_events WHERE job_id = ? ORDER BY seq DESC LIMIT 1', (job_id,)).fetchone()
+        queue_position = None
+        if status == JOB_STATUS_QUEUED:
+            queue_position = connection.execute('SELECT COUNT(*) FROM jobs WHERE status = ? AND created_at < ?',
+                                                (JOB_STATUS_QUEUED, created_at)).fetchone()[0] + 1
+        return {
+            'id': job_id,
+            'status': status,
+            'filename': filename,
+            'created_at': created_at,
+            'started_at': started_at,
+            'finished_at': finished_at,
+            'attempts': attempts,
+            'error': error,
+            'queue_position': queue_position,
+            'events': last_event[0] if last_event else 0,
+            'last_event': json.loads(last_event[1]) if last_event else None,
+        }
+
+    def get_events(self, job_id: str, after: int = 0, limit: int = 1000) -> list[tuple[int, str]]:
+        """Eventi (numero, riga JSON) successivi al numero `after`"""
+        return self._connection().execute(
+            'SELECT seq, event FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq LIMIT ?',
+            (job_id, after, limit)).fetchall()
+
+    def _append_event(self, job_id: str, seq: int, event: str):
+        self._connection().execute('INSERT INTO job_events (job_id, seq, event, created_at) VALUES (?, ?, ?, ?)',
+                                   (job_id, seq, event.strip(), time.time()))
+
+    def _claim(self) -> Optional[tuple]:
+        """Preleva il job in attesa più vecchio, segnandolo come in esecuzione da questo processo"""
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute('SELECT id, filename, file, text FROM jobs WHERE status = ? '
+                                     'ORDER BY created_at LIMIT 1', (JOB_STATUS_QUEUED,)).fetchone()
+            if row is not None:
+                now = time.time()
+                connection.execute('UPDATE jobs SET status = ?, started_at = ?, heartbeat_at = ?, worker = ?, '
+                                   'attempts = attempts + 1 WHERE id = ?',
+                                   (JOB_STATUS_RUNNING, now, now, self.worker_id, row[0]))
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return row
+
+    def _finish(self, job_id: str, status: str, error: Optional[str] = None):
+        # Il file non serve più: viene eliminato per non far crescere il database
+        self._connection().execute('UPDATE jobs SET status = ?, finished_at = ?, error = ?, file = NULL WHERE id = ?',
+                                   (status, time.time(), error, job_id))
+        with self._lock:
+            if status == JOB_STATUS_COMPLETED:
+                self.completed += 1
+            else:
+                self.failed += 1
+        logger.info(f"Job {job_id} {status}" + (f": {error}" if error else ""))
+
+    def _run_job(self, job_id: str, filename: Optional[str], file_bytes: Optional[bytes], text: str):
+        seq = self._connection().execute('SELECT COALESCE(MAX(seq), 0) FROM job_events WHERE job_id = ?',
+                                         (job_id,)).fetchone()[0]
+        status, error = JOB_STATUS_FAILED, 'Processing ended without a result'
+        try:
+            for event in self._pipeline(file_bytes, filename, text):
+                seq += 1
+                self._append_event(job_id, seq, event)
+                event_status = json.loads(event).get('status')
+                if event_status == 'processing_complete':
+                    status, error = JOB_STATUS_COMPLETED, None
+                elif event_status == 'error':
+                    status, error = JOB_STATUS_FAILED, json.loads(event).get('message')
+        except Exception as e:
+            logger.error(f"Error running job {job_id}: {e}", exc_info=True)
+            status, error = JOB_STATUS_FAILED, str(e)
+        self._finish(job_id, status, error)
+
+    def _worker(self):
+        while not self._stop_event.is_set():
+            try:
+                job = self._claim()
+            except sqlite3.Error as e:
+                logger.error(f"Error claiming a job from {self.db_path}: {e}")
+                job = None
+            if job is None:
+                self._wakeup.wait(JOBS_POLL_SECONDS)
+                self._wakeup.clear()
+                continue
+            job_id, filename, file_bytes, text = job
+            with self._lock:
+                self._running_jobs.add(job_id)
+            try:
+                self._run_job(job_id, filename, file_bytes, text)
+            except sqlite3.Error as e:
+                logger.error(f"Error saving job {job_id} to {self.db_path}: {e}")
+            finally:
+                with self._lock:
+                    self._running_jobs.discard(job_id)
+
+    def _heartbeat(self):
+        """Mantiene vivi i job di questo processo, riprende quelli dei processi terminati ed elimina i vecchi job"""
+        while not self._stop_event.wait(JOBS_HEARTBEAT_SECONDS):
+            now = time.time()
+            with self._lock:
+                running_jobs = list(self._running_jobs)
+            try:
+                connection = self._connection()
+                connection.executemany('UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND worker = ?',
+                                       [(now, job_id, self.worker_id) for job_id in running_jobs])
+                self._recover_stale_jobs(now)
+                connection.execute('DELETE FROM job_events WHERE job_id IN ('
+                                   'SELECT id FROM jobs WHERE status IN (?, ?) AND finished_at < ?)',
+                                   (*JOB_FINISHED_STATUSES, now - JOBS_RETENTION_SECONDS))
+                connection.execute('DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?',
+                                   (*JOB_FINISHED_STATUSES, now - JOBS_RETENTION_SECONDS))
+            except sqlite3.Error as e:
+                logger.error(f"Error updating jobs in {self.db_path}: {e}")
+
+    def _recover_stale_jobs(self, now: float):
+        connection = self._connection()
+        stale_before = now - self.stale_after_seconds
+        stale_jobs = connection.execute('SELECT id, attempts, worker FROM jobs WHERE status = ? AND heartbeat_at < ?',
+                                        (JOB_STATUS_RUNNING, stale_before)).fetchall()
+        for job_id, attempts, worker in stale_jobs:
+            if attempts < self.max_attempts:
+                connection.execute('BEGIN IMMEDIATE')
+                try:
+                    # La condizione sull'heartbeat evita di riprendere due volte lo stesso job da due processi
+                    cursor = connection.execute('UPDATE jobs SET status = ?, worker = NULL WHERE id = ? AND status = ? '
+                                                'AND heartbeat_at < ?', (JOB_STATUS_QUEUED, job_id,
+                                                                         JOB_STATUS_RUNNING, stale_before))
+                    if cursor.rowcount:
+                        # La nuova esecuzione riparte dall'inizio: gli eventi di quella interrotta non valgono più
+                        connection.execute('DELETE FROM job_events WHERE job_id = ?', (job_id,))
+                    connection.execute('COMMIT')
+                except BaseException:
+                    connection.execute('ROLLBACK')
+                    raise
+                action = 'requeued'
+            else:
+                cursor = connection.execute('UPDATE jobs SET status = ?, finished_at = ?, error = ?, file = NULL '
+                                            'WHERE id = ? AND status = ? AND heartbeat_at < ?',
+                                            (JOB_STATUS_FAILED, now, 'The worker running the job stopped',
+                                             job_id, JOB_STATUS_RUNNING, stale_before))
+                action = 'failed'
+            if cursor.rowcount:
+                with self._lock:
+                    self.recovered += 1
+                logger.warning(f"Job {job_id} of stopped worker {worker} {action} (attempt {attempts})")
+        if stale_jobs:
+            self._wakeup.set()
+
+    def start(self, pipeline: JobPipeline):
+        """Avvia i thread che eseguono i job con `pipeline` e il thread di heartbeat"""
+        with self._lock:
+            if self._threads:
+                return
+            self._pipeline = pipeline
+            self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+            self._threads = [threading.Thread(target=self._worker, name=f"job-worker-{index}", daemon=True)
+                             for index in range(self.max_workers)]
+            self._threads.append(threading.Thread(target=self._heartbeat, name="job-heartbeat", daemon=True))
+        for thread in self._threads:
+            thread.start()
+        logger.info(f"Job queue started with {self.max_workers} workers ({self.worker_id})")
+
+    def stop(self):
+        self._stop_event.set()
+        self._wakeup.set()
+
+    def stats(self) -> dict:
+        try:
+            counts = dict(self._connection().execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall())
+        except sqlite3.Error as e:
+            logger.error(f"Error reading job counts from {self.db_path}: {e}")
+            counts = {}
+        with self._lock:
+            return {
+                'workers': self.max_workers,
+                'max_queued': self.max_queued,
+                'jobs': {status: counts.get(status, 0) for status in (JOB_STATUS_QUEUED, JOB_STATUS_RUNNING,
+                                                                      *JOB_FINISHED_STATUSES)},
+                'running_in_worker': len(self._running_jobs),
+                'completed_in_worker': self.completed,
+                'failed_in_worker': self.failed,
+                'recovered_in_worker': self.recovered,
+            }
+
+
+job_queue = JobQueue()
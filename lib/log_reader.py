@@ -0,0 +1,293 @@
+import logging
+import os
+import re
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Iterator, List, Optional
+from lib.app_logger import LOG_FILE_PATH, LOG_BACKUP_COUNT
+
+LOGS_DEFAULT_TAIL = int(os.environ.get("LOGS_DEFAULT_TAIL", "1000"))  # Righe restituite da /logs senza `tail`
+LOGS_MAX_LINES = int(os.environ.get("LOGS_MAX_LINES", "10000"))  # Massimo di righe restituite da una richiesta
+LOG_READ_BLOCK_SIZE = 64 * 1024
+
+# Le righe di un record iniziano con `asctime levelname`; le righe seguenti (es. traceback) ne fanno parte
+LOG_RECORD_HEADER_PATTERN = re.compile(r'^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2},\d{3}) ([A-Z]+) ')
+LOG_TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S,%f'
+
+
+@dataclass
+class LogRecord:
+    """Record del log, eventualmente su più righe, con la sua posizione nel file (inode e offset)"""
+    text: str
+    timestamp: Optional[str]
+    level: Optional[str]
+    inode: int
+    start: int
+    end: int
+
+    @property
+    def cursor(self) -> str:
+        """Cursore che punta subito dopo il record"""
+        return format_log_cursor(self.inode, self.end)
+
+    @property
+    def start_cursor(self) -> str:
+        """Cursore che punta all'inizio del record"""
+        return format_log_cursor(self.inode, self.start)
+
+
+@dataclass
+class LogPage:
+    records: List[LogRecord] = field(default_factory=list)
+    next_cursor: Optional[str] = None  # Posizione da cui leggere i record successivi
+    prev_cursor: Optional[str] = None  # Posizione da cui leggere i record precedenti, None se non ce ne sono
+
+
+def format_log_cursor(inode: int, offset: int) -> str:
+    return f"{inode}:{offset}"
+
+
+def parse_log_cursor(cursor: str) -> tuple[int, int]:
+    """
+    Il cursore identifica il file tramite l'inode e non il nome, così resta valido anche dopo che il file è
+    stato ruotato (app.log -> app.log.1). Solleva ValueError se il cursore non è valido.
+    """
+    inode, offset = cursor.split(':')
+    inode, offset = int(inode), int(offset)
+    if offset < 0:
+        raise ValueError(f"Invalid log cursor: {cursor}")
+    return inode, offset
+
+
+def parse_log_level(level: str) -> int:
+    """Converte il nome di un livello (es. WARNING) nel suo valore numerico; solleva ValueError se sconosciuto"""
+    level_value = logging.getLevelName(level.strip().upper())
+    if not isinstance(level_value, int):
+        raise ValueError(f"Unknown log level: {level}")
+    return level_value
+
+
+def parse_log_since(since: str) -> str:
+    """
+    Converte `since` (timestamp ISO 8601 oppure secondi epoch) nel formato di asctime, in ora locale come nel log.
+    I timestamp del log in questo formato si possono confrontare come stringhe.
+    """
+    try:
+        since_datetime = datetime.fromtimestamp(float(since))
+    except ValueError:
+        since_datetime = datetime.fromisoformat(since)
+        if since_datetime.tzinfo is not None:
+            since_datetime = since_datetime.astimezone().replace(tzinfo=None)
+    return since_datetime.strftime(LOG_TIMESTAMP_FORMAT)[:-3]
+
+
+def get_log_segments(log_path: str = LOG_FILE_PATH, backup_count: int = LOG_BACKUP_COUNT) -> List[tuple[str, int]]:
+    """Restituisce (percorso, inode) dei file di log esistenti, dal più vecchio (app.log.N) al corrente (app.log)"""
+    segments = []
+    for path in [f"{log_path}.{index}" for index in range(backup_count, 0, -1)] + [log_path]:
+        try:
+            segments.append((path, os.stat(path).st_ino))
+        except FileNotFoundError:
+            continue
+    return segments
+
+
+def _locate_cursor(cursor: str, segments: List[tuple[str, int]]) -> Optional[tuple[int, int]]:
+    """Indice del segmento e offset puntati dal cursore, None se il file è già stato eliminato dalla rotazione"""
+    inode, offset = parse_log_cursor(cursor)
+    for index, (_, segment_inode) in enumerate(segments):
+        if segment_inode == inode:
+            return index, offset
+    return None
+
+
+def _complete_end(f, end: int) -> int:
+    """Offset subito dopo l'ultima riga completa prima di `end`: l'ultima riga potrebbe essere in scrittura"""
+    position = end
+    while position > 0:
+        read_size = min(LOG_READ_BLOCK_SIZE, position)
+        f.seek(position - read_size)
+        newline_index = f.read(read_size).rfind(b'\n')
+        if newline_index >= 0:
+            return position - read_size + newline_index + 1
+        position -= read_size
+    return 0
+
+
+def _iter_lines_backwards(f, end: int) -> Iterator[tuple[int, bytes]]:
+    """Restituisce (offset, riga) andando a ritroso da `end`, leggendo il file a blocchi"""
+    position = end
+    carry = b''
+    while position > 0:
+        read_size = min(LOG_READ_BLOCK_SIZE, position)
+        position -= read_size
+        f.seek(position)
+        data = f.read(read_size) + carry
+        lines = data.split(b'\n')[:-1]  # data termina sempre con '\n'
+        line_end = position + len(data)
+        for line in reversed(lines[1:]):
+            line_end -= len(line) + 1
+            yield line_end, line
+        # La prima riga del blocco potrebbe iniziare nel blocco precedente
+        carry = lines[0] + b'\n' if lines else b''
+    if carry:
+        yield 0, carry[:-1]
+
+
+def _iter_lines_forward(f, start: int) -> Iterator[tuple[int, bytes]]:
+    """Restituisce (offset, riga) da `start` in avanti, escludendo l'ultima riga se non ancora completa"""
+    f.seek(start)
+    offset = start
+    for line in f:
+        if not line.endswith(b'\n'):
+            break
+        yield offset, line[:-1]
+        offset += len(line)
+
+
+def _make_record(lines: List[tuple[int, bytes]], inode: int) -> LogRecord:
+    text = '\n'.join(line.decode('utf-8', errors='replace') for _, line in lines)
+    header = LOG_RECORD_HEADER_PATTERN.match(text)
+    last_offset, last_line = lines[-1]
+    return LogRecord(text=text, timestamp=header.group(1) if header else None, level=header.group(2) if header else None,
+                     inode=inode, start=lines[0][0], end=last_offset + len(last_line) + 1)
+
+
+def _iter_records_backwards(path: str, inode: int, end: Optional[int] = None) -> Iterator[LogRecord]:
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        return
+    with f:
+        if os.fstat(f.fileno()).st_ino != inode:  # Ruotato dopo l'elenco dei segmenti
+            return
+        size = os.fstat(f.fileno()).st_size
+        continuation_lines = []
+        for offset, line in _iter_lines_backwards(f, _complete_end(f, size if end is None else min(end, size))):
+            continuation_lines.append((offset, line))
+            if LOG_RECORD_HEADER_PATTERN.match(line.decode('utf-8', errors='replace')) or offset == 0:
+                yield _make_record(continuation_lines[::-1], inode)
+                continuation_lines = []
+
+
+def _iter_records_forward(path: str, inode: int, start: int = 0) -> Iterator[LogRecord]:
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        return
+    with f:
+        if os.fstat(f.fileno()).st_ino != inode:
+            return
+        record_lines = []
+        for offset, line in _iter_lines_forward(f, start):
+            if record_lines and LOG_RECORD_HEADER_PATTERN.match(line.decode('utf-8', errors='replace')):
+                yield _make_record(record_lines, inode)
+                record_lines = []
+            record_lines.append((offset, line))
+        if record_lines:
+            yield _make_record(record_lines, inode)
+
+
+def _matches(record: LogRecord, since: Optional[str], min_level: Optional[int]) -> bool:
+    if since is not None and (record.timestamp is None or record.timestamp < since):
+        return False
+    if min_level is not None:
+        record_level = logging.getLevelName(record.level) if record.level else None
+        if not isinstance(record_level, int) or record_level < min_level:
+            return False
+    return True
+
+
+def get_log_end_cursor() -> Optional[str]:
+    """Cursore che punta alla fine del log corrente, da cui seguire i nuovi record"""
+    segments = get_log_segments()
+    if not segments:
+        return None
+    path, inode = segments[-1]
+    with open(path, 'rb') as f:
+        return format_log_cursor(inode, _complete_end(f, os.fstat(f.fileno()).st_size))
+
+
+def read_log_tail(limit: int = LOGS_DEFAULT_TAIL, since: Optional[str] = None, min_level: Optional[int] = None,
+                  before: Optional[str] = None) -> LogPage:
+    """
+    Legge a ritroso gli ultimi `limit` record che soddisfano i filtri, partendo dalla fine del log oppure da
+    `before`, e passando ai file ruotati se necessario. Solo i blocchi del file necessari vengono letti.
+
+    Args:
+        limit: numero massimo di record restituiti
+        since: timestamp nel formato di `parse_log_since`; la lettura si ferma al primo record più vecchio
+        min_level: livello minimo dei record restituiti
+        before: cursore (`prev_cursor` di una pagina precedente) prima del quale leggere
+
+    Returns:
+        Pagina con i record in ordine cronologico
+    """
+    segments = get_log_segments()
+    page = LogPage()
+    if not segments:
+        return page
+
+    if before is not None:
+        located = _locate_cursor(before, segments)
+        if located is None:
+            return page
+        segment_index, end = located
+        page.next_cursor = before
+    else:
+        segment_index, end = len(segments) - 1, None
+
+    records = []
+    exhausted = True
+    for index in range(segment_index, -1, -1):
+        path, inode = segments[index]
+        for record in _iter_records_backwards(path, inode, end if index == segment_index else None):
+            if page.next_cursor is None:
+                page.next_cursor = record.cursor
+            if since is not None and record.timestamp is not None and record.timestamp < since:
+                break
+            if not _matches(record, since, min_level):
+                continue
+            if len(records) == limit:
+                exhausted = False
+                break
+            records.append(record)
+        else:
+            continue
+        break
+
+    records.reverse()
+    page.records = records
+    if page.next_cursor is None:
+        page.next_cursor = get_log_end_cursor()
+    if not exhausted and records:
+        page.prev_cursor = records[0].start_cursor
+    return page
+
+
+def read_log_forward(cursor: Optional[str], limit: int = LOGS_DEFAULT_TAIL, since: Optional[str] = None,
+                     min_level: Optional[int] = None) -> LogPage:
+    """
+    Legge fino a `limit` record successivi al cursore (`next_cursor` di una pagina precedente), passando dai file
+    ruotati al file corrente. Se il file del cursore è già stato eliminato dalla rotazione, la lettura riparte dal
+    file più vecchio disponibile. Senza cursore legge dall'inizio del log.
+    """
+    segments = get_log_segments()
+    page = LogPage(next_cursor=cursor)
+    if not segments:
+        return page
+
+    located = _locate_cursor(cursor, segments) if cursor is not None else None
+    segment_index, start = located if located is not None else (0, 0)
+    if located is None:
+        page.next_cursor = format_log_cursor(segments[0][1], 0)
+
+    for index in range(segment_index, len(segments)):
+        path, inode = segments[index]
+        for record in _iter_records_forward(path, inode, start if index == segment_index else 0):
+            page.next_cursor = record.cursor
+            if _matches(record, since, min_level):
+                page.records.append(record)
+                if len(page.records) == limit:
+                    return page
+    return page
@@ -0,0 +1,145 @@
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Optional
+import ollama
+from lib.app_logger import logger
+from lib.query_generation import ollama_client, ollama_model_name, OLLAMA_KEEP_ALIVE_SECONDS
+
+OLLAMA_PRELOAD_ON_STARTUP = os.environ.get("OLLAMA_PRELOAD_ON_STARTUP", "True").lower() == "true"
+OLLAMA_PRELOAD_RETRY_SECONDS = float(os.environ.get("OLLAMA_PRELOAD_RETRY_SECONDS", "30"))  # Attesa prima di riprovare un caricamento fallito
+# Ogni quanto rinnovare il keep-alive del modello, solo se nel frattempo ci sono state richieste
+OLLAMA_KEEP_ALIVE_REFRESH_SECONDS = float(os.environ.get("OLLAMA_KEEP_ALIVE_REFRESH_SECONDS",
+                                                         str(max(OLLAMA_KEEP_ALIVE_SECONDS / 2, 30))))
+# Dopo quanto tempo senza richieste il modello viene lasciato scaricare da Ollama
+OLLAMA_IDLE_AFTER_SECONDS = float(os.environ.get("OLLAMA_IDLE_AFTER_SECONDS", "1800"))
+
+
+class ModelLifecycleManager:
+    """
+    Gestisce il caricamento del modello di Ollama per il worker.
+
+    All'avvio il modello viene caricato in memoria in un thread in background (una generazione con prompt vuoto
+    carica il modello senza generare token), così la prima richiesta non paga il tempo di caricamento e l'avvio
+    del worker non viene rallentato. Finché arrivano richieste, il keep-alive viene rinnovato periodicamente;
+    dopo OLLAMA_IDLE_AFTER_SECONDS senza richieste il modello viene lasciato scaricare.
+    """
+
+    def __init__(self, model_name: str = ollama_model_name, keep_alive_seconds: float = OLLAMA_KEEP_ALIVE_SECONDS,
+                 refresh_seconds: float = OLLAMA_KEEP_ALIVE_REFRESH_SECONDS,
+                 idle_after_seconds: float = OLLAMA_IDLE_AFTER_SECONDS):
+        self.model_name = model_name
+        self.keep_alive_seconds = keep_alive_seconds
+        self.refresh_seconds = refresh_seconds
+        self.idle_after_seconds = idle_after_seconds
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._state = 'not_loaded'
+        self._last_traffic_at: Optional[float] = None
+        self._last_load_at: Optional[float] = None
+        self._last_load_seconds: Optional[float] = None
+        self._last_error: Optional[str] = None
+        self.loads = 0
+        self.refreshes = 0
+
+    def start(self, preload=True):
+        """Avvia il thread che carica il modello e ne rinnova il keep-alive"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, args=(preload,), name="ollama-model-lifecycle",
+                                            daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def record_traffic(self):
+        """Segnala che è arrivata una richiesta che userà il modello"""
+        with self._lock:
+            self._last_traffic_at = time.monotonic()
+
+    def _load(self, reason: str) -> bool:
+        with self._lock:
+            if self._state != 'loaded':
+                self._state = 'loading'
+        start = time.monotonic()
+        try:
+            ollama_client.generate(model=self.model_name, prompt='', keep_alive=self.keep_alive_seconds)
+        except Exception as e:
+            with self._lock:
+                self._state = 'error'
+                self._last_error = str(e)
+            logger.error(f"Error loading Ollama model {self.model_name} ({reason}): {e}")
+            return False
+        load_seconds = time.monotonic() - start
+        with self._lock:
+            self._state = 'loaded'
+            self._last_error = None
+            self._last_load_at = time.monotonic()
+            self._last_load_seconds = round(load_seconds, 3)
+            if reason == 'preload':
+                self.loads += 1
+            else:
+                self.refreshes += 1
+        logger.info(f"Ollama model {self.model_name} {reason} completed in {load_seconds:.2f}s")
+        return True
+
+    def _run(self, preload: bool):
+        if preload:
+            while not self._load('preload'):
+                if self._stop_event.wait(OLLAMA_PRELOAD_RETRY_SECONDS):
+                    return
+
+        while not self._stop_event.wait(self.refresh_seconds):
+            with self._lock:
+                last_traffic_at = self._last_traffic_at
+            if last_traffic_at is None or time.monotonic() - last_traffic_at > self.idle_after_seconds:
+                continue  # Nessuna richiesta recente: Ollama scaricherà il modello allo scadere del keep-alive
+            self._load('keep-alive refresh')
+
+    def _get_loaded_model(self, client: ollama.Client):
+        """Stato del modello secondo Ollama: None se non è in memoria"""
+        # Ollama riporta i modelli senza tag come `nome:latest`
+        model_names = {self.model_name, self.model_name if ':' in self.model_name else f"{self.model_name}:latest"}
+        for model in client.ps().models:
+            if model.model in model_names or model.name in model_names:
+                return model
+        return None
+
+    def report(self, client: Optional[ollama.Client] = None) -> dict:
+        """Stato di caricamento del modello, verificato con Ollama (tramite `client`, se indicato), per /health"""
+        try:
+            loaded_model = self._get_loaded_model(client or ollama_client)
+            ollama_reachable = True
+        except Exception as e:
+            loaded_model = None
+            ollama_reachable = False
+            logger.error(f"Error reading loaded Ollama models: {e}")
+
+        with self._lock:
+            state = self._state
+            if ollama_reachable and state == 'loaded' and loaded_model is None:
+                state = 'unloaded'  # Scaricato da Ollama allo scadere del keep-alive
+            now = time.monotonic()
+            return {
+                'model': self.model_name,
+                'state': state,
+                'loaded_in_ollama': loaded_model is not None if ollama_reachable else None,
+                'expires_at': loaded_model.expires_at.astimezone(timezone.utc).isoformat()
+                if loaded_model is not None and loaded_model.expires_at else None,
+                'size_vram': loaded_model.size_vram if loaded_model is not None else None,
+                'last_load_seconds': self._last_load_seconds,
+                'seconds_since_last_load': round(now - self._last_load_at, 1) if self._last_load_at else None,
+                'seconds_since_last_traffic': round(now - self._last_traffic_at, 1) if self._last_traffic_at else None,
+                'keep_alive_seconds': self.keep_alive_seconds,
+                'loads': self.loads,
+                'refreshes': self.refreshes,
+                'last_error': self._last_error,
+                'checked_at': datetime.now(timezone.utc).isoformat(),
+            }
+
+
+model_lifecycle = ModelLifecycleManager()
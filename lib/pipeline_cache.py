@@ -0,0 +1,73 @@
+import hashlib
+import json
+import os
+import unicodedata
+from typing import List
+from lib.cache import create_cache, create_similarity_cache
+from lib.types.youtube_types_custom import Video
+
+PIPELINE_CACHE_TTL_SECONDS = float(os.environ.get("PIPELINE_CACHE_TTL_SECONDS", str(60 * 60 * 24 * 7)))
+PIPELINE_VIDEOS_CACHE_TTL_SECONDS = float(os.environ.get("PIPELINE_VIDEOS_CACHE_TTL_SECONDS", "3600"))
+PIPELINE_CACHE_MAX_ENTRIES = int(os.environ.get("PIPELINE_CACHE_MAX_ENTRIES", "5000"))
+# Somiglianza di Jaccard minima tra gli insiemi di keywords per riutilizzare le query generate
+QUERIES_CACHE_MIN_SIMILARITY = float(os.environ.get("QUERIES_CACHE_MIN_SIMILARITY", "0.7"))
+
+# Una cache per ogni fase della pipeline di /process. La chiave di ogni fase dipende dal risultato della fase
+# precedente e dalla propria configurazione, quindi cambiando ad esempio MIN_LIKES viene ricalcolata solo la
+# ricerca dei video, mentre testo, keywords e query vengono riutilizzati.
+extracted_text_cache = create_cache('pipeline_extracted_text', max_size=64, ttl_seconds=PIPELINE_CACHE_TTL_SECONDS,
+                                    shared=True, shared_max_size=PIPELINE_CACHE_MAX_ENTRIES, compress=True)
+keywords_cache = create_cache('pipeline_keywords', max_size=256, ttl_seconds=PIPELINE_CACHE_TTL_SECONDS,
+                              shared=True, shared_max_size=PIPELINE_CACHE_MAX_ENTRIES,
+                              deserialize=lambda data: {'language': data['language'],
+                                                        'keywords': [(kw, score) for kw, score in data['keywords']]})
+# Le query generate vengono riutilizzate anche per documenti diversi con keywords quasi uguali
+queries_cache = create_similarity_cache('pipeline_queries', max_size=1024, ttl_seconds=PIPELINE_CACHE_TTL_SECONDS,
+                                        min_similarity=QUERIES_CACHE_MIN_SIMILARITY, shared=True,
+                                        shared_max_size=PIPELINE_CACHE_MAX_ENTRIES)
+videos_cache = create_cache('pipeline_videos', max_size=256, ttl_seconds=PIPELINE_VIDEOS_CACHE_TTL_SECONDS,
+                            shared=True, shared_max_size=PIPELINE_CACHE_MAX_ENTRIES, compress=True,
+                            serialize=lambda videos: [video.to_dict() for video in videos],
+                            deserialize=lambda data: [Video.from_dict(video) for video in data])
+
+
+def hash_content(*parts) -> str:
+    """Calcola l'hash SHA-256 di una sequenza di parti (bytes oppure valori serializzabili in JSON)"""
+    content_hash = hashlib.sha256()
+    for part in parts:
+        if not isinstance(part, bytes):
+            part = json.dumps(part, sort_keys=True, ensure_ascii=False).encode('utf-8')
+        content_hash.update(hashlib.sha256(part).digest())
+    return content_hash.hexdigest()
+
+
+def get_extracted_text_cache_key(file_bytes: bytes, filename: str, *extraction_config) -> str:
+    """
+    Il testo estratto dipende dal contenuto del file, dal suo formato e dalla versione e configurazione
+    dell'estrazione (OCR compreso)
+    """
+    return hash_content(file_bytes, os.path.splitext(filename)[1].lower(), list(extraction_config))
+
+
+def get_keywords_cache_key(text: str, top_n: int, n_word_range: tuple[int, int], algorithm: str,
+                           *extraction_config) -> str:
+    """Lingua rilevata e keywords dipendono dal testo completo e dalla configurazione dell'estrazione"""
+    return hash_content(text, top_n, list(n_word_range), algorithm, list(extraction_config))
+
+
+def normalize_keyword(keyword: str) -> str:
+    return ' '.join(unicodedata.normalize('NFKC', keyword).casefold().split())
+
+
+def get_queries_cache_items(keywords: List[tuple[str, float]]) -> frozenset[str]:
+    """Insieme delle keywords normalizzate, indipendente dall'ordine e dai punteggi"""
+    return frozenset(normalize_keyword(kw) for kw, _ in keywords if kw.strip())
+
+
+def get_queries_cache_scope(query_language: str, num_queries: int, model_name: str) -> str:
+    """Le query vengono riutilizzate solo per la stessa lingua, lo stesso numero di query e lo stesso modello"""
+    return hash_content(query_language, num_queries, model_name)
+
+
+def get_videos_cache_key(queries: List[str], video_language: str, min_likes: int, min_subscribers: int) -> str:
+    return hash_content(queries, video_language, min_likes, min_subscribers)
@@ -0,0 +1,285 @@
+import os
+import signal
+from multiprocessing import util as multiprocessing_util
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Optional
+from lib.app_logger import logger
+
+try:
+    import resource
+except ImportError:  # Windows: nessun limite di memoria
+    resource = None
+
+PIPELINE_WORKERS = int(os.environ.get("PIPELINE_WORKERS", "2"))  # Processi per estrazione del testo e keywords, 0 = nel worker della richiesta
+PIPELINE_MAX_QUEUE_SIZE = int(os.environ.get("PIPELINE_MAX_QUEUE_SIZE", "8"))  # Task in attesa oltre i quali i nuovi vengono rifiutati
+PIPELINE_TASK_TIMEOUT_SECONDS = float(os.environ.get("PIPELINE_TASK_TIMEOUT_SECONDS", "300"))  # Durata massima di un task
+PIPELINE_MAX_MEMORY_MB = int(os.environ.get("PIPELINE_MAX_MEMORY_MB", "2048"))  # Memoria massima di un processo del pool, 0 = nessun limite
+# Processi OCR di ogni processo del pool (strisce delle immagini e pagine scansionate in parallelo), 0 o 1 = nel
+# processo stesso; di default le CPU vengono divise tra i processi del pool
+PIPELINE_OCR_WORKERS = int(os.environ.get("PIPELINE_OCR_WORKERS", str((os.cpu_count() or 1) // max(PIPELINE_WORKERS, 1))))
+PIPELINE_PDF_CHUNK_PAGES = int(os.environ.get("PIPELINE_PDF_CHUNK_PAGES", "10"))  # Pagine di un PDF estratte da ogni task
+# Attesa massima dei risultati del pool per una richiesta (per un PDF, di tutti i suoi blocchi), coda compresa
+PIPELINE_REQUEST_TIMEOUT_SECONDS = float(os.environ.get("PIPELINE_REQUEST_TIMEOUT_SECONDS", "600"))
+
+
+class PipelineBusyError(Exception):
+    """Il pool della pipeline ha già troppi task in attesa"""
+
+
+class PipelineTaskTimeoutError(Exception):
+    """Un task ha superato PIPELINE_TASK_TIMEOUT_SECONDS"""
+
+
+class _PipelineTaskInterrupted(BaseException):
+    """
+    Sollevata nel processo del pool allo scadere del timeout: non deriva da Exception, così non viene fermata
+    dagli `except Exception` dell'estrazione (ad esempio quello di ogni pagina del PDF) e interrompe tutto il task
+    """
+
+
+def _raise_task_timeout(signum, frame):
+    raise _PipelineTaskInterrupted()
+
+
+def _init_pipeline_worker(max_memory_mb: int, ocr_workers: int, warm_up: Optional[Callable[[], None]]):
+    """
+    Eseguita all'avvio di ogni processo del pool: le sezioni delle keywords vengono estratte nel processo stesso,
+    mentre l'OCR usa un piccolo pool annidato di `ocr_workers` processi, creato al primo utilizzo. Infine prepara
+    gli estrattori e applica il limite di memoria.
+    """
+    from lib import text_processing, word_extraction
+    text_processing.KEYWORD_SECTION_WORKERS = 0
+    word_extraction.OCR_WORKERS = ocr_workers
+    word_extraction._ocr_executor = None  # Un pool ereditato dal processo padre non è utilizzabile
+    # All'uscita il processo attende i propri figli: il pool OCR va chiuso prima, e prima delle code di
+    # multiprocessing (priorità 10), che altrimenti non invierebbero più ai processi OCR il segnale di terminare
+    multiprocessing_util.Finalize(None, word_extraction.shutdown_ocr_executor, exitpriority=100)
+    signal.signal(signal.SIGALRM, _raise_task_timeout)
+    if warm_up is not None:
+        warm_up()
+    if max_memory_mb > 0 and resource is not None:
+        limit_bytes = max_memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit_bytes, limit_bytes))
+
+
+def _run_pipeline_task(function: Callable, args: tuple, kwargs: dict, timeout_seconds: float):
+    """Eseguita nel processo del pool: interrompe il task allo scadere del timeout e ne misura la durata"""
+    signal.setitimer(signal.ITIMER_REAL, timeout_seconds)
+    start = time.perf_counter()
+    try:
+        return function(*args, **kwargs), time.perf_counter() - start
+    except _PipelineTaskInterrupted:
+        raise PipelineTaskTimeoutError(f"Pipeline task timed out after {timeout_seconds:g}s") from None
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+def _ping() -> bool:
+    return True
+
+
+class PipelineExecutor:
+    """
+    Esegue le fasi CPU-bound della pipeline (estrazione del testo, OCR, keywords) in un pool di processi dedicato,
+    così il worker di gunicorn resta libero di inviare gli eventi di avanzamento e le richieste non si contendono
+    il GIL.
+
+    I processi vengono avviati e preparati in anticipo da `start`. Ogni task ha un timeout, applicato con un
+    timer nel processo del pool, e ogni processo ha un limite di memoria: un task che lo supera fallisce con
+    MemoryError invece di far terminare il worker. Se un processo del pool termina comunque, il pool viene ricreato.
+    Con più di `max_workers + max_queue_size` task in corso, i nuovi vengono rifiutati con PipelineBusyError.
+    Con `max_workers` 0 i task vengono eseguiti nel processo corrente. L'attesa dei risultati è limitata da
+    `request_timeout_seconds`: un task scaduto ancora in coda nel pool viene annullato.
+    """
+
+    def __init__(self, max_workers: int = PIPELINE_WORKERS, max_queue_size: int = PIPELINE_MAX_QUEUE_SIZE,
+                 task_timeout_seconds: float = PIPELINE_TASK_TIMEOUT_SECONDS,
+                 max_memory_mb: int = PIPELINE_MAX_MEMORY_MB,
+                 request_timeout_seconds: float = PIPELINE_REQUEST_TIMEOUT_SECONDS,
+                 ocr_workers: int = PIPELINE_OCR_WORKERS):
+        self.max_workers = max_workers
+        self.max_queue_size = max_queue_size
+        self.task_timeout_seconds = task_timeout_seconds
+        self.request_timeout_seconds = request_timeout_seconds
+        self.ocr_workers = ocr_workers
+        self.max_memory_mb = max_memory_mb
+        self._warm_up: Optional[Callable[[], None]] = None
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.pool_restarts = 0
+        self._tasks: dict[str, dict] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_workers > 0
+
+    def _create_pool(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=self.max_workers, initializer=_init_pipeline_worker,
+                                   initargs=(self.max_memory_mb, self.ocr_workers, self._warm_up))
+
+    def start(self, warm_up: Optional[Callable[[], None]] = None):
+        """Crea il pool e ne avvia subito tutti i processi, che eseguono `warm_up` prima del primo task"""
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._pool is not None:
+                return
+            self._warm_up = warm_up
+            self._pool = self._create_pool()
+            # Il pool avvia un nuovo processo per ogni task inviato finché non ce n'è uno libero
+            for _ in range(self.max_workers):
+                self._pool.submit(_ping)
+        logger.info(f"Pipeline process pool started with {self.max_workers} workers")
+
+    def _restart_pool(self, broken_pool: ProcessPoolExecutor):
+        with self._lock:
+            if self._pool is not broken_pool:
+                return  # Già ricreato da un'altra richiesta
+            # I processi del pool rotto sono già stati terminati dal suo thread di gestione
+            self._pool = self._create_pool()
+            self.pool_restarts += 1
+        logger.error("Pipeline process pool was broken (a worker process died), restarted")
+
+    def _record(self, task_name: str, wait_seconds: Optional[float], run_seconds: Optional[float], failed: bool):
+        """Tempi di attesa in coda e di esecuzione, registrati solo per i task completati"""
+        with self._lock:
+            task_stats = self._tasks.setdefault(task_name, {'calls': 0, 'failures': 0, 'run_seconds': 0.0,
+                                                            'max_run_seconds': 0.0, 'wait_seconds': 0.0,
+                                                            'max_wait_seconds': 0.0})
+            task_stats['calls'] += 1
+            task_stats['failures'] += int(failed)
+            if not failed:
+                task_stats['wait_seconds'] += wait_seconds
+                task_stats['max_wait_seconds'] = max(task_stats['max_wait_seconds'], wait_seconds)
+                task_stats['run_seconds'] += run_seconds
+                task_stats['max_run_seconds'] = max(task_stats['max_run_seconds'], run_seconds)
+
+    def submit(self, function: Callable, *args, **kwargs) -> Future:
+        """
+        Accoda `function(*args, **kwargs)` nel pool; `function` deve essere una funzione di modulo e argomenti e
+        risultato devono essere serializzabili. Il future restituisce il risultato della funzione.
+        """
+        task_name = function.__name__
+        result_future = Future()
+        if not self.enabled:
+            start = time.perf_counter()
+            try:
+                result_future.set_result(function(*args, **kwargs))
+                self._record(task_name, 0.0, time.perf_counter() - start, failed=False)
+            except Exception as e:
+                result_future.set_exception(e)
+                self._record(task_name, None, None, failed=True)
+            return result_future
+
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue_size:
+                self.rejected += 1
+                raise PipelineBusyError(f"Pipeline queue is full ({self._pending} tasks in progress)")
+            self._pending += 1
+            if self._pool is None:
+                self._pool = self._create_pool()
+            pool = self._pool
+
+        submitted_at = time.perf_counter()
+        try:
+            try:
+                pool_future = pool.submit(_run_pipeline_task, function, args, kwargs, self.task_timeout_seconds)
+            except BrokenProcessPool:
+                self._restart_pool(pool)
+                with self._lock:
+                    pool = self._pool
+                pool_future = pool.submit(_run_pipeline_task, function, args, kwargs, self.task_timeout_seconds)
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            raise
+
+        def on_done(done_future: Future):
+            elapsed_seconds = time.perf_counter() - submitted_at
+            with self._lock:
+                self._pending -= 1
+            try:
+                result, run_seconds = done_future.result()
+            except BaseException as e:
+                if isinstance(e, PipelineTaskTimeoutError):
+                    with self._lock:
+                        self.timeouts += 1
+                elif isinstance(e, BrokenProcessPool):
+                    self._restart_pool(pool)
+                self._record(task_name, None, None, failed=True)
+                if not result_future.cancelled():
+                    result_future.set_exception(e)
+                return
+            self._record(task_name, max(0.0, elapsed_seconds - run_seconds), run_seconds, failed=False)
+            if not result_future.cancelled():
+                result_future.set_result(result)
+
+        def on_cancel(cancelled_future: Future):
+            # Un task annullato (ad esempio perché la richiesta è scaduta) non viene eseguito se è ancora in coda
+            if cancelled_future.cancelled():
+                pool_future.cancel()
+
+        result_future.add_done_callback(on_cancel)
+        pool_future.add_done_callback(on_done)
+        return result_future
+
+    def run(self, function: Callable, *args, **kwargs):
+        """Esegue `function` nel pool e ne attende il risultato"""
+        return self.result(self.submit(function, *args, **kwargs))
+
+    def request_deadline(self) -> float:
+        """Scadenza (time.monotonic) dei risultati di una richiesta che inizia ora"""
+        return time.monotonic() + self.request_timeout_seconds
+
+    def result(self, future: Future, deadline: Optional[float] = None):
+        """
+        Attende il risultato di un task al più fino a `deadline` (time.monotonic, di default `request_deadline()`),
+        così più task della stessa richiesta condividono un'unica attesa massima. Il task viene interrotto nel
+        processo del pool allo scadere del suo timeout; se invece scade la richiesta, il task viene annullato.
+        """
+        if deadline is None:
+            deadline = self.request_deadline()
+        try:
+            return future.result(timeout=max(0.0, deadline - time.monotonic()))
+        except FutureTimeoutError:
+            future.cancel()
+            with self._lock:
+                self.timeouts += 1
+            raise PipelineTaskTimeoutError("No pipeline result before the request deadline")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'workers': self.max_workers,
+                'max_queue_size': self.max_queue_size,
+                'task_timeout_seconds': self.task_timeout_seconds,
+                'request_timeout_seconds': self.request_timeout_seconds,
+                'max_memory_mb': self.max_memory_mb,
+                'ocr_workers': self.ocr_workers,
+                'in_progress': self._pending,
+                'queue_depth': max(0, self._pending - self.max_workers),
+                'rejected': self.rejected,
+                'timeouts': self.timeouts,
+                'pool_restarts': self.pool_restarts,
+                'tasks': {
+                    task_name: {
+                        'calls': task_stats['calls'],
+                        'failures': task_stats['failures'],
+                        'avg_run_seconds': round(task_stats['run_seconds'] / completed, 4) if completed else None,
+                        'max_run_seconds': round(task_stats['max_run_seconds'], 4),
+                        'avg_wait_seconds': round(task_stats['wait_seconds'] / completed, 4) if completed else None,
+                        'max_wait_seconds': round(task_stats['max_wait_seconds'], 4),
+                    }
+                    for task_name, task_stats in self._tasks.items()
+                    for completed in [task_stats['calls'] - task_stats['failures']]
+                },
+            }
+
+
+pipeline_executor = PipelineExecutor()
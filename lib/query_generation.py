@@ -1,14 +1,225 @@
+import json
 import os
+import queue
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Iterator, Optional
+import httpx
 import ollama
 from ollama import GenerateResponse
 from lib.app_logger import logger
 
 ollama_model_name = os.environ.get("OLLAMA_MODEL", "gemma3:1b")
 OLLAMA_API_URL = os.environ.get("OLLAMA_API_URL", "http://localhost:11434")
+OLLAMA_KEEP_ALIVE_SECONDS = float(os.environ.get("OLLAMA_KEEP_ALIVE_SECONDS", str(60 * 10)))  # Permanenza in memoria del modello dopo l'ultimo uso
+OLLAMA_MAX_IN_FLIGHT = int(os.environ.get("OLLAMA_MAX_IN_FLIGHT", "1"))  # Generazioni contemporanee per worker
+OLLAMA_MAX_QUEUE_SIZE = int(os.environ.get("OLLAMA_MAX_QUEUE_SIZE", "16"))  # Richieste in attesa oltre le quali si usa subito il ripiego
+OLLAMA_QUEUE_TIMEOUT_SECONDS = float(os.environ.get("OLLAMA_QUEUE_TIMEOUT_SECONDS", "10"))  # Attesa massima in coda
+OLLAMA_REQUEST_TIMEOUT_SECONDS = float(os.environ.get("OLLAMA_REQUEST_TIMEOUT_SECONDS", "120"))
+OLLAMA_MAX_CONNECTIONS = int(os.environ.get("OLLAMA_MAX_CONNECTIONS", "4"))  # Connessioni HTTP verso Ollama nel pool
+OLLAMA_BATCH_WINDOW_MS = float(os.environ.get("OLLAMA_BATCH_WINDOW_MS", "0"))  # Finestra di raggruppamento delle richieste, 0 = disattivato
+OLLAMA_BATCH_MAX_SIZE = int(os.environ.get("OLLAMA_BATCH_MAX_SIZE", "4"))  # Documenti al massimo in un singolo prompt
+# 'text': query una per riga nel testo libero; 'json': output vincolato ad uno schema JSON con un prompt compatto
+OLLAMA_QUERY_OUTPUT_MODE = os.environ.get("OLLAMA_QUERY_OUTPUT_MODE", "text").lower()
+OLLAMA_QUERY_NUM_PREDICT = int(os.environ.get("OLLAMA_QUERY_NUM_PREDICT", "0"))  # Token massimi in modalità json, 0 = in base al numero di query
+MAX_QUERY_LENGTH_CHARS = 120
 
-ollama_client = ollama.Client(host=OLLAMA_API_URL)
+# Connessioni HTTP riutilizzate tra le richieste (keep-alive), con timeout espliciti
+ollama_client = ollama.Client(host=OLLAMA_API_URL,
+                              timeout=httpx.Timeout(OLLAMA_REQUEST_TIMEOUT_SECONDS, connect=5.0),
+                              limits=httpx.Limits(max_connections=OLLAMA_MAX_CONNECTIONS,
+                                                  max_keepalive_connections=OLLAMA_MAX_CONNECTIONS))
 # ollama_client.pull(ollama_model_name) # Pull the model if not already available (docker compose should automatically pull it)
 
+
+class OllamaBusyError(Exception):
+    """La richiesta non ha ottenuto un turno di generazione entro il tempo massimo, o la coda è piena"""
+
+
+class OllamaGateway:
+    """
+    Limita le generazioni contemporanee verso Ollama e mette in coda le altre in ordine di arrivo (FIFO).
+
+    Una richiesta che non ottiene il turno entro `queue_timeout_seconds`, o che trova la coda piena, riceve
+    subito OllamaBusyError, così il chiamante può usare le query di ripiego invece di attendere il modello.
+    Il limite vale per processo: con più worker di gunicorn le generazioni contemporanee sono al massimo
+    `workers * max_in_flight`.
+    """
+
+    def __init__(self, client: ollama.Client, max_in_flight=OLLAMA_MAX_IN_FLIGHT, max_queue_size=OLLAMA_MAX_QUEUE_SIZE,
+                 queue_timeout_seconds=OLLAMA_QUEUE_TIMEOUT_SECONDS):
+        self.client = client
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_queue_size = max_queue_size
+        self.queue_timeout_seconds = queue_timeout_seconds
+        self._lock = threading.Lock()
+        self._waiters: deque[threading.Event] = deque()
+        self._in_flight = 0
+        self.requests = 0
+        self.queued = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.total_generation_seconds = 0.0
+
+    def _acquire(self, timeout: float):
+        start = time.monotonic()
+        with self._lock:
+            self.requests += 1
+            if self._in_flight < self.max_in_flight and not self._waiters:
+                self._in_flight += 1
+                return
+            if len(self._waiters) >= self.max_queue_size:
+                self.rejected += 1
+                raise OllamaBusyError(f"Ollama queue is full ({len(self._waiters)} waiting)")
+            waiter = threading.Event()
+            self._waiters.append(waiter)
+            self.queued += 1
+
+        granted = waiter.wait(timeout)
+        wait_seconds = time.monotonic() - start
+        with self._lock:
+            # Il turno può essere stato assegnato subito dopo lo scadere dell'attesa
+            if not granted and not waiter.is_set():
+                self._waiters.remove(waiter)
+                self.timeouts += 1
+                raise OllamaBusyError(f"No Ollama generation slot available after {wait_seconds:.1f}s")
+            self.total_wait_seconds += wait_seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, wait_seconds)
+
+    def _release(self, acquired_at: float):
+        with self._lock:
+            self.total_generation_seconds += time.monotonic() - acquired_at
+            if self._waiters:
+                # Il turno passa direttamente al primo in coda, senza che altri possano superarlo
+                self._waiters.popleft().set()
+            else:
+                self._in_flight -= 1
+
+    @contextmanager
+    def slot(self, timeout: float = None):
+        """Attende il proprio turno (al massimo `timeout` secondi) e lo occupa per la durata del blocco"""
+        self._acquire(self.queue_timeout_seconds if timeout is None else timeout)
+        acquired_at = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(acquired_at)
+
+    def generate(self, **kwargs) -> GenerateResponse:
+        with self.slot():
+            return self.client.generate(stream=False, **kwargs)
+
+    def _read_stream(self, chunks: queue.Queue, stop: threading.Event, acquired_at: float, kwargs: dict):
+        """Legge lo stream di Ollama fino alla fine e libera il turno appena il modello ha terminato"""
+        try:
+            response_stream = self.client.generate(stream=True, **kwargs)
+            try:
+                for chunk in response_stream:
+                    if stop.is_set():
+                        break
+                    chunks.put(chunk)
+            finally:
+                response_stream.close()
+            chunks.put(None)
+        except Exception as e:
+            chunks.put(e)
+        finally:
+            self._release(acquired_at)
+
+    def generate_stream(self, **kwargs) -> Iterator[GenerateResponse]:
+        """
+        Come `generate` in streaming. Lo stream viene letto da un thread dedicato, che occupa il turno solo
+        finché il modello genera: un chiamante lento a consumare le risposte (ad esempio perché il client HTTP
+        legge piano) non blocca le generazioni in coda. Chiudendo il generatore la generazione viene interrotta.
+        """
+        self._acquire(self.queue_timeout_seconds)
+        chunks: queue.Queue = queue.Queue()
+        stop = threading.Event()
+        threading.Thread(target=self._read_stream, args=(chunks, stop, time.monotonic(), kwargs),
+                         name="ollama-stream", daemon=True).start()
+        try:
+            while True:
+                chunk = chunks.get()
+                if chunk is None:
+                    return
+                if isinstance(chunk, Exception):
+                    raise chunk
+                yield chunk
+        finally:
+            stop.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            completed = self.requests - self.timeouts - self.rejected - len(self._waiters) - self._in_flight
+            served = self.requests - self.timeouts - self.rejected - len(self._waiters)
+            return {
+                'max_in_flight': self.max_in_flight,
+                'in_flight': self._in_flight,
+                'queue_depth': len(self._waiters),
+                'max_queue_size': self.max_queue_size,
+                'queue_timeout_seconds': self.queue_timeout_seconds,
+                'requests': self.requests,
+                'queued': self.queued,
+                'timeouts': self.timeouts,
+                'rejected': self.rejected,
+                'avg_wait_seconds': round(self.total_wait_seconds / served, 4) if served else 0.0,
+                'max_wait_seconds': round(self.max_wait_seconds, 4),
+                'avg_generation_seconds': round(self.total_generation_seconds / completed, 4) if completed else 0.0,
+            }
+
+
+ollama_gateway = OllamaGateway(ollama_client)
+
+
+class GenerationStats:
+    """Token generati e tempi delle chiamate di generazione, separati per modalità (text, json, batch)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._modes: dict[str, dict] = {}
+
+    def record(self, mode: str, seconds: float, response: Optional[GenerateResponse] = None, failed=False):
+        with self._lock:
+            mode_stats = self._modes.setdefault(mode, {'calls': 0, 'failures': 0, 'measured_calls': 0, 'eval_count': 0,
+                                                       'prompt_eval_count': 0, 'eval_seconds': 0.0,
+                                                       'total_seconds': 0.0, 'wall_seconds': 0.0})
+            mode_stats['calls'] += 1
+            mode_stats['failures'] += int(failed)
+            mode_stats['wall_seconds'] += seconds
+            # Ollama riporta i conteggi solo nella risposta finale; uno stream interrotto prima non li ha
+            if response is not None and response.eval_count is not None:
+                mode_stats['measured_calls'] += 1
+                mode_stats['eval_count'] += response.eval_count
+                mode_stats['prompt_eval_count'] += response.prompt_eval_count or 0
+                mode_stats['eval_seconds'] += (response.eval_duration or 0) / 1e9
+                mode_stats['total_seconds'] += (response.total_duration or 0) / 1e9
+
+    def stats(self) -> dict:
+        with self._lock:
+            result = {}
+            for mode, mode_stats in self._modes.items():
+                measured_calls = mode_stats['measured_calls']
+                result[mode] = {
+                    'calls': mode_stats['calls'],
+                    'failures': mode_stats['failures'],
+                    'avg_wall_seconds': round(mode_stats['wall_seconds'] / mode_stats['calls'], 4),
+                    'measured_calls': measured_calls,
+                    'avg_eval_count': round(mode_stats['eval_count'] / measured_calls, 2) if measured_calls else None,
+                    'avg_prompt_eval_count': round(mode_stats['prompt_eval_count'] / measured_calls, 2) if measured_calls else None,
+                    'avg_eval_seconds': round(mode_stats['eval_seconds'] / measured_calls, 4) if measured_calls else None,
+                    'avg_total_seconds': round(mode_stats['total_seconds'] / measured_calls, 4) if measured_calls else None,
+                }
+            return result
+
+
+generation_stats = GenerationStats()
+
 def check_ollama_connection_health():
     """
     Checks connection health between the Flask and Ollama services.
@@ -24,22 +235,20 @@ def check_ollama_connection_health():
         logger.error(f"Error checking Ollama connection health: {e}, ollama_url: {OLLAMA_API_URL}, model: {ollama_model_name}")
         return False
 
-def generate_search_queries(keywords, num_queries=3, query_language='it'):
-    """
-    Genera query di ricerca usando un modello AI locale di Ollama basate su keywords estratte.
+def build_fallback_queries(keywords, num_queries=3):
+    """Query di ripiego, usate quando il modello non è disponibile: le keywords più rilevanti"""
+    fallback_queries = []
+    for keyword, _ in keywords[:num_queries]:
+        fallback_queries.append(f"{keyword}")
+    return fallback_queries
 
-    :param keywords: Lista di tuple (keyword, score)
-    :param num_queries: Numero di query da generare
-    :param query_language: Lingua della query (default 'it' per italiano)
 
-    Returns:
-        Lista di query ottimizzate per la ricerca YouTube
-    """
+def build_queries_prompt(keywords, num_queries=3, query_language='it'):
+    """Prepara il prompt per il modello a partire dalle keywords estratte"""
     # Estrai le keywords dalle tuple (keyword, score)
     kw_list = [kw for kw, _ in keywords]
 
-    # Prepara il prompt per il modello
-    prompt = f"""
+    return f"""
     Genera {num_queries} query di ricerca per YouTube per trovare video educativi 
     basati sulle seguenti parole chiave estratte da appunti di studio:
     {', '.join(kw_list)}
@@ -55,28 +264,391 @@ def generate_search_queries(keywords, num_queries=3, query_language='it'):
     Restituisci SOLO le query generate, una per riga, senza numerazione o altro testo.
     NON numerare le query.
     """
+
+
+def clean_generated_query(line: str) -> str:
+    """Pulisce una riga generata dal modello; restituisce una stringa vuota se la riga non contiene una query"""
+    query = line.strip()
+    # Se la query inizia con (numero.) rimuovilo
+    if len(query) > 1 and query[0].isdigit() and query[1] == '.':
+        query = query[2:].strip()
+    return query
+
+
+def complete_queries(queries, keywords, num_queries=3):
+    """Porta le query al numero richiesto, aggiungendo keywords dirette se il modello ne ha generate meno"""
+    if len(queries) < num_queries:
+        return queries + [kw for kw, _ in keywords[:(num_queries - len(queries))]]
+    return queries[:num_queries]
+
+
+class InvalidQueriesOutputError(ValueError):
+    """L'output del modello in modalità json non rispetta lo schema atteso"""
+
+
+def build_queries_json_prompt(keywords, num_queries=3, query_language='it'):
+    """Prompt compatto per la modalità json: il formato dell'output è imposto dallo schema"""
+    kw_list = ', '.join(kw for kw, _ in keywords)
+    return (f"Parole chiave da appunti di studio: {kw_list}\n"
+            f"Scrivi {num_queries} query di ricerca YouTube (3-7 parole, lingua iso-code {query_language}) "
+            f"per trovare video educativi su questi argomenti.")
+
+
+def build_queries_json_schema(num_queries=3) -> dict:
+    return {
+        'type': 'object',
+        'properties': {
+            'queries': {
+                'type': 'array',
+                'items': {'type': 'string', 'maxLength': MAX_QUERY_LENGTH_CHARS},
+                'minItems': 1,
+                'maxItems': num_queries,
+            },
+        },
+        'required': ['queries'],
+    }
+
+
+def get_queries_json_options(num_queries=3) -> dict:
+    """Limita i token generati: circa 32 per query più la struttura del JSON"""
+    return {'num_predict': OLLAMA_QUERY_NUM_PREDICT or 32 * num_queries + 16}
+
+
+def validate_generated_query(query) -> str:
+    if not isinstance(query, str):
+        raise InvalidQueriesOutputError(f"Query is not a string: {query!r}")
+    query = ' '.join(query.split())
+    if not query or len(query) > MAX_QUERY_LENGTH_CHARS:
+        raise InvalidQueriesOutputError(f"Query is empty or too long: {query!r}")
+    return query
+
+
+def parse_queries_json(response_text: str, num_queries=3) -> list[str]:
+    """Valida l'output json del modello; solleva InvalidQueriesOutputError se non rispetta lo schema"""
     try:
-        generated_response: GenerateResponse= ollama_client.generate(prompt=prompt, model=ollama_model_name, stream=False, keep_alive=60 * 10)
-        generated_text = generated_response.response
+        data = json.loads(response_text)
+    except ValueError as e:
+        raise InvalidQueriesOutputError(f"Output is not valid JSON (truncated by num_predict?): {e}") from e
+    queries = data.get('queries') if isinstance(data, dict) else None
+    if not isinstance(queries, list) or not queries:
+        raise InvalidQueriesOutputError(f"Output has no 'queries' list: {response_text[:200]!r}")
+    return [validate_generated_query(query) for query in queries][:num_queries]
 
-        # Dividi il testo in righe e pulisci
-        queries = [line.strip() for line in generated_text.split('\n') if line.strip()]
-        # Se la query inizia con (numero.) rimuovilo
-        queries = [q[2:].strip() if q and len(q) > 1 and q[0].isdigit() and q[1] == '.' else q for q in queries]
 
-        # Gestisci il numero di query
-        if len(queries) < num_queries:
-            # Aggiungi keywords dirette se il modello ha generato meno query
-            additional_queries = [kw for kw, _ in keywords[:(num_queries-len(queries))]]
-            queries.extend(additional_queries)
-        elif len(queries) > num_queries:
-            queries = queries[:num_queries]
+class JsonQueriesStreamParser:
+    """Estrae le stringhe complete dell'array "queries" da una risposta JSON che sta ancora arrivando"""
+
+    _queries_array_pattern = re.compile(r'"queries"\s*:\s*\[')
+    _decoder = json.JSONDecoder()
+
+    def __init__(self):
+        self.buffer = ''
+        self.finished = False
+        self._position: Optional[int] = None
+
+    def feed(self, text: str) -> list[str]:
+        """Aggiunge un frammento della risposta e restituisce le query completate"""
+        self.buffer += text
+        if self._position is None:
+            match = self._queries_array_pattern.search(self.buffer)
+            if match is None:
+                return []
+            self._position = match.end()
+
+        queries = []
+        while not self.finished:
+            while self._position < len(self.buffer) and self.buffer[self._position] in ' \t\r\n,':
+                self._position += 1
+            if self._position >= len(self.buffer):
+                break
+            if self.buffer[self._position] == ']':
+                self.finished = True
+                break
+            if self.buffer[self._position] != '"':
+                raise InvalidQueriesOutputError(f"Unexpected output in 'queries': {self.buffer[self._position:][:50]!r}")
+            try:
+                query, self._position = self._decoder.raw_decode(self.buffer, self._position)
+            except json.JSONDecodeError:
+                break  # Stringa non ancora completa
+            queries.append(validate_generated_query(query))
         return queries
 
+
+def _generate_queries_single(keywords, num_queries=3, query_language='it') -> list[str]:
+    """Genera le query di un singolo documento, senza completarle con le keywords"""
+    start = time.monotonic()
+    generated_response = None
+    try:
+        if OLLAMA_QUERY_OUTPUT_MODE == 'json':
+            generated_response = ollama_gateway.generate(prompt=build_queries_json_prompt(keywords, num_queries, query_language),
+                                                         model=ollama_model_name, format=build_queries_json_schema(num_queries),
+                                                         options=get_queries_json_options(num_queries), keep_alive=OLLAMA_KEEP_ALIVE_SECONDS)
+            queries = parse_queries_json(generated_response.response, num_queries)
+        else:
+            prompt = build_queries_prompt(keywords, num_queries, query_language)
+            generated_response = ollama_gateway.generate(prompt=prompt, model=ollama_model_name, keep_alive=OLLAMA_KEEP_ALIVE_SECONDS)
+            generated_text = generated_response.response
+
+            # Dividi il testo in righe e pulisci
+            queries = [clean_generated_query(line) for line in generated_text.split('\n')]
+            queries = [q for q in queries if q][:num_queries]
+    except InvalidQueriesOutputError:
+        generation_stats.record(OLLAMA_QUERY_OUTPUT_MODE, time.monotonic() - start, generated_response, failed=True)
+        raise
+    generation_stats.record(OLLAMA_QUERY_OUTPUT_MODE, time.monotonic() - start, generated_response)
+    return queries
+
+
+def build_batch_queries_prompt(requests) -> str:
+    """Prepara un unico prompt per più documenti, chiedendo una risposta JSON con le query di ciascuno"""
+    documents = '\n'.join(
+        f"    Documento {index}: {request.num_queries} query nella lingua con iso-code {request.query_language}, "
+        f"parole chiave: {', '.join(kw for kw, _ in request.keywords)}"
+        for index, request in enumerate(requests, start=1))
+    return f"""
+    Genera query di ricerca per YouTube per trovare video educativi per ciascuno dei seguenti documenti,
+    basate sulle parole chiave estratte dai loro appunti di studio:
+{documents}
+    
+    Ogni query deve:
+    - Essere strutturata per massimizzare la rilevanza dei risultati su YouTube
+    - Includere le parole chiave più importanti del proprio documento
+    - Essere comprensibile anche senza contesto
+    - Mantenere una lunghezza ragionevole (3-7 parole)
+    - Essere scritta nella lingua indicata per il proprio documento
+    
+    Restituisci SOLO un oggetto JSON con questa struttura, un elemento per ogni documento:
+    {{"results": [{{"id": 1, "queries": ["query", "query"]}}, {{"id": 2, "queries": ["query"]}}]}}
+    """
+
+
+def parse_batch_queries_response(response_text: str, requests) -> list[Optional[list[str]]]:
+    """
+    Estrae dalla risposta JSON le query di ogni documento, nell'ordine delle richieste.
+    Un documento mancante o con query non valide ha None, e verrà generato con una chiamata separata.
+    """
+    try:
+        results = json.loads(response_text)['results']
+        queries_by_id = {int(result['id']): result['queries'] for result in results}
+    except (ValueError, KeyError, TypeError) as e:
+        logger.error(f"Could not parse batched queries response: {e}")
+        return [None] * len(requests)
+
+    parsed = []
+    for index, request in enumerate(requests, start=1):
+        queries = queries_by_id.get(index)
+        if not isinstance(queries, list) or not all(isinstance(q, str) for q in queries):
+            parsed.append(None)
+            continue
+        queries = [clean_generated_query(q) for q in queries]
+        queries = [q for q in queries if q][:request.num_queries]
+        parsed.append(queries or None)
+    return parsed
+
+
+@dataclass
+class _BatchedRequest:
+    keywords: list
+    num_queries: int
+    query_language: str
+    done: threading.Event = field(default_factory=threading.Event)
+    queries: Optional[list[str]] = None
+    error: Optional[Exception] = None
+
+
+class QueryGenerationBatcher:
+    """
+    Raggruppa le richieste di generazione che arrivano entro `window_seconds` dalla prima (al massimo
+    `max_batch_size`) e le invia ad Ollama come un unico prompt strutturato, dividendo poi la risposta JSON
+    tra i chiamanti. Le richieste di cui non si riesce a leggere la risposta vengono rigenerate con una
+    chiamata separata dal proprio chiamante; un errore della chiamata raggruppata viene propagato a tutti.
+    """
+
+    def __init__(self, window_seconds: float, max_batch_size: int):
+        self.window_seconds = window_seconds
+        self.max_batch_size = max(1, max_batch_size)
+        self._lock = threading.Lock()
+        self._pending: list[_BatchedRequest] = []
+        self._timer: Optional[threading.Timer] = None
+        self.batches = 0
+        self.batched_requests = 0
+        self.parse_failures = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.window_seconds > 0 and self.max_batch_size > 1
+
+    def generate(self, keywords, num_queries=3, query_language='it') -> list[str]:
+        """Genera le query di un documento insieme a quelle delle altre richieste arrivate nella stessa finestra"""
+        request = _BatchedRequest(keywords, num_queries, query_language)
+        with self._lock:
+            self._pending.append(request)
+            if len(self._pending) >= self.max_batch_size:
+                self._start_batch()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.window_seconds, self._flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        if request.queries is None:
+            return _generate_queries_single(keywords, num_queries, query_language)
+        return request.queries
+
+    def _flush(self):
+        with self._lock:
+            if self._pending:
+                self._start_batch()
+
+    def _start_batch(self):
+        """Da chiamare con il lock acquisito: avvia la generazione delle richieste in attesa in un thread dedicato"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        threading.Thread(target=self._run_batch, args=(batch,), name="ollama-query-batch", daemon=True).start()
+
+    def _run_batch(self, batch: list[_BatchedRequest]):
+        try:
+            if len(batch) == 1:
+                request = batch[0]
+                request.queries = _generate_queries_single(request.keywords, request.num_queries, request.query_language)
+                return
+            start = time.monotonic()
+            response = ollama_gateway.generate(prompt=build_batch_queries_prompt(batch), model=ollama_model_name,
+                                               format='json', keep_alive=OLLAMA_KEEP_ALIVE_SECONDS)
+            parsed = parse_batch_queries_response(response.response, batch)
+            generation_stats.record('batch', time.monotonic() - start, response,
+                                    failed=any(queries is None for queries in parsed))
+            for request, queries in zip(batch, parsed):
+                request.queries = queries
+            with self._lock:
+                self.batches += 1
+                self.batched_requests += len(batch)
+                self.parse_failures += sum(1 for queries in parsed if queries is None)
+            logger.info(f"Generated queries for a batch of {len(batch)} requests")
+        except Exception as e:
+            logger.error(f"Error generating batched search queries: {e}, model: {ollama_model_name}")
+            for request in batch:
+                request.error = e
+        finally:
+            for request in batch:
+                request.done.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'window_seconds': self.window_seconds,
+                'max_batch_size': self.max_batch_size,
+                'pending': len(self._pending),
+                'batches': self.batches,
+                'batched_requests': self.batched_requests,
+                'avg_batch_size': round(self.batched_requests / self.batches, 2) if self.batches else 0.0,
+                'parse_failures': self.parse_failures,
+            }
+
+
+query_batcher = QueryGenerationBatcher(window_seconds=OLLAMA_BATCH_WINDOW_MS / 1000,
+                                       max_batch_size=OLLAMA_BATCH_MAX_SIZE)
+
+
+def generate_queries(keywords, num_queries=3, query_language='it') -> list[str]:
+    """
+    Genera le query di un documento, raggruppandola con le richieste contemporanee se il micro-batching è
+    attivo. Non completa le query con le keywords e propaga gli errori.
+    """
+    if query_batcher.enabled:
+        return query_batcher.generate(keywords, num_queries, query_language)
+    return _generate_queries_single(keywords, num_queries, query_language)
+
+
+def generate_search_queries_stream(keywords, num_queries=3, query_language='it') -> Iterator[str]:
+    """
+    Genera le query come `generate_search_queries`, ma consumando lo stream di token di Ollama: ogni query
+    viene restituita appena la sua riga è completa, così il chiamante può avviarne la ricerca mentre il
+    modello scrive le successive.
+
+    Restituisce al massimo `num_queries` query, senza completarle con le keywords (vedi `complete_queries`);
+    gli errori vengono propagati al chiamante, che può proseguire con le query già ricevute.
+    Con il micro-batching attivo le query arrivano tutte insieme, al termine della generazione del batch.
+    """
+    if query_batcher.enabled:
+        yield from query_batcher.generate(keywords, num_queries, query_language)
+        return
+
+    json_mode = OLLAMA_QUERY_OUTPUT_MODE == 'json'
+    if json_mode:
+        response_stream = ollama_gateway.generate_stream(prompt=build_queries_json_prompt(keywords, num_queries, query_language),
+                                                         model=ollama_model_name, format=build_queries_json_schema(num_queries),
+                                                         options=get_queries_json_options(num_queries), keep_alive=OLLAMA_KEEP_ALIVE_SECONDS)
+        json_parser = JsonQueriesStreamParser()
+    else:
+        prompt = build_queries_prompt(keywords, num_queries, query_language)
+        response_stream = ollama_gateway.generate_stream(prompt=prompt, model=ollama_model_name, keep_alive=OLLAMA_KEEP_ALIVE_SECONDS)
+    start = time.monotonic()
+    final_chunk = None
+    generated_count = 0
+    buffer = ''
+    try:
+        for chunk in response_stream:
+            if chunk.done:
+                final_chunk = chunk
+            if json_mode:
+                queries = json_parser.feed(chunk.response)
+            else:
+                buffer += chunk.response
+                *completed_lines, buffer = buffer.split('\n')
+                queries = [clean_generated_query(line) for line in completed_lines]
+            for query in queries:
+                if not query:
+                    continue
+                yield query
+                generated_count += 1
+                if generated_count >= num_queries:
+                    # Le righe successive non servono: la generazione viene interrotta
+                    generation_stats.record(OLLAMA_QUERY_OUTPUT_MODE, time.monotonic() - start, final_chunk)
+                    return
+        if json_mode:
+            # Risposta terminata: deve essere un JSON completo e valido
+            parse_queries_json(json_parser.buffer, num_queries)
+        else:
+            query = clean_generated_query(buffer)
+            if query:
+                yield query
+    except InvalidQueriesOutputError:
+        generation_stats.record(OLLAMA_QUERY_OUTPUT_MODE, time.monotonic() - start, final_chunk, failed=True)
+        raise
+    else:
+        generation_stats.record(OLLAMA_QUERY_OUTPUT_MODE, time.monotonic() - start, final_chunk)
+    finally:
+        # Chiude la connessione con Ollama anche se il chiamante smette di leggere prima della fine
+        response_stream.close()
+
+
+def generate_search_queries(keywords, num_queries=3, query_language='it', fallback_on_error=True):
+    """
+    Genera query di ricerca usando un modello AI locale di Ollama basate su keywords estratte.
+
+    :param keywords: Lista di tuple (keyword, score)
+    :param num_queries: Numero di query da generare
+    :param query_language: Lingua della query (default 'it' per italiano)
+    :param fallback_on_error: Se True, in caso di errore restituisce le query di ripiego invece di sollevare l'eccezione
+
+    Returns:
+        Lista di query ottimizzate per la ricerca YouTube
+    """
+    try:
+        queries = generate_queries(keywords, num_queries, query_language)
+
+        # Gestisci il numero di query
+        return complete_queries(queries, keywords, num_queries)
+
     except Exception as e:
         logger.error(f"Error generating search queries: {e}, ollama_url: {OLLAMA_API_URL}, model: {ollama_model_name}")
+        if not fallback_on_error:
+            raise
         # Fallback all'approccio semplice in caso di errore
-        fallback_queries = []
-        for keyword, _ in keywords[:num_queries]:
-            fallback_queries.append(f"{keyword}")
-        return fallback_queries
\ No newline at end of file
+        return build_fallback_queries(keywords, num_queries)
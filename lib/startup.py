@@ -0,0 +1,134 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+import nltk
+from lib.app_logger import logger
+
+NLTK_DATA_DIR = os.environ.get("NLTK_DATA_DIR", "static/nltk_data")  # Dati NLTK inclusi nell'immagine o pre-installati
+NLTK_ALLOW_DOWNLOAD = os.environ.get("NLTK_ALLOW_DOWNLOAD", "True").lower() == "true"
+NLTK_DOWNLOAD_TIMEOUT_SECONDS = float(os.environ.get("NLTK_DOWNLOAD_TIMEOUT_SECONDS", "20"))
+
+# Risorse NLTK necessarie: nome del pacchetto -> percorso cercato da nltk.data.find
+NLTK_RESOURCES = {
+    'punkt_tab': 'tokenizers/punkt_tab',
+    'stopwords': 'corpora/stopwords',
+}
+
+_startup_started_at = datetime.now(timezone.utc)
+_startup_monotonic_start = time.monotonic()
+_startup_completed_seconds = None
+_startup_steps: list[dict] = []
+_startup_lock = threading.Lock()
+
+_nltk_resources_status: dict[str, str] = {}
+_nltk_lock = threading.Lock()
+
+if os.path.abspath(NLTK_DATA_DIR) not in [os.path.abspath(path) for path in nltk.data.path]:
+    nltk.data.path.insert(0, NLTK_DATA_DIR)
+
+
+@contextmanager
+def startup_step(name: str):
+    """Misura la durata di una fase dell'avvio del worker e la aggiunge al report di avvio"""
+    step_start = time.perf_counter()
+    success = True
+    try:
+        yield
+    except Exception:
+        success = False
+        raise
+    finally:
+        with _startup_lock:
+            _startup_steps.append({'name': name, 'seconds': round(time.perf_counter() - step_start, 4),
+                                   'success': success})
+
+
+def mark_startup_complete():
+    """Registra la fine dell'avvio del worker e scrive il report nel log"""
+    global _startup_completed_seconds
+    with _startup_lock:
+        _startup_completed_seconds = round(time.monotonic() - _startup_monotonic_start, 4)
+    logger.info(f"Worker startup completed: {get_startup_report()}")
+
+
+def get_startup_report() -> dict:
+    """Restituisce durata totale dell'avvio, durata delle singole fasi e stato delle risorse NLTK"""
+    with _startup_lock:
+        steps = list(_startup_steps)
+        completed_seconds = _startup_completed_seconds
+    with _nltk_lock:
+        nltk_resources = dict(_nltk_resources_status)
+    return {
+        'pid': os.getpid(),
+        'started_at': _startup_started_at.isoformat(),
+        'ready': completed_seconds is not None,
+        'boot_seconds': completed_seconds,
+        'steps': steps,
+        'nltk_resources': nltk_resources,
+    }
+
+
+def _is_nltk_resource_available(resource_path: str) -> bool:
+    try:
+        nltk.data.find(resource_path)
+        return True
+    except LookupError:
+        return False
+
+
+def _download_nltk_resource(package: str) -> bool:
+    """Scarica una risorsa NLTK in NLTK_DATA_DIR, rinunciando se non termina entro il timeout"""
+    result = {'success': False}
+
+    def download():
+        try:
+            result['success'] = nltk.download(package, download_dir=NLTK_DATA_DIR, quiet=True, raise_on_error=True)
+        except Exception as e:
+            logger.error(f"Error downloading NLTK resource '{package}': {e}")
+
+    os.makedirs(NLTK_DATA_DIR, exist_ok=True)
+    download_thread = threading.Thread(target=download, name=f"nltk-download-{package}", daemon=True)
+    download_thread.start()
+    download_thread.join(NLTK_DOWNLOAD_TIMEOUT_SECONDS)
+    if download_thread.is_alive():
+        logger.error(f"Download of NLTK resource '{package}' did not finish in {NLTK_DOWNLOAD_TIMEOUT_SECONDS}s")
+        return False
+    return bool(result['success'])
+
+
+def probe_nltk_resources() -> dict[str, str]:
+    """Verifica di nuovo, senza scaricare nulla, quali risorse NLTK sono disponibili: 'available' oppure 'missing'"""
+    return {package: 'available' if _is_nltk_resource_available(resource_path) else 'missing'
+            for package, resource_path in NLTK_RESOURCES.items()}
+
+
+def ensure_nltk_resources() -> dict[str, str]:
+    """
+    Verifica, una sola volta per processo, che le risorse NLTK siano disponibili localmente.
+
+    Le risorse vengono cercate in NLTK_DATA_DIR e nei percorsi standard di NLTK; solo quelle mancanti vengono
+    scaricate, se NLTK_ALLOW_DOWNLOAD lo consente. Senza rete l'applicazione continua a funzionare: le
+    funzioni che usano una risorsa mancante ricadono sul proprio comportamento di ripiego.
+
+    Returns:
+        Stato di ogni risorsa: 'available', 'downloaded' oppure 'missing'
+    """
+    with _nltk_lock:
+        if _nltk_resources_status:
+            return dict(_nltk_resources_status)
+
+        with startup_step('nltk_resources'):
+            for package, resource_path in NLTK_RESOURCES.items():
+                if _is_nltk_resource_available(resource_path):
+                    status = 'available'
+                elif NLTK_ALLOW_DOWNLOAD and _download_nltk_resource(package):
+                    status = 'downloaded'
+                else:
+                    status = 'missing'
+                    logger.warning(f"NLTK resource '{package}' is not available, NLTK_DATA_DIR={NLTK_DATA_DIR}")
+                _nltk_resources_status[package] = status
+
+        logger.info(f"NLTK resources: {_nltk_resources_status}")
+        return dict(_nltk_resources_status)
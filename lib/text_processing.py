@@ -1,12 +1,34 @@
+import hashlib
+import os
 import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import Optional, List
 import nltk
 from rake_nltk import Rake
 from yake import KeywordExtractor
-from langdetect import detect
+from langdetect import DetectorFactory, detect_langs
 from lib.app_logger import logger
+from lib.cache import create_cache
+from lib.startup import ensure_nltk_resources
+
+ensure_nltk_resources()
+LARGE_DOCUMENT_THRESHOLD_CHARS = int(os.environ.get("LARGE_DOCUMENT_THRESHOLD_CHARS", "60000"))  # Oltre questa lunghezza l'estrazione avviene per sezioni
+KEYWORD_SECTION_SIZE_CHARS = int(os.environ.get("KEYWORD_SECTION_SIZE_CHARS", "20000"))
+KEYWORD_MAX_SECTIONS = int(os.environ.get("KEYWORD_MAX_SECTIONS", "20"))  # Oltre questo numero le sezioni vengono campionate
+KEYWORD_SECTION_WORKERS = int(os.environ.get("KEYWORD_SECTION_WORKERS", "0"))  # Processi per l'estrazione delle sezioni, 0 = nel processo corrente
+KEYWORD_CANDIDATES_PER_SECTION_FACTOR = 2  # Candidati estratti per sezione, in multipli di top_n
+KEYWORD_RANK_FUSION_K = 60
+
+LANGUAGE_DETECTION_SAMPLE_CHARS = int(os.environ.get("LANGUAGE_DETECTION_SAMPLE_CHARS", "1000"))  # Caratteri per regione
+LANGUAGE_DETECTION_SAMPLE_REGIONS = int(os.environ.get("LANGUAGE_DETECTION_SAMPLE_REGIONS", "5"))  # Regioni campionate nel testo
+DEFAULT_LANGUAGE = 'en'
+
+# langdetect è probabilistico: con un seed fisso lo stesso testo produce sempre la stessa lingua
+DetectorFactory.seed = 0
+detected_language_cache = create_cache('detected_language', max_size=2048, ttl_seconds=60 * 60 * 24)
 
-nltk.download('punkt_tab')
-nltk.download('stopwords')
 nltk_stopwords_languages = {
     'ar': 'arabic',
     'az': 'azerbaijani',
@@ -34,6 +56,57 @@ nltk_stopwords_languages = {
 }
 
 
+# Registro per lingua di stopwords ed estrattori YAKE, costruiti una sola volta e condivisi tra i thread
+_stopwords_registry: dict[str, Optional[frozenset[str]]] = {}
+_yake_extractors_registry: dict[tuple, KeywordExtractor] = {}
+_registry_lock = threading.Lock()
+
+
+def get_stopwords(language: str) -> Optional[frozenset[str]]:
+    """
+    Restituisce le stopwords NLTK della lingua (codice ISO), costruite al primo utilizzo.
+    Restituisce None se le stopwords della lingua non sono disponibili.
+    """
+    with _registry_lock:
+        if language in _stopwords_registry:
+            return _stopwords_registry[language]
+
+    try:
+        stopwords_set = frozenset(nltk.corpus.stopwords.words(nltk_stopwords_languages.get(language)))
+    except Exception as e:
+        logger.error(f"Did not find stopword set for language {language} : {e}")
+        stopwords_set = None
+
+    with _registry_lock:
+        return _stopwords_registry.setdefault(language, stopwords_set)
+
+
+def get_yake_extractor(language: str, max_ngram_size: int, top_n: int,
+                       stopword_set: frozenset[str] = frozenset()) -> KeywordExtractor:
+    """
+    Restituisce l'estrattore YAKE configurato per lingua, dimensione degli n-grammi, numero di keywords e
+    stopwords, creandolo al primo utilizzo. KeywordExtractor non modifica il proprio stato durante
+    l'estrazione, quindi la stessa istanza può essere usata da più thread.
+    """
+    key = (language, max_ngram_size, top_n, stopword_set)
+    with _registry_lock:
+        extractor = _yake_extractors_registry.get(key)
+        if extractor is None:
+            extractor = KeywordExtractor(lan=language, n=max_ngram_size, top=top_n, stopwords=stopword_set)
+            _yake_extractors_registry[key] = extractor
+        return extractor
+
+
+def warm_up_keyword_extractors(max_ngram_size: int, top_n: int, languages=None):
+    """Costruisce in anticipo stopwords ed estrattori YAKE per le lingue indicate (default: tutte quelle note)"""
+    if languages is None:
+        languages = nltk_stopwords_languages.keys()
+    for language in languages:
+        stopwords_set = get_stopwords(language)
+        get_yake_extractor(language, max_ngram_size, top_n, stopwords_set or frozenset())
+    logger.info(f"Keyword extractors ready for languages: {list(languages)}")
+
+
 def preprocess_text(text):
     # Rimuovi caratteri speciali e numeri
     text = re.sub(r'[^\w\s]', ' ', text)
@@ -61,25 +134,205 @@ def extract_keywords_rake(text, top_n=10, n_word_range=(1, 4), language='italian
 
 
 def extract_keywords_yake(text, top_n=10, max_ngram_size=4, language='it', stopword_set=None):
-    if stopword_set is None:
-        stopword_set = {}
+    stopword_set = frozenset(stopword_set) if stopword_set else frozenset()
     try:
-        extractor = KeywordExtractor(lan=language, n=max_ngram_size, top=top_n, stopwords=stopword_set)
+        extractor = get_yake_extractor(language, max_ngram_size, top_n, stopword_set)
         keywords = extractor.extract_keywords(text)
         return keywords[:top_n]
     except Exception as e:
         logger.error(f"Error extracting keywords: {e}")
         return []
 
+def sample_text_regions(text: str, regions=LANGUAGE_DETECTION_SAMPLE_REGIONS,
+                        sample_chars=LANGUAGE_DETECTION_SAMPLE_CHARS) -> str:
+    """
+    Restituisce un campione del testo di al massimo `regions` * `sample_chars` caratteri, composto da porzioni
+    prese a intervalli regolari (inizio e fine incluse) e tagliate sugli spazi per non spezzare le parole.
+    """
+    if len(text) <= regions * sample_chars:
+        return text
+    if regions <= 1:
+        return text[:sample_chars]
+
+    samples = []
+    step = (len(text) - sample_chars) / (regions - 1)
+    for i in range(regions):
+        start = round(i * step)
+        end = start + sample_chars
+        if start > 0:
+            space = text.find(' ', start, end)
+            start = space + 1 if space != -1 else start
+        if end < len(text):
+            space = text.rfind(' ', start, end)
+            end = space if space > start else end
+        samples.append(text[start:end])
+    return '\n'.join(samples)
+
+
+def _detect_language_probabilities(text: str) -> tuple[str, float]:
+    """Lingua più probabile del campione del testo e la sua probabilità"""
+    best_language = detect_langs(sample_text_regions(text))[0]
+    return best_language.lang, best_language.prob
+
+
+def _detect_language_cached(text: str) -> tuple[str, float]:
+    """Come `_detect_language_probabilities`, con i risultati salvati nella cache per hash del contenuto"""
+    cache_key = hashlib.sha256(text.encode('utf-8')).hexdigest()
+    detected = detected_language_cache.get(cache_key)
+    if detected is None:
+        detected = _detect_language_probabilities(text)
+        detected_language_cache.set(cache_key, detected)
+    return detected
+
+
 def detect_language(text):
-    """Detect the language of the given text."""
+    """
+    Detect the language of the given text.
+
+    Only a bounded sample of the text is analyzed, with a fixed seed, and results are cached by content hash,
+    so the same text always gets the same language.
+    """
     try:
-        lang = detect(text)
-        logger.info(f"Detected language: {lang}")
-        return lang
+        lang, probability = _detect_language_cached(text)
     except Exception as e:
         logger.error(f"Language detection failed: {e}")
-        return 'en'
+        return DEFAULT_LANGUAGE
+
+    logger.info(f"Detected language: {lang} (probability {probability:.2f})")
+    return lang
+
+
+def detect_section_languages(sections: List[str]) -> List[dict]:
+    """
+    Rileva la lingua di ogni sezione del testo, per appunti scritti in più lingue. Come per `detect_language`
+    i risultati vengono salvati nella cache, così le sezioni già analizzate non vengono rilevate di nuovo.
+
+    Returns:
+        Per ogni sezione: indice, numero di caratteri, lingua e probabilità (lingua None se non rilevabile)
+    """
+    section_languages = []
+    for index, section in enumerate(sections):
+        try:
+            lang, probability = _detect_language_cached(section)
+        except Exception as e:
+            logger.warning(f"Language detection failed for section {index}: {e}")
+            lang, probability = None, 0.0
+        section_languages.append({'index': index, 'chars': len(section), 'language': lang,
+                                  'probability': round(probability, 4)})
+    return section_languages
+
+def _extract_section_keywords(text, top_n, n_word_range, algorithm, language):
+    """Estrae le keywords di un testo (o di una sua sezione) con l'algoritmo richiesto"""
+    stopwords_set = get_stopwords(language)
+    if algorithm == 'rake':
+        return extract_keywords_rake(text, top_n=top_n, n_word_range=n_word_range, language=language, stopwords_set=stopwords_set)
+    return extract_keywords_yake(text, top_n=top_n, max_ngram_size=n_word_range[1], language=language, stopword_set=stopwords_set)
+
+
+def split_text_into_sections(text: str, section_size=KEYWORD_SECTION_SIZE_CHARS) -> List[str]:
+    """
+    Divide il testo in sezioni di circa `section_size` caratteri, spezzandolo solo tra pagine (form feed) o
+    paragrafi; i paragrafi più lunghi di una sezione vengono spezzati sull'ultimo spazio disponibile.
+    """
+    sections = []
+    current_parts = []
+    current_size = 0
+    for paragraph in re.split(r'\f|\n\s*\n', text):
+        paragraph = paragraph.strip()
+        pieces = []
+        while len(paragraph) > section_size:
+            split_at = paragraph.rfind(' ', 0, section_size)
+            if split_at <= 0:
+                split_at = section_size
+            pieces.append(paragraph[:split_at])
+            paragraph = paragraph[split_at:].strip()
+        if paragraph:
+            pieces.append(paragraph)
+
+        for piece in pieces:
+            if current_size + len(piece) > section_size and current_parts:
+                sections.append('\n\n'.join(current_parts))
+                current_parts = []
+                current_size = 0
+            current_parts.append(piece)
+            current_size += len(piece) + 2
+    if current_parts:
+        sections.append('\n\n'.join(current_parts))
+    return sections
+
+
+def sample_sections(sections: List[str], max_sections=KEYWORD_MAX_SECTIONS) -> List[str]:
+    """Se le sezioni sono troppe ne sceglie `max_sections` distribuite uniformemente, prima e ultima incluse"""
+    if len(sections) <= max_sections:
+        return sections
+    if max_sections <= 1:
+        return sections[:1]
+    step = (len(sections) - 1) / (max_sections - 1)
+    return [sections[round(i * step)] for i in range(max_sections)]
+
+
+def merge_section_keywords(sections_keywords: List[List[tuple[str, float]]], top_n=10, algorithm='yake') -> List[tuple[str, float]]:
+    """
+    Unisce le keywords estratte dalle singole sezioni in un'unica classifica.
+
+    I punteggi di sezioni diverse non sono confrontabili, quindi le classifiche vengono combinate per posizione
+    (reciprocal rank fusion): ogni sezione assegna 1 / (60 + posizione) alle proprie keywords, e le keywords
+    ricorrenti in molte sezioni risultano favorite. Il punteggio restituito segue la convenzione
+    dell'algoritmo: più basso = più rilevante per YAKE, più alto = più rilevante per RAKE.
+    """
+    fused_scores: dict[str, float] = {}
+    display_keywords: dict[str, str] = {}
+    for section_keywords in sections_keywords:
+        for rank, (keyword, _) in enumerate(section_keywords, start=1):
+            key = keyword.casefold()
+            fused_scores[key] = fused_scores.get(key, 0.0) + 1 / (KEYWORD_RANK_FUSION_K + rank)
+            display_keywords.setdefault(key, keyword)
+
+    ranked_keys = sorted(fused_scores, key=fused_scores.get, reverse=True)[:top_n]
+    if algorithm == 'rake':
+        return [(display_keywords[key], fused_scores[key]) for key in ranked_keys]
+    return [(display_keywords[key], 1 / fused_scores[key]) for key in ranked_keys]
+
+
+_keyword_executor: Optional[ProcessPoolExecutor] = None
+_keyword_executor_lock = threading.Lock()
+
+
+def _get_keyword_executor() -> Optional[ProcessPoolExecutor]:
+    global _keyword_executor
+    if KEYWORD_SECTION_WORKERS <= 1:
+        return None
+    with _keyword_executor_lock:
+        if _keyword_executor is None:
+            _keyword_executor = ProcessPoolExecutor(max_workers=KEYWORD_SECTION_WORKERS)
+        return _keyword_executor
+
+
+def extract_keywords_by_sections(text, top_n=10, n_word_range=(1, 4), algorithm='yake', language='it',
+                                 section_size=KEYWORD_SECTION_SIZE_CHARS, max_sections=KEYWORD_MAX_SECTIONS):
+    """
+    Estrazione per documenti molto grandi: il testo viene diviso in sezioni (campionate se troppe), da ogni
+    sezione vengono estratti i candidati migliori e i punteggi vengono uniti in una classifica globale.
+    Tempo e memoria dipendono dalla dimensione delle sezioni e non da quella del documento.
+    """
+    sections = sample_sections(split_text_into_sections(text, section_size), max_sections)
+    candidates_per_section = top_n * KEYWORD_CANDIDATES_PER_SECTION_FACTOR
+    # Ogni sezione usa le stopwords della propria lingua, per gli appunti scritti in più lingue
+    sections_languages = [section_language['language'] or language
+                          for section_language in detect_section_languages(sections)]
+    logger.info(f"Extracting keywords from {len(sections)} sections of a {len(text)} characters document, "
+                f"section languages: {sections_languages}")
+
+    executor = _get_keyword_executor()
+    if executor is not None and len(sections) > 1:
+        sections_keywords = list(executor.map(_extract_section_keywords, sections, repeat(candidates_per_section),
+                                              repeat(n_word_range), repeat(algorithm), sections_languages))
+    else:
+        sections_keywords = [_extract_section_keywords(section, candidates_per_section, n_word_range, algorithm, section_language)
+                             for section, section_language in zip(sections, sections_languages)]
+
+    return merge_section_keywords(sections_keywords, top_n, algorithm)
+
 
 def extract_keywords(text, top_n=10, n_word_range=(1, 4), algorithm='rake', language=None):
     if language is None:
@@ -87,20 +340,13 @@ def extract_keywords(text, top_n=10, n_word_range=(1, 4), algorithm='rake', lang
     else:
         detected_lang = language
 
-    try:
-        nltk_stopwords = nltk.corpus.stopwords.words(nltk_stopwords_languages.get(detected_lang))
-        stopwords_set = set(nltk_stopwords)
-    except Exception as e:
-        logger.error(f"Did not find stopword set for language {detected_lang} : {e}")
-        stopwords_set = None
-
-
-    if algorithm == 'rake':
-        keywords = extract_keywords_rake(text, top_n=top_n, n_word_range=n_word_range, language=detected_lang, stopwords_set=stopwords_set)
-    elif algorithm == 'yake':
-        keywords = extract_keywords_yake(text, top_n=top_n, max_ngram_size=n_word_range[1], language=detected_lang, stopword_set=stopwords_set)
-    else:
+    if algorithm not in ('rake', 'yake'):
         logger.error(f"Keyword extraction algorithm unknown: {algorithm}")
         return []
 
-    return keywords[:top_n]
\ No newline at end of file
+    if len(text) > LARGE_DOCUMENT_THRESHOLD_CHARS:
+        return extract_keywords_by_sections(text, top_n=top_n, n_word_range=n_word_range, algorithm=algorithm,
+                                            language=detected_lang)
+
+    keywords = _extract_section_keywords(text, top_n, n_word_range, algorithm, detected_lang)
+    return keywords[:top_n]
@@ -2,18 +2,21 @@ import json
 from dataclasses import dataclass
 from enum import Enum
 from typing import List
-from lib.youtube_interactions import Video
+from lib.youtube_interactions import VideoPartialData
 
 
 class StreamProcessStatus(Enum):
     ERROR = 'error'
     FILE_RECEIVED = 'file_received'
+    FILE_PAGE_PROCESSED = 'file_page_processed'
     FILE_PROCESSED = 'file_processed'
+    PARTIAL_KEYWORDS_EXTRACTED = 'partial_keywords_extracted'
     EXTRACTING_KEYWORDS = 'extracting_keywords'
     KEYWORDS_EXTRACTED = 'keywords_extracted'
     GENERATING_QUERIES = 'generating_queries'
     QUERIES_GENERATED = 'queries_generated'
     YOUTUBE_SEARCH_STARTED = 'youtube_search_started'
+    YOUTUBE_QUERY_COMPLETED = 'youtube_query_completed'
     YOUTUBE_SEARCH_COMPLETED = 'youtube_search_completed'
     PROCESSING_COMPLETE = 'processing_complete'
 
@@ -25,10 +28,13 @@ class StreamResponse:
     message: str = ""
     keywords: list[str] = None
     queries: list[str] = None
-    videos: List[Video] = None
+    videos: List[VideoPartialData] = None
+    progress: dict = None
+    error_code: str = None
 
     def __init__(self, status: StreamProcessStatus, message: str = "", keywords: list[tuple[str, float]] = None,
-                 queries: list[str] = None, videos: list[Video] = None, **kwargs):
+                 queries: list[str] = None, videos: list[VideoPartialData] = None, progress: dict = None,
+                 error_code: str = None, **kwargs):
         if keywords is None:
             keywords = []
         if queries is None:
@@ -41,6 +47,8 @@ class StreamResponse:
         self.keywords = [kw for kw, _ in keywords]
         self.queries = queries
         self.videos = videos
+        self.progress = progress
+        self.error_code = error_code
 
         if status is StreamProcessStatus.ERROR and not message:
             raise ValueError("Stream Response Error status requires a message")
@@ -52,13 +60,18 @@ class StreamResponse:
         """
         Converts the StreamResponse object to a dictionary.
         """
-        return {
+        response_dict = {
             "status": self.status,
             "message": self.message,
             "keywords": self.keywords,
             "queries": self.queries,
             "videos": [video.to_dict() for video in self.videos] if self.videos else []
         }
+        if self.progress is not None:
+            response_dict["progress"] = self.progress
+        if self.error_code is not None:
+            response_dict["error_code"] = self.error_code
+        return response_dict
 
     def to_json(self) -> str:
         return json.dumps(self.to_dict()) + '\n'
\ No newline at end of file
@@ -33,6 +33,19 @@ class VideoPartialData:
 
         return Thumbnail.from_dict(self.thumbnails.to_dict()[definition]).url
 
+    def to_dict(self) -> dict:
+        """
+        Converts the partial video data to a dictionary.
+        """
+        return {
+            "title": self.title,
+            "description": self.description,
+            "video_id": self.video_id,
+            "url": self.url,
+            "channel_id": self.channel_id,
+            "thumbnails": self.thumbnails.to_dict(),
+        }
+
 
 @dataclass
 class Video(VideoPartialData):
@@ -42,6 +55,27 @@ class Video(VideoPartialData):
     engagement_score: float = 0.0
     relevance_score: float = 0.0
 
+    @classmethod
+    def from_dict(cls, json_dict: dict) -> 'Video':
+        """
+        Crea un oggetto Video da un dizionario prodotto da `to_dict`.
+        """
+        thumbnails_dict = {definition: thumbnail for definition, thumbnail in json_dict.get('thumbnails', {}).items()
+                           if thumbnail}
+        return cls(
+            title=json_dict.get('title', ''),
+            description=json_dict.get('description', ''),
+            video_id=json_dict.get('video_id', ''),
+            url=json_dict.get('url', ''),
+            channel_id=json_dict.get('channel_id', ''),
+            thumbnails=Thumbnails.from_dict(thumbnails_dict),
+            channel_subscribers=json_dict.get('channel_subscribers', 0),
+            like_count=json_dict.get('like_count', 0),
+            view_count=json_dict.get('view_count', 0),
+            engagement_score=json_dict.get('engagement_score', 0.0),
+            relevance_score=json_dict.get('relevance_score', 0.0)
+        )
+
     def to_dict(self) -> dict:
         """
         Converts the Video object to a dictionary.
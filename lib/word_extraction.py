@@ -1,29 +1,432 @@
 import PyPDF2
 import io
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator, List, Optional, Union
 import pytesseract
-from PIL import Image
+from PIL import Image, ImageChops, ImageDraw, ImageFilter, ImageOps
 from docx import Document
 from lib.app_logger import logger
+from lib.text_processing import detect_language
 from werkzeug.datastructures import FileStorage
 
+PDF_PAGE_SEPARATOR = '\f'
+
+OCR_WORKERS = int(os.environ.get("OCR_WORKERS", str(os.cpu_count() or 1)))  # Processi per l'OCR, 0 o 1 = nel processo corrente
+OCR_TASK_TIMEOUT_SECONDS = float(os.environ.get("OCR_TASK_TIMEOUT_SECONDS", "120"))  # Tempo massimo per l'OCR di una striscia
+OCR_TILE_HEIGHT_PX = int(os.environ.get("OCR_TILE_HEIGHT_PX", "1500"))  # Le immagini più alte vengono divise in strisce
+OCR_DEFAULT_LANGUAGE = os.environ.get("OCR_DEFAULT_LANGUAGE", "ita")
+OCR_DETECTION_LANGUAGES = os.environ.get("OCR_DETECTION_LANGUAGES", "ita+eng")  # Lingue del passaggio di rilevamento
+OCR_DETECTION_SAMPLE_WIDTH_PX = 1000
+OCR_DETECTION_MIN_CHARS = 40
+OCR_MIN_PAGE_TEXT_CHARS = 20  # Pagine PDF con meno testo estraibile vengono considerate scansioni
+OCR_MIN_IMAGE_PAGE_COVERAGE = 0.5  # Di una scansione si leggono solo le immagini che coprono almeno questa frazione della pagina
+
+OCR_PREPROCESS = os.environ.get("OCR_PREPROCESS", "True").lower() == "true"  # Preparazione delle immagini caricate prima dell'OCR
+OCR_TARGET_DPI = int(os.environ.get("OCR_TARGET_DPI", "300"))  # Le immagini con risoluzione maggiore vengono ridotte
+OCR_DESKEW_MAX_ANGLE = float(os.environ.get("OCR_DESKEW_MAX_ANGLE", "5"))  # Massima inclinazione corretta, in gradi
+OCR_DESKEW_STEP_DEGREES = 0.5
+OCR_DESKEW_SAMPLE_WIDTH_PX = 800
+# Senza DPI affidabili nei metadati (le foto dichiarano spesso 72 DPI) si assume che il lato corto sia un foglio A4
+OCR_ASSUMED_PAGE_SHORT_SIDE_INCHES = 8.27
+OCR_CROP_PADDING_PX = 20
+OCR_CROP_SAMPLE_WIDTH_PX = 400
+
+# Da incrementare quando il testo estratto da uno stesso file cambia (nuova logica di estrazione o di OCR),
+# così che la cache del testo estratto non restituisca i risultati della versione precedente
+TEXT_EXTRACTOR_VERSION = 3
+
+# Codici ISO 639-1 di langdetect -> pacchetti di lingua di tesseract
+TESSERACT_LANGUAGES = {'it': 'ita', 'en': 'eng', 'fr': 'fra', 'de': 'deu', 'es': 'spa', 'pt': 'por', 'nl': 'nld'}
+
+_ocr_executor: Optional[ProcessPoolExecutor] = None
+_ocr_executor_lock = threading.Lock()
+_installed_ocr_languages: Optional[set[str]] = None
+
+
+def get_text_extraction_config() -> tuple:
+    """Versione dell'estrattore e configurazione da cui dipende il testo estratto, per la chiave di cache"""
+    return (TEXT_EXTRACTOR_VERSION, OCR_PREPROCESS, OCR_TARGET_DPI, OCR_DESKEW_MAX_ANGLE, OCR_MIN_PAGE_TEXT_CHARS,
+            OCR_MIN_IMAGE_PAGE_COVERAGE, OCR_TILE_HEIGHT_PX, OCR_DETECTION_LANGUAGES, OCR_DEFAULT_LANGUAGE, pytesseract.pytesseract.tesseract_cmd)
+
 
 def extract_text_from_txt(txt_file):
     with open(txt_file, 'r', encoding='utf-8') as f:
         text = f.read()
     return text
 
-def extract_text_from_pdf(pdf_file):
+
+def _get_ocr_executor() -> Optional[ProcessPoolExecutor]:
+    global _ocr_executor
+    if OCR_WORKERS <= 1:
+        return None
+    with _ocr_executor_lock:
+        if _ocr_executor is None:
+            _ocr_executor = ProcessPoolExecutor(max_workers=OCR_WORKERS)
+        return _ocr_executor
+
+
+def shutdown_ocr_executor():
+    """Termina i processi del pool OCR, annullando le strisce ancora in coda"""
+    global _ocr_executor
+    with _ocr_executor_lock:
+        executor, _ocr_executor = _ocr_executor, None
+    if executor is not None:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _get_installed_ocr_languages() -> set[str]:
+    global _installed_ocr_languages
+    if _installed_ocr_languages is None:
+        try:
+            _installed_ocr_languages = set(pytesseract.get_languages(config=''))
+        except Exception as e:
+            logger.error(f"Could not list the installed tesseract languages: {e}")
+            _installed_ocr_languages = set()
+    return _installed_ocr_languages
+
+
+def _ocr_image(image: Image.Image, language: str) -> str:
+    """Eseguita nei processi del pool OCR"""
+    return pytesseract.image_to_string(image, lang=language)
+
+
+def find_tile_boundaries(image: Image.Image, tile_height=OCR_TILE_HEIGHT_PX) -> List[int]:
+    """
+    Righe in cui dividere l'immagine in strisce alte circa `tile_height` pixel. Ogni taglio viene spostato sulla
+    riga più chiara nelle vicinanze, cioè tra due righe di testo, così nessuna riga viene tagliata a metà.
+    """
+    width, height = image.size
+    if height <= tile_height * 1.5:
+        return [0, height]
+    # Luminosità media di ogni riga, calcolata da Pillow riducendo l'immagine ad una sola colonna
+    row_brightness = list(image.convert('L').resize((1, height), Image.BOX).getdata())
+    search_radius = tile_height // 8
+    boundaries = [0]
+    target = tile_height
+    while target < height - tile_height // 2:
+        window = range(max(boundaries[-1] + 1, target - search_radius), min(height - 1, target + search_radius))
+        boundary = max(window, key=lambda row: row_brightness[row]) if len(window) else target
+        boundaries.append(boundary)
+        target = boundary + tile_height
+    boundaries.append(height)
+    return boundaries
+
+
+def split_image_into_tiles(image: Image.Image, tile_height=OCR_TILE_HEIGHT_PX) -> List[Image.Image]:
+    boundaries = find_tile_boundaries(image, tile_height)
+    return [image.crop((0, top, image.width, bottom)) for top, bottom in zip(boundaries, boundaries[1:])]
+
+
+def choose_ocr_language(image: Image.Image) -> str:
+    """
+    Sceglie il pacchetto di lingua di tesseract con un passaggio rapido: l'OCR di una porzione ridotta
+    dell'immagine con le lingue di OCR_DETECTION_LANGUAGES, seguito dal rilevamento della lingua del testo.
+    """
+    sample = image.crop((0, 0, image.width, min(image.height, image.width)))
+    sample.thumbnail((OCR_DETECTION_SAMPLE_WIDTH_PX, OCR_DETECTION_SAMPLE_WIDTH_PX))
+    try:
+        sample_text = _ocr_image(sample, OCR_DETECTION_LANGUAGES)
+        if len(sample_text.strip()) < OCR_DETECTION_MIN_CHARS:
+            return OCR_DEFAULT_LANGUAGE
+        language = TESSERACT_LANGUAGES.get(detect_language(sample_text))
+    except Exception as e:
+        logger.error(f"Error detecting the OCR language: {e}")
+        return OCR_DEFAULT_LANGUAGE
+    if language is None or language not in _get_installed_ocr_languages():
+        return OCR_DEFAULT_LANGUAGE
+    return language
+
+
+def submit_ocr(image: Image.Image, language: str) -> List[Future]:
+    """
+    Divide l'immagine in strisce e ne accoda l'OCR nel pool di processi, restituendo un future per striscia.
+    Senza pool l'OCR viene eseguito subito e i future restituiti sono già completati.
+    """
+    tiles = split_image_into_tiles(image.convert('L'))
+    executor = _get_ocr_executor()
+    if executor is not None:
+        return [executor.submit(_ocr_image, tile, language) for tile in tiles]
+    future = Future()
+    future.set_result('\n'.join(_ocr_image(tile, language) for tile in tiles))
+    return [future]
+
+
+def collect_ocr(futures: List[Future]) -> str:
+    try:
+        return '\n'.join(future.result(timeout=OCR_TASK_TIMEOUT_SECONDS) for future in futures).strip()
+    except BaseException:
+        # Le strisce ancora in coda non servono più e occuperebbero il pool OCR
+        for future in futures:
+            future.cancel()
+        raise
+
+
+def _extract_page_text(page) -> tuple[str, dict[str, float]]:
+    """
+    Testo della pagina e, per ogni immagine disegnata, la frazione della pagina che copre: l'immagine occupa il
+    quadrato unitario trasformato dalla matrice corrente (cm) nel momento in cui viene disegnata (operatore Do).
+    """
+    drawn_areas: dict[str, float] = {}
+
+    def record_drawn_area(operator, operands, cm_matrix, tm_matrix):
+        if operator == b'Do' and operands:
+            area = abs(cm_matrix[0] * cm_matrix[3] - cm_matrix[1] * cm_matrix[2])
+            drawn_areas[operands[0]] = max(drawn_areas.get(operands[0], 0.0), area)
+
+    page_text = page.extract_text(visitor_operand_before=record_drawn_area) or ''
+    page_area = abs(float(page.mediabox.width) * float(page.mediabox.height))
+    if not page_area:
+        return page_text, {}
+    return page_text, {name.lstrip('/'): area / page_area for name, area in drawn_areas.items()}
+
+
+def _get_page_images(page, page_coverage: Optional[dict[str, float]] = None) -> List[Image.Image]:
+    """
+    Immagini incorporate nella pagina che ne coprono almeno OCR_MIN_IMAGE_PAGE_COVERAGE, cioè le scansioni
+    dell'intera pagina e non loghi, icone o figure. Senza `page_coverage` vengono restituite tutte.
+    """
+    try:
+        return [Image.open(io.BytesIO(image_file.data)) for image_file in page.images
+                if page_coverage is None
+                or page_coverage.get(os.path.splitext(image_file.name)[0], 0.0) >= OCR_MIN_IMAGE_PAGE_COVERAGE]
+    except Exception as e:
+        logger.error(f"Could not read the images of a PDF page: {e}")
+        return []
+
+
+def iter_pdf_pages_text(pdf_file, first_page=0, last_page: Optional[int] = None) -> Iterator[tuple[int, int, str]]:
+    """
+    Estrae il testo del PDF una pagina alla volta, restituendo (indice della pagina, numero di pagine, testo).
+    Una pagina il cui testo non può essere estratto viene restituita vuota. `first_page` e `last_page` (esclusa)
+    limitano l'estrazione ad un intervallo di pagine.
+
+    Le pagine con poco testo e un'immagine che copre gran parte della pagina (scansioni) vengono lette anche con
+    l'OCR di queste immagini, il cui testo segue quello estratto dalla pagina. Le pagine vengono accodate nel
+    pool OCR fino a OCR_WORKERS * 2 pagine in anticipo e restituite nell'ordine originale. La lingua di
+    tesseract viene scelta sulla prima pagina scansionata.
+    """
     reader = PyPDF2.PdfReader(pdf_file)
-    text = ""
-    for page in reader.pages:
-        text += page.extract_text()
-    return text
+    total_pages = len(reader.pages)
+    lookahead = max(OCR_WORKERS, 1) * 2
+    ocr_language = None
+    pending: deque[tuple[int, Union[str, tuple[str, List[Future]]]]] = deque()
+
+    def resolve(page_index: int, page_result) -> str:
+        if isinstance(page_result, str):
+            return page_result
+        page_text, page_futures = page_result
+        try:
+            ocr_text = collect_ocr(page_futures)
+        except Exception as e:
+            logger.error(f"Error running OCR on PDF page {page_index + 1}/{total_pages}: {e}")
+            ocr_text = ''
+        return '\n'.join(text for text in (page_text.strip(), ocr_text) if text)
+
+    try:
+        for page_index in range(first_page, total_pages if last_page is None else min(last_page, total_pages)):
+            page = reader.pages[page_index]
+            try:
+                page_text, page_coverage = _extract_page_text(page)
+            except Exception as e:
+                logger.error(f"Error extracting text from PDF page {page_index + 1}/{total_pages}: {e}")
+                page_text, page_coverage = '', None
+
+            page_images = _get_page_images(page, page_coverage) if len(page_text.strip()) < OCR_MIN_PAGE_TEXT_CHARS else []
+            if page_images:
+                if ocr_language is None:
+                    ocr_language = choose_ocr_language(page_images[0])
+                    logger.info(f"Scanned PDF pages found, OCR language: {ocr_language}")
+                page_futures = []
+                for image in page_images:
+                    page_futures.extend(submit_ocr(image, ocr_language))
+                pending.append((page_index, (page_text, page_futures)))
+            else:
+                pending.append((page_index, page_text))
+
+            # Restituisce le pagine già pronte, attendendo la più vecchia solo se le pagine in anticipo sono troppe
+            while pending and (isinstance(pending[0][1], str) or all(f.done() for f in pending[0][1][1])
+                               or len(pending) > lookahead):
+                ready_index, ready_result = pending.popleft()
+                yield ready_index, total_pages, resolve(ready_index, ready_result)
+
+        while pending:
+            ready_index, ready_result = pending.popleft()
+            yield ready_index, total_pages, resolve(ready_index, ready_result)
+    finally:
+        # Se l'estrazione si interrompe (ad esempio per il timeout del task) l'OCR delle pagine in attesa non serve più
+        for _, page_result in pending:
+            if not isinstance(page_result, str):
+                for future in page_result[1]:
+                    future.cancel()
+
+
+def extract_pdf_pages_text(pdf_path: str, first_page=0, last_page: Optional[int] = None) -> tuple[int, List[str]]:
+    """
+    Numero di pagine del PDF e testi delle pagine da `first_page` a `last_page` (esclusa), per il pool della
+    pipeline: il PDF viene letto dal file, così ai processi del pool non viene inviato il contenuto del documento
+    """
+    total_pages = 0  # Resta 0 solo per un PDF senza pagine
+    page_texts = []
+    with open(pdf_path, 'rb') as pdf_file:
+        for _, total_pages, page_text in iter_pdf_pages_text(pdf_file, first_page, last_page):
+            page_texts.append(page_text)
+    return total_pages, page_texts
+
+
+def join_pdf_pages(page_texts: Iterable[str]) -> str:
+    """Unisce i testi delle pagine separandoli con un form feed, usato per dividere il testo in sezioni"""
+    return PDF_PAGE_SEPARATOR.join(page_texts)
+
+
+def extract_text_from_pdf(pdf_file):
+    return join_pdf_pages(page_text for _, _, page_text in iter_pdf_pages_text(pdf_file))
+
+
+@dataclass
+class PreprocessedImage:
+    """Immagine pronta per l'OCR, con i tempi di ogni passaggio della preparazione"""
+    image: Image.Image
+    original_size: tuple[int, int]
+    skew_angle: float = 0.0
+    steps_ms: dict[str, float] = field(default_factory=dict)
+
+
+def estimate_image_dpi(image: Image.Image) -> float:
+    """DPI dai metadati se plausibili per un foglio di carta, altrimenti stimati assumendo un foglio A4"""
+    short_side = min(image.size)
+    dpi = image.info.get('dpi')
+    if dpi and dpi[0]:
+        short_side_inches = short_side / float(dpi[0])
+        if 3 <= short_side_inches <= 17:
+            return float(dpi[0])
+    return short_side / OCR_ASSUMED_PAGE_SHORT_SIDE_INCHES
+
+
+def otsu_threshold(histogram: List[int]) -> int:
+    """Soglia che massimizza la varianza tra le due classi di pixel (metodo di Otsu)"""
+    total = sum(histogram)
+    weighted_total = sum(value * count for value, count in enumerate(histogram))
+    background_count = background_weighted = 0
+    best_threshold, best_variance = 127, -1.0
+    for value, count in enumerate(histogram):
+        background_count += count
+        if background_count == 0:
+            continue
+        foreground_count = total - background_count
+        if foreground_count == 0:
+            break
+        background_weighted += value * count
+        background_mean = background_weighted / background_count
+        foreground_mean = (weighted_total - background_weighted) / foreground_count
+        variance = background_count * foreground_count * (background_mean - foreground_mean) ** 2
+        if variance > best_variance:
+            best_threshold, best_variance = value, variance
+    return best_threshold
+
+
+def binarize_image(gray: Image.Image) -> Image.Image:
+    """
+    Bianco e nero con la soglia di Otsu, con testo nero su sfondo bianco. Prima viene sottratto lo sfondo,
+    stimato a bassa risoluzione, così l'illuminazione non uniforme delle foto non rende nere intere zone del foglio.
+    """
+    histogram = gray.histogram()
+    if sum(histogram[:128]) > sum(histogram[128:]):  # Testo chiaro su sfondo scuro (es. screenshot in tema scuro)
+        gray = ImageOps.invert(gray)
+    width, height = gray.size
+    background = gray.resize((max(1, width // 32), max(1, height // 32)), Image.BOX).filter(ImageFilter.MaxFilter(5))
+    background = background.resize((width, height), Image.BILINEAR)
+    normalized = ImageOps.invert(ImageChops.subtract(background, gray))
+    threshold = otsu_threshold(normalized.histogram())
+    return normalized.point(lambda value: 255 if value > threshold else 0)
+
+
+def find_skew_angle(binary: Image.Image, max_angle=OCR_DESKEW_MAX_ANGLE) -> float:
+    """
+    Inclinazione del testo in gradi: l'angolo per cui le righe di testo sono orizzontali è quello che rende più
+    variabile la quantità di inchiostro tra una riga di pixel e l'altra. Calcolato su una copia ridotta.
+    """
+    if max_angle <= 0:
+        return 0.0
+    sample = ImageOps.invert(binary)
+    if sample.width > OCR_DESKEW_SAMPLE_WIDTH_PX:
+        sample = sample.resize((OCR_DESKEW_SAMPLE_WIDTH_PX, max(1, sample.height * OCR_DESKEW_SAMPLE_WIDTH_PX // sample.width)),
+                               Image.BOX)
+
+    def profile_variance(angle: float) -> float:
+        rotated = sample.rotate(angle, resample=Image.NEAREST, fillcolor=0)
+        rows = list(rotated.resize((1, rotated.height), Image.BOX).getdata())
+        mean = sum(rows) / len(rows)
+        return sum((row - mean) ** 2 for row in rows)
+
+    steps = int(max_angle / OCR_DESKEW_STEP_DEGREES)
+    angles = [step * OCR_DESKEW_STEP_DEGREES for step in range(-steps, steps + 1)]
+    return max(angles, key=lambda angle: (profile_variance(angle), -abs(angle)))
+
+
+def crop_margins(binary: Image.Image, padding=OCR_CROP_PADDING_PX) -> Image.Image:
+    """
+    Ritaglia i margini bianchi. Il contenuto viene cercato su una copia ridotta, in cui le zone scure che toccano
+    il bordo (il bordo della foto, il tavolo, le ombre) vengono prima cancellate perché non sono testo.
+    """
+    scale = min(1.0, OCR_CROP_SAMPLE_WIDTH_PX / binary.width)
+    sample = binary.resize((max(1, round(binary.width * scale)), max(1, round(binary.height * scale))), Image.BOX)
+    sample = sample.point(lambda value: 255 if value >= 250 else 0)  # Ogni traccia di inchiostro resta nera
+    width, height = sample.size
+    border = [(x, y) for x in range(width) for y in (0, height - 1)] + [(x, y) for y in range(height) for x in (0, width - 1)]
+    for point in border:
+        if sample.getpixel(point) == 0:
+            ImageDraw.floodfill(sample, point, 255)
+    bbox = ImageOps.invert(sample).getbbox()
+    if bbox is None:
+        return binary
+    left, top, right, bottom = (round(coordinate / scale) for coordinate in bbox)
+    return binary.crop((max(0, left - padding), max(0, top - padding),
+                        min(binary.width, right + padding), min(binary.height, bottom + padding)))
+
+
+def preprocess_image_for_ocr(image: Image.Image, target_dpi=OCR_TARGET_DPI) -> PreprocessedImage:
+    """
+    Prepara una foto o una scansione per tesseract riducendo i pixel da analizzare: orientamento EXIF, scala di
+    grigi, riduzione a `target_dpi`, binarizzazione, raddrizzamento e ritaglio dei margini.
+    """
+    result = PreprocessedImage(image=image, original_size=image.size)
+
+    def timed(step: str, function, *args):
+        start = time.perf_counter()
+        value = function(*args)
+        result.steps_ms[step] = round((time.perf_counter() - start) * 1000, 2)
+        return value
+
+    dpi = estimate_image_dpi(image)  # Il lato corto non cambia con la rotazione EXIF
+    image = timed('orientation', ImageOps.exif_transpose, image)
+    image = timed('grayscale', lambda img: img.convert('L'), image)
+    scale = target_dpi / dpi
+    if scale < 1:
+        image = timed('downsample', lambda img: img.resize((max(1, round(img.width * scale)),
+                                                             max(1, round(img.height * scale))), Image.LANCZOS), image)
+    image = timed('binarize', binarize_image, image)
+    result.skew_angle = timed('skew_detection', find_skew_angle, image)
+    if result.skew_angle:
+        image = timed('deskew', lambda img: img.rotate(result.skew_angle, resample=Image.BICUBIC, expand=True,
+                                                       fillcolor=255), image)
+    image = timed('crop_margins', crop_margins, image)
+    result.image = image
+    logger.info(f"OCR preprocessing {result.original_size} -> {image.size}, skew {result.skew_angle} degrees, "
+                f"steps (ms): {result.steps_ms}")
+    return result
 
 
 def extract_text_from_image(image_file):
     try:
         img = Image.open(image_file)
-        text = pytesseract.image_to_string(img, lang='ita')
+        if OCR_PREPROCESS:
+            img = preprocess_image_for_ocr(img).image
+        text = collect_ocr(submit_ocr(img, choose_ocr_language(img)))
     except Exception as e:
         logger.error(f"Error extracting text from image: {e}")
         text = ""
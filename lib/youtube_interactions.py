@@ -1,8 +1,23 @@
+import hashlib
 import json
 import os
-from typing import List
-from googleapiclient.discovery import build, Resource
+import queue
+import re
+import socket
+import threading
+import unicodedata
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import asdict
+from concurrent.futures import ThreadPoolExecutor, Future, CancelledError, TimeoutError as FutureTimeoutError, \
+    wait, FIRST_COMPLETED
+from typing import List, Iterator, Optional
+import httplib2
+from googleapiclient.discovery import build_from_document, Resource, V2_DISCOVERY_URI
+from googleapiclient.discovery_cache import get_static_doc
 from lib.app_logger import logger
+from lib.cache import create_cache
 from lib.types.youtube_types import YouTubeSearchListResponse, SearchResource, YouTubeChannelListResponse, \
     YouTubeVideoListResponse
 from lib.types.youtube_types_custom import ChannelInfo, VideoStatistics, Video, VideoPartialData
@@ -43,26 +58,236 @@ def get_all_youtube_categories() -> dict[str, str]:
 youtube_topics = get_all_youtube_topic()
 youtube_categories = get_all_youtube_categories()
 
+MAX_IDS_PER_LIST_REQUEST = 50  # Numero massimo di IDs accettati da channels.list e videos.list
 
-def initialize_youtube_api() -> Resource:
-    """Inizializza e restituisce l'oggetto API di YouTube"""
-    youtube_api_key = os.environ.get('YOUTUBE_API_KEY')
+YOUTUBE_STATS_CACHE_TTL_SECONDS = float(os.environ.get("YOUTUBE_STATS_CACHE_TTL_SECONDS", "3600"))
+YOUTUBE_STATS_CACHE_SIZE = int(os.environ.get("YOUTUBE_STATS_CACHE_SIZE", "10000"))
+YOUTUBE_STATS_CACHE_SHARED = os.environ.get("YOUTUBE_STATS_CACHE_SHARED", "False").lower() == "true"
+YOUTUBE_STATS_NEGATIVE_CACHE_TTL_SECONDS = float(os.environ.get("YOUTUBE_STATS_NEGATIVE_CACHE_TTL_SECONDS", "600"))  # Canali e video non restituiti dall'API
 
-    if not youtube_api_key:
-        raise ValueError("YOUTUBE_API_KEY non è impostata")
 
-    return build('youtube', 'v3', developerKey=youtube_api_key)
+def _serialize_optional(value):
+    return asdict(value) if value is not None else None
+
+
+# Iscritti, like e visualizzazioni cambiano poco nell'arco di un'ora: vengono richiesti all'API solo i miss.
+# I canali e i video che l'API non restituisce (eliminati o privati) vengono salvati come None, per non
+# richiederli di nuovo ad ogni ricerca in cui compaiono.
+channel_info_cache = create_cache('youtube_channel_info', max_size=YOUTUBE_STATS_CACHE_SIZE,
+                                  ttl_seconds=YOUTUBE_STATS_CACHE_TTL_SECONDS, shared=YOUTUBE_STATS_CACHE_SHARED,
+                                  serialize=_serialize_optional,
+                                  deserialize=lambda data: ChannelInfo(**data) if data is not None else None)
+video_statistics_cache = create_cache('youtube_video_statistics', max_size=YOUTUBE_STATS_CACHE_SIZE,
+                                      ttl_seconds=YOUTUBE_STATS_CACHE_TTL_SECONDS, shared=YOUTUBE_STATS_CACHE_SHARED,
+                                      serialize=_serialize_optional,
+                                      deserialize=lambda data: VideoStatistics(**data) if data is not None else None)
+
+YOUTUBE_SEARCH_CACHE_TTL_SECONDS = float(os.environ.get("YOUTUBE_SEARCH_CACHE_TTL_SECONDS", str(60 * 60 * 24)))
+YOUTUBE_SEARCH_CACHE_MAX_ENTRIES = int(os.environ.get("YOUTUBE_SEARCH_CACHE_MAX_ENTRIES", "20000"))
+
+# Ogni search.list costa 100 unità di quota: le risposte grezze vengono salvate (compresse) nel database
+search_results_cache = create_cache('youtube_search_results', max_size=256,
+                                    ttl_seconds=YOUTUBE_SEARCH_CACHE_TTL_SECONDS, shared=True,
+                                    shared_max_size=YOUTUBE_SEARCH_CACHE_MAX_ENTRIES, compress=True)
+
+YOUTUBE_SEARCH_MAX_WORKERS = int(os.environ.get("YOUTUBE_SEARCH_MAX_WORKERS", "8"))  # Thread condivisi tra tutte le richieste
+YOUTUBE_SEARCH_MAX_CONCURRENCY = int(os.environ.get("YOUTUBE_SEARCH_MAX_CONCURRENCY", "4"))  # Query in parallelo per singola richiesta
+YOUTUBE_SEARCH_DEADLINE_SECONDS = float(os.environ.get("YOUTUBE_SEARCH_DEADLINE_SECONDS", "30"))  # Tempo massimo per le ricerche di una richiesta
+YOUTUBE_STATS_RESERVED_SECONDS = float(os.environ.get("YOUTUBE_STATS_RESERVED_SECONDS", "5"))  # Parte della deadline riservata alle statistiche di canali e video
+
+_search_executor = ThreadPoolExecutor(max_workers=YOUTUBE_SEARCH_MAX_WORKERS, thread_name_prefix="youtube-search")
+
+
+YOUTUBE_HTTP_TIMEOUT_SECONDS = float(os.environ.get("YOUTUBE_HTTP_TIMEOUT_SECONDS", "15"))
+YOUTUBE_CLIENT_POOL_SIZE = int(os.environ.get("YOUTUBE_CLIENT_POOL_SIZE", str(YOUTUBE_SEARCH_MAX_WORKERS)))  # Client (e connessioni) al massimo aperti
+YOUTUBE_CLIENT_CHECKOUT_TIMEOUT_SECONDS = float(os.environ.get("YOUTUBE_CLIENT_CHECKOUT_TIMEOUT_SECONDS", "30"))  # Attesa massima di un client libero
+
+
+class YouTubeClientPool:
+    """
+    Pool di client per l'API di YouTube condiviso da tutto il processo.
+
+    Il documento di discovery viene caricato e interpretato una sola volta (dalla copia statica inclusa in
+    google-api-python-client, o scaricandolo se assente). Poiché httplib2 non è thread-safe, ogni client
+    (`Resource` con una propria connessione HTTP) viene usato da un solo chiamante alla volta: `client()`
+    lo preleva dalla coda dei client liberi e ve lo restituisce al termine, così la connessione resta aperta
+    (keep-alive) per le chiamate successive, indipendentemente dal thread o dalla greenlet che le esegue.
+    Vengono creati al massimo `max_size` client; oltre, si attende che uno venga restituito.
+    """
+
+    def __init__(self, api_name='youtube', api_version='v3', max_size=YOUTUBE_CLIENT_POOL_SIZE,
+                 checkout_timeout_seconds=YOUTUBE_CLIENT_CHECKOUT_TIMEOUT_SECONDS):
+        self.api_name = api_name
+        self.api_version = api_version
+        self.max_size = max(1, max_size)
+        self.checkout_timeout_seconds = checkout_timeout_seconds
+        self._lock = threading.Lock()
+        self._idle: queue.LifoQueue[Resource] = queue.LifoQueue()
+        self._created = 0
+        self._interrupted: set[Resource] = set()
+        self._discovery_document: Optional[dict] = None
+        self._api_key: Optional[str] = None
+
+    def _load_discovery_document(self) -> dict:
+        document = get_static_doc(self.api_name, self.api_version)
+        if document is None:
+            logger.warning(f"Static discovery document for {self.api_name} {self.api_version} not found, fetching it")
+            url = V2_DISCOVERY_URI.format(api=self.api_name, apiVersion=self.api_version)
+            response, content = httplib2.Http(timeout=YOUTUBE_HTTP_TIMEOUT_SECONDS).request(url)
+            if response.status >= 400:
+                raise RuntimeError(f"Could not fetch discovery document from {url}: HTTP {response.status}")
+            document = content.decode('utf-8')
+        return json.loads(document)
+
+    def initialize(self):
+        """Carica la chiave API e il documento di discovery, se non già fatto"""
+        with self._lock:
+            if self._discovery_document is not None:
+                return
+
+            youtube_api_key = os.environ.get('YOUTUBE_API_KEY')
+            if not youtube_api_key:
+                raise ValueError("YOUTUBE_API_KEY non è impostata")
+
+            self._discovery_document = self._load_discovery_document()
+            self._api_key = youtube_api_key
+            logger.info(f"YouTube client pool initialized ({self.api_name} {self.api_version})")
+
+    def _create_client(self) -> Resource:
+        return build_from_document(self._discovery_document, developerKey=self._api_key,
+                                   http=httplib2.Http(timeout=YOUTUBE_HTTP_TIMEOUT_SECONDS))
+
+    def acquire(self) -> Resource:
+        """Preleva un client libero, creandolo se il pool non ha ancora raggiunto `max_size`"""
+        self.initialize()
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            create = self._created < self.max_size
+            if create:
+                self._created += 1
+        if create:
+            try:
+                return self._create_client()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        try:
+            return self._idle.get(timeout=self.checkout_timeout_seconds)
+        except queue.Empty:
+            raise TimeoutError(f"No YouTube client available after {self.checkout_timeout_seconds:g}s "
+                               f"({self.max_size} in use)")
+
+    def release(self, client: Resource, discard: bool = False):
+        """
+        Restituisce un client al pool. Con `discard`, o se la sua chiamata è stata interrotta, il client viene
+        chiuso e scartato: al suo posto ne verrà creato uno nuovo.
+        """
+        with self._lock:
+            if client in self._interrupted:
+                self._interrupted.discard(client)
+                discard = True
+            if discard:
+                self._created -= 1
+        if discard:
+            close_client(client)
+            return
+        self._idle.put(client)
+
+    def interrupt(self, client: Resource):
+        """
+        Interrompe la chiamata in corso su un client prelevato da un altro chiamante: le sue connessioni vengono
+        chiuse e non possono essere riaperte, così la chiamata fallisce subito invece di occupare il thread fino
+        al timeout. Il client viene scartato alla restituzione.
+        """
+        with self._lock:
+            self._interrupted.add(client)
+        close_client(client, refuse_reconnect=True)
+
+    @contextmanager
+    def client(self) -> Iterator[Resource]:
+        """Client da usare nel blocco `with`, restituito al pool all'uscita"""
+        client = self.acquire()
+        try:
+            yield client
+        except BaseException:
+            # La connessione potrebbe essere rimasta a metà di una risposta: meglio non riutilizzarla
+            self.release(client, discard=True)
+            raise
+        self.release(client)
+
+    def stats(self) -> dict:
+        return {'max_size': self.max_size, 'created': self._created, 'idle': self._idle.qsize()}
+
+
+def _refuse_connection():
+    raise ConnectionAbortedError("YouTube API call interrupted")
+
+
+def close_client(client: Resource, refuse_reconnect: bool = False):
+    """
+    Chiude le connessioni HTTP di un client, interrompendo anche una richiesta in corso. Con `refuse_reconnect`
+    le connessioni non possono essere riaperte, altrimenti httplib2 ripeterebbe la richiesta interrotta.
+    """
+    try:
+        for connection in list(client._http.connections.values()):
+            if refuse_reconnect:
+                connection.connect = _refuse_connection
+            if connection.sock is not None:
+                connection.sock.shutdown(socket.SHUT_RDWR)
+            connection.close()
+    except Exception as e:
+        logger.debug(f"Error closing YouTube client connections: {e}")
+
+
+youtube_client_pool = YouTubeClientPool()
+
+
+def warm_up_youtube_client_pool() -> bool:
+    """Inizializza il pool e ne crea il primo client all'avvio del worker, così le richieste non ne pagano il costo"""
+    try:
+        with youtube_client_pool.client():
+            pass
+        return True
+    except Exception as e:
+        logger.error(f"Could not initialize YouTube client pool at startup: {e}")
+        return False
+
+
+def check_youtube_api_key():
+    """
+    Verifica che la API key sia valida con una chiamata economica (i18nLanguages.list, 1 unità di quota).
+    Solleva un'eccezione se la chiave non è configurata o viene rifiutata.
+    """
+    with youtube_client_pool.client() as youtube:
+        youtube.i18nLanguages().list(part='snippet', hl='en').execute()
+
+
+def normalize_search_query(query: str) -> str:
+    """Normalizza il testo di una query (maiuscole, punteggiatura, spazi) per l'uso come chiave di cache"""
+    query = unicodedata.normalize('NFKC', query).casefold()
+    query = re.sub(r'[^\w\s]', ' ', query)
+    return re.sub(r'\s+', ' ', query).strip()
+
+
+def get_search_cache_key(search_params: dict) -> str:
+    """Chiave di cache di una ricerca: query normalizzata più lingua, topic, categoria e filtri"""
+    key_params = dict(search_params, q=normalize_search_query(search_params['q']))
+    return hashlib.sha256(json.dumps(key_params, sort_keys=True).encode('utf-8')).hexdigest()
 
 
 def search_videos(youtube: Resource, query: str, max_results=10, language='it',
                   youtube_topic_key='Knowledge') -> YouTubeSearchListResponse:
     """
-    Esegue la ricerca dei video su YouTube e restituisce i risultati grezzi
+    Esegue la ricerca dei video su YouTube e restituisce i risultati grezzi.
+    Le risposte vengono riutilizzate dalla cache finché non scadono.
 
     docs: https://developers.google.com/youtube/v3/docs/search/list
     """
-
-    yt_request = youtube.search().list(
+    search_params = dict(
         q=query,
         part='snippet',
         type='video',
@@ -78,7 +303,15 @@ def search_videos(youtube: Resource, query: str, max_results=10, language='it',
         topicId=youtube_topics.get(youtube_topic_key, youtube_topics.get('Society', '')),
     )
 
-    data: dict = yt_request.execute()
+    cache_key = get_search_cache_key(search_params)
+    data: dict = search_results_cache.get(cache_key)
+    if data is None:
+        yt_request = youtube.search().list(**search_params)
+        data = yt_request.execute()
+        search_results_cache.set(cache_key, data)
+    else:
+        logger.info(f"Search results for query '{query}' found in cache")
+
     return YouTubeSearchListResponse.from_dict(data)
 
 
@@ -106,59 +339,94 @@ def process_search_results(search_resources: List[SearchResource]) -> tuple[List
     return temp_videos, channel_ids, video_ids
 
 
-def get_channel_info_batch(youtube: Resource, channel_ids: set[str]) -> dict[str, ChannelInfo]:
-    """Recupera informazioni sui canali in batch"""
-    channels_data = {}
-
-    if not channel_ids:
-        return channels_data
+def chunk_ids(ids: set[str], chunk_size=MAX_IDS_PER_LIST_REQUEST) -> List[List[str]]:
+    """Divide gli IDs in gruppi ordinati di al massimo `chunk_size` elementi"""
+    sorted_ids = sorted(ids)
+    return [sorted_ids[i:i + chunk_size] for i in range(0, len(sorted_ids), chunk_size)]
 
-    channels_request = youtube.channels().list(
-        part='statistics,snippet',
-        id=','.join(channel_ids)
-    )
-    channels_response_data = channels_request.execute()
-    channels_response = YouTubeChannelListResponse.from_dict(channels_response_data)
 
-    for channel in channels_response.items:
-        channel_id = channel.id
-        subscriber_count = int(channel.statistics.subscriberCount)
-        language = channel.snippet.defaultLanguage
+def fetch_channel_info_batch(youtube: Resource, channel_ids: set[str]) -> dict[str, ChannelInfo]:
+    """Recupera dall'API informazioni sui canali in batch da al massimo 50 IDs"""
+    channels_data = {}
 
-        channels_data[channel_id] = ChannelInfo(
-            subscriber_count=subscriber_count,
-            language=language
+    for channel_ids_chunk in chunk_ids(channel_ids):
+        channels_request = youtube.channels().list(
+            part='statistics,snippet',
+            id=','.join(channel_ids_chunk),
+            maxResults=MAX_IDS_PER_LIST_REQUEST
         )
+        channels_response_data = channels_request.execute()
+        channels_response = YouTubeChannelListResponse.from_dict(channels_response_data)
+
+        for channel in channels_response.items:
+            channel_id = channel.id
+            subscriber_count = int(channel.statistics.subscriberCount)
+            language = channel.snippet.defaultLanguage
+
+            channels_data[channel_id] = ChannelInfo(
+                subscriber_count=subscriber_count,
+                language=language
+            )
 
     return channels_data
 
 
-def get_video_statistics_batch(youtube: Resource, video_ids: set[str]) -> dict[str, VideoStatistics]:
-    """Recupera statistiche dei video in batch"""
+def fetch_video_statistics_batch(youtube: Resource, video_ids: set[str]) -> dict[str, VideoStatistics]:
+    """Recupera dall'API statistiche dei video in batch da al massimo 50 IDs"""
     videos_statistics = {}
 
-    if not video_ids:
-        return videos_statistics
-
-    video_stats_request = youtube.videos().list(
-        part='statistics',
-        id=','.join(video_ids)
-    )
-    video_stats_response_data = video_stats_request.execute()
-    video_stats_response = YouTubeVideoListResponse.from_dict(video_stats_response_data)
-
-    for video_stat in video_stats_response.items:
-        video_id = video_stat.id
-        like_count = int(video_stat.statistics.likeCount)
-        view_count = int(video_stat.statistics.viewCount)
-        videos_statistics[video_id] = VideoStatistics(
-            like_count=like_count,
-            view_count=view_count
+    for video_ids_chunk in chunk_ids(video_ids):
+        video_stats_request = youtube.videos().list(
+            part='statistics',
+            id=','.join(video_ids_chunk)
         )
+        video_stats_response_data = video_stats_request.execute()
+        video_stats_response = YouTubeVideoListResponse.from_dict(video_stats_response_data)
+
+        for video_stat in video_stats_response.items:
+            video_id = video_stat.id
+            like_count = int(video_stat.statistics.likeCount)
+            view_count = int(video_stat.statistics.viewCount)
+            videos_statistics[video_id] = VideoStatistics(
+                like_count=like_count,
+                view_count=view_count
+            )
 
     return videos_statistics
 
 
+def get_channel_info_batch(youtube: Resource, channel_ids: set[str]) -> dict[str, ChannelInfo]:
+    """
+    Recupera informazioni sui canali, richiedendo all'API solo quelli non presenti in cache.
+    I canali che l'API non restituisce vengono omessi e salvati in cache come assenti.
+    """
+    channels_data = channel_info_cache.get_many(channel_ids)
+    missing_channel_ids = channel_ids - channels_data.keys()
+    if missing_channel_ids:
+        fetched_channels_data = fetch_channel_info_batch(youtube, missing_channel_ids)
+        channel_info_cache.set_many(fetched_channels_data)
+        channel_info_cache.set_many(dict.fromkeys(missing_channel_ids - fetched_channels_data.keys()),
+                                    ttl_seconds=YOUTUBE_STATS_NEGATIVE_CACHE_TTL_SECONDS)
+        channels_data.update(fetched_channels_data)
+    return {channel_id: info for channel_id, info in channels_data.items() if info is not None}
+
+
+def get_video_statistics_batch(youtube: Resource, video_ids: set[str]) -> dict[str, VideoStatistics]:
+    """
+    Recupera statistiche dei video, richiedendo all'API solo quelli non presenti in cache.
+    I video che l'API non restituisce vengono omessi e salvati in cache come assenti.
+    """
+    videos_statistics = video_statistics_cache.get_many(video_ids)
+    missing_video_ids = video_ids - videos_statistics.keys()
+    if missing_video_ids:
+        fetched_videos_statistics = fetch_video_statistics_batch(youtube, missing_video_ids)
+        video_statistics_cache.set_many(fetched_videos_statistics)
+        video_statistics_cache.set_many(dict.fromkeys(missing_video_ids - fetched_videos_statistics.keys()),
+                                        ttl_seconds=YOUTUBE_STATS_NEGATIVE_CACHE_TTL_SECONDS)
+        videos_statistics.update(fetched_videos_statistics)
+    return {video_id: statistics for video_id, statistics in videos_statistics.items() if statistics is not None}
+
+
 def calculate_engagement_score(view_count, like_count):
     """Calcola il punteggio di engagement di un video"""
     if view_count > 0:
@@ -209,14 +477,16 @@ def normalize_engagement_scores(videos):
     return videos
 
 
-def search_youtube_videos(query, video_language='it', max_results=50, min_subscribers=30000, min_likes=1000,
-                          verbose=False):
-    """Funzione principale per la ricerca di video su YouTube con filtri"""
-    if verbose:
-        logger.info(
-            f"Inizializzazione API YouTube con query: {query}, video_language: {video_language}, max_results: {max_results}, min_subscribers: {min_subscribers}, min_likes: {min_likes}, verbose: {verbose}")
+def search_query_results(query, video_language='it', max_results=50, verbose=False,
+                         youtube: Optional[Resource] = None) -> List[VideoPartialData]:
+    """
+    Esegue la ricerca di una query e restituisce i video trovati, non ancora arricchiti con le statistiche.
+    Senza `youtube` viene usato un client del pool.
+    """
+    if youtube is None:
+        with youtube_client_pool.client() as youtube:
+            return search_query_results(query, video_language, max_results, verbose, youtube)
 
-    youtube = initialize_youtube_api()
     if verbose:
         logger.info(f"API YouTube: {youtube}")
 
@@ -231,22 +501,222 @@ def search_youtube_videos(query, video_language='it', max_results=50, min_subscr
         except (TypeError, AttributeError) as error:
             logger.error(f"Impossibile serializzare search_response in JSON: {error}")
 
-
     # Processa i risultati della ricerca
-    temp_videos, channel_ids, video_ids = process_search_results(search_response.items)
+    temp_videos, _, _ = process_search_results(search_response.items)
+    return temp_videos
+
+
+def enrich_search_results(results_by_query: dict[str, List[VideoPartialData]], video_language='it',
+                          min_subscribers=30000, min_likes=1000,
+                          youtube: Optional[Resource] = None) -> dict[str, List[Video]]:
+    """
+    Arricchisce e filtra i risultati di tutte le query di una richiesta.
+
+    Gli IDs di canali e video di tutte le query vengono uniti e deduplicati, così che ogni canale e ogni video
+    venga richiesto una sola volta: la richiesta costa al massimo ceil(unici/50) chiamate per tipo di risorsa.
+    Senza `youtube` viene usato un client del pool.
+    """
+    if youtube is None:
+        with youtube_client_pool.client() as youtube:
+            return enrich_search_results(results_by_query, video_language, min_subscribers, min_likes, youtube)
+
+    channel_ids = {video.channel_id for videos in results_by_query.values() for video in videos}
+    video_ids = {video.video_id for videos in results_by_query.values() for video in videos}
 
-    # Ottieni informazioni su canali e statistiche video
     channels_data = get_channel_info_batch(youtube, channel_ids)
     videos_statistics = get_video_statistics_batch(youtube, video_ids)
 
-    # Filtra e crea oggetti video
-    filtered_videos = filter_and_create_videos(temp_videos, channels_data, videos_statistics, min_subscribers,
-                                               min_likes, language_set={video_language, 'en'})
+    videos_by_query = {}
+    for query, temp_videos in results_by_query.items():
+        # Filtra e crea oggetti video
+        filtered_videos = filter_and_create_videos(temp_videos, channels_data, videos_statistics, min_subscribers,
+                                                   min_likes, language_set={video_language, 'en'})
+        # Normalizza i punteggi
+        videos_by_query[query] = normalize_engagement_scores(filtered_videos)
 
-    # Normalizza i punteggi
-    filtered_videos = normalize_engagement_scores(filtered_videos)
+    return videos_by_query
 
-    return filtered_videos
+
+def search_youtube_videos(query, video_language='it', max_results=50, min_subscribers=30000, min_likes=1000,
+                          verbose=False):
+    """Funzione principale per la ricerca di video su YouTube con filtri"""
+    if verbose:
+        logger.info(
+            f"Inizializzazione API YouTube con query: {query}, video_language: {video_language}, max_results: {max_results}, min_subscribers: {min_subscribers}, min_likes: {min_likes}, verbose: {verbose}")
+
+    temp_videos = search_query_results(query, video_language, max_results, verbose=verbose)
+    videos_by_query = enrich_search_results({query: temp_videos}, video_language, min_subscribers, min_likes)
+    return videos_by_query[query]
+
+
+class ConcurrentYouTubeSearch:
+    """
+    Esegue in parallelo le ricerche YouTube relative ad una singola richiesta.
+
+    Le query vengono accodate con `submit` ed eseguite sul pool di thread condiviso, con al massimo
+    `max_concurrency` ricerche attive per richiesta. `as_completed` restituisce i risultati di ogni query
+    appena questa termina, `poll_completed` quelli già disponibili senza attendere (utile mentre altre query
+    sono ancora in generazione). La deadline parte quando tutte le query sono state accodate (da `start_deadline`,
+    chiamata anche da `as_completed`), così le query generate per ultime hanno lo stesso tempo delle prime, e vale
+    anche per `enrich_results`, che una volta terminate le ricerche recupera le statistiche di canali e video di
+    tutte le query insieme: le ricerche ancora in corso vengono interrotte `stats_reserved_seconds` prima della
+    deadline, così da lasciare tempo alle statistiche dei risultati già arrivati.
+    `cancel` interrompe le ricerche di una richiesta abbandonata (ad esempio se il client si disconnette), così
+    che non continuino ad occupare i thread del pool condiviso.
+    """
+
+    def __init__(self, video_language='it', max_results=50, min_subscribers=30000, min_likes=1000,
+                 max_concurrency=YOUTUBE_SEARCH_MAX_CONCURRENCY, deadline_seconds=YOUTUBE_SEARCH_DEADLINE_SECONDS,
+                 stats_reserved_seconds=YOUTUBE_STATS_RESERVED_SECONDS):
+        self.video_language = video_language
+        self.max_results = max_results
+        self.min_subscribers = min_subscribers
+        self.min_likes = min_likes
+        self.max_concurrency = max(1, max_concurrency)
+        self.deadline_seconds = deadline_seconds
+        self.stats_reserved_seconds = min(stats_reserved_seconds, deadline_seconds)
+        self.deadline: Optional[float] = None
+        self.search_deadline: Optional[float] = None
+        self._pending: deque[str] = deque()
+        self._running: dict[Future, str] = {}
+        self.results: dict[str, List[VideoPartialData]] = {}
+        self.failed_queries: List[str] = []
+        self.enrichment_failed = False
+        self._lock = threading.Lock()
+        self._cancelled = False
+        self._active_clients: set[Resource] = set()
+
+    def submit(self, query: str):
+        """Accoda una query, avviandola subito se il limite di concorrenza lo consente"""
+        self._pending.append(query)
+        self._start_pending()
+
+    def start_deadline(self):
+        """Avvia la deadline, se non è già partita: da chiamare dopo aver accodato l'ultima query"""
+        if self.deadline is None:
+            self.deadline = time.monotonic() + self.deadline_seconds
+            self.search_deadline = self.deadline - self.stats_reserved_seconds
+
+    def _start_pending(self):
+        while self._pending and len(self._running) < self.max_concurrency:
+            query = self._pending.popleft()
+            future = _search_executor.submit(self._search, query)
+            self._running[future] = query
+
+    @contextmanager
+    def _client(self) -> Iterator[Resource]:
+        """Client del pool registrato come in uso da questa ricerca, così `cancel` può interromperne la chiamata"""
+        with youtube_client_pool.client() as youtube:
+            with self._lock:
+                if self._cancelled:
+                    raise CancelledError()
+                self._active_clients.add(youtube)
+            try:
+                yield youtube
+            finally:
+                with self._lock:
+                    self._active_clients.discard(youtube)
+
+    def _search(self, query: str) -> List[VideoPartialData]:
+        with self._client() as youtube:
+            return search_query_results(query, video_language=self.video_language, max_results=self.max_results,
+                                        youtube=youtube)
+
+    def _enrich(self) -> dict[str, List[Video]]:
+        with self._client() as youtube:
+            return enrich_search_results(self.results, self.video_language, self.min_subscribers, self.min_likes,
+                                         youtube=youtube)
+
+    def _interrupt_running(self) -> List[str]:
+        """Le ricerche in coda non vengono avviate e le chiamate in corso vengono interrotte"""
+        with self._lock:
+            active_clients = list(self._active_clients)
+        for youtube in active_clients:
+            youtube_client_pool.interrupt(youtube)
+        abandoned_queries = list(self._running.values()) + list(self._pending)
+        for future in self._running:
+            future.cancel()
+        self._running.clear()
+        self._pending.clear()
+        return abandoned_queries
+
+    def cancel(self) -> List[str]:
+        """
+        Abbandona la ricerca: le query in coda non vengono avviate, le chiamate in corso vengono interrotte e le
+        successive rifiutate. Restituisce le query abbandonate.
+        """
+        with self._lock:
+            self._cancelled = True
+        return self._interrupt_running()
+
+    def _abandon_remaining(self):
+        abandoned_queries = self._interrupt_running()
+        self.failed_queries.extend(abandoned_queries)
+        logger.warning(f"YouTube search deadline exceeded, abandoned queries: {abandoned_queries}")
+
+    def _collect(self, future: Future) -> tuple[str, List[VideoPartialData]]:
+        query = self._running.pop(future)
+        self._start_pending()
+        try:
+            videos = future.result()
+        except Exception as e:
+            logger.error(f"Error searching YouTube for query '{query}': {e}")
+            self.failed_queries.append(query)
+            videos = []
+        self.results[query] = videos
+        return query, videos
+
+    def poll_completed(self) -> List[tuple[str, List[VideoPartialData]]]:
+        """Restituisce, senza attendere, le coppie (query, risultati) delle ricerche terminate nel frattempo"""
+        if self.search_deadline is not None and self._running and time.monotonic() >= self.search_deadline:
+            self._abandon_remaining()
+            return []
+        return [self._collect(future) for future in [future for future in self._running if future.done()]]
+
+    def as_completed(self) -> Iterator[tuple[str, List[VideoPartialData]]]:
+        """
+        Restituisce le coppie (query, risultati) nell'ordine in cui le ricerche terminano.
+        Una ricerca fallita restituisce una lista vuota.
+        """
+        self.start_deadline()
+        while self._running:
+            remaining = self.search_deadline - time.monotonic()
+            if remaining <= 0:
+                self._abandon_remaining()
+                return
+
+            done, _ = wait(self._running, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield self._collect(future)
+
+    def wait_all(self) -> dict[str, List[VideoPartialData]]:
+        """Attende il termine di tutte le ricerche, o lo scadere della deadline"""
+        for _ in self.as_completed():
+            pass
+        return self.results
+
+    def enrich_results(self) -> dict[str, List[Video]]:
+        """Arricchisce e filtra insieme i risultati di tutte le query completate, entro la deadline"""
+        if not self.results:
+            return {}
+        self.start_deadline()
+        remaining = self.deadline - time.monotonic()
+        try:
+            if remaining <= 0:
+                raise FutureTimeoutError()
+            return _search_executor.submit(self._enrich).result(timeout=remaining)
+        except FutureTimeoutError:
+            self.cancel()
+            logger.warning("YouTube search deadline exceeded while retrieving channel and video statistics")
+        except Exception as e:
+            logger.error(f"Error retrieving YouTube channel and video statistics: {e}")
+        self.enrichment_failed = True
+        return {}
+
+    @property
+    def is_complete(self) -> bool:
+        """True se tutte le query sono state cercate e arricchite senza errori"""
+        return not self.failed_queries and not self.enrichment_failed
 
 
 if __name__ == "__main__":
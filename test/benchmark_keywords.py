@@ -0,0 +1,73 @@
+import argparse
+import glob
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from lib.text_processing import extract_keywords, extract_keywords_by_sections, detect_language, \
+    split_text_into_sections, KEYWORD_SECTION_SIZE_CHARS, KEYWORD_MAX_SECTIONS
+from lib.word_extraction import read_file_from_bytes
+
+
+def keywords_overlap(reference, candidate) -> float:
+    """Frazione delle keywords di riferimento presenti anche tra quelle candidate"""
+    reference_set = {kw.casefold() for kw, _ in reference}
+    candidate_set = {kw.casefold() for kw, _ in candidate}
+    if not reference_set:
+        return 1.0
+    return len(reference_set & candidate_set) / len(reference_set)
+
+
+def benchmark_file(path, top_n, n_word_range, algorithm, section_size, max_sections):
+    if path.endswith(('.txt', '.md')):
+        with open(path, 'r', encoding='utf-8') as f:
+            read_suc, text = True, f.read()
+    else:
+        with open(path, 'rb') as f:
+            read_suc, text = read_file_from_bytes(f.read(), os.path.basename(path))
+    if not read_suc or not text.strip():
+        print(f"{path}: could not read text, skipped")
+        return
+
+    language = detect_language(text)
+
+    start = time.perf_counter()
+    full_keywords = extract_keywords(text, top_n=top_n, n_word_range=n_word_range, algorithm=algorithm,
+                                     language=language)
+    full_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    sections_keywords = extract_keywords_by_sections(text, top_n=top_n, n_word_range=n_word_range,
+                                                     algorithm=algorithm, language=language,
+                                                     section_size=section_size, max_sections=max_sections)
+    sections_seconds = time.perf_counter() - start
+
+    sections_count = len(split_text_into_sections(text, section_size))
+    print(f"{path}: {len(text)} chars, {sections_count} sections (max {max_sections}), language={language}")
+    print(f"   full text: {full_seconds:.3f}s   by sections: {sections_seconds:.3f}s   "
+          f"overlap@{top_n}: {keywords_overlap(full_keywords, sections_keywords):.2f}")
+    print(f"   full text:   {[kw for kw, _ in full_keywords]}")
+    print(f"   by sections: {[kw for kw, _ in sections_keywords]}")
+
+
+if __name__ == "__main__":
+    """
+    Confronta l'estrazione delle keywords sul testo completo con quella per sezioni.
+
+    dalla root del progetto:
+
+    python test/benchmark_keywords.py [file ...] --section-size 1000
+    """
+    parser = argparse.ArgumentParser(description="Benchmark of full-text vs section-based keyword extraction")
+    parser.add_argument('files', nargs='*', help="Documents to benchmark (default: test/*.txt)")
+    parser.add_argument('--top-n', type=int, default=15)
+    parser.add_argument('--algorithm', choices=['yake', 'rake'], default='yake')
+    parser.add_argument('--section-size', type=int, default=KEYWORD_SECTION_SIZE_CHARS)
+    parser.add_argument('--max-sections', type=int, default=KEYWORD_MAX_SECTIONS)
+    args = parser.parse_args()
+
+    files = args.files or sorted(glob.glob(os.path.join(os.path.dirname(__file__), '*.txt')))
+    for file_path in files:
+        benchmark_file(file_path, args.top_n, (1, 5), args.algorithm, args.section_size, args.max_sections)
@@ -0,0 +1,90 @@
+import argparse
+import glob
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytesseract
+from PIL import Image
+from lib.word_extraction import preprocess_image_for_ocr, OCR_DEFAULT_LANGUAGE, OCR_TARGET_DPI
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.tif', '.tiff', '.bmp', '.webp')
+
+
+def normalize_text(text: str) -> str:
+    """Spazi e a capo non contano per l'accuratezza"""
+    return ' '.join(text.split())
+
+
+def edit_distance(a: str, b: str) -> int:
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        previous = current
+    return previous[-1]
+
+
+def character_accuracy(reference: str, candidate: str) -> float:
+    """1 - (distanza di edit / caratteri del riferimento), limitata a 0"""
+    reference, candidate = normalize_text(reference), normalize_text(candidate)
+    if not reference:
+        return 1.0 if not candidate else 0.0
+    return max(0.0, 1 - edit_distance(reference, candidate) / len(reference))
+
+
+def ocr_timed(image: Image.Image, language: str) -> tuple[str, float]:
+    start = time.perf_counter()
+    text = pytesseract.image_to_string(image, lang=language)
+    return text, time.perf_counter() - start
+
+
+def benchmark_image(path, language, target_dpi):
+    reference_path = os.path.splitext(path)[0] + '.gt.txt'
+    reference = None
+    if os.path.exists(reference_path):
+        with open(reference_path, 'r', encoding='utf-8') as f:
+            reference = f.read()
+
+    image = Image.open(path)
+    image.load()
+    raw_text, raw_seconds = ocr_timed(image, language)
+
+    preprocessed = preprocess_image_for_ocr(image, target_dpi=target_dpi)
+    preprocessed_text, preprocessed_seconds = ocr_timed(preprocessed.image, language)
+    preprocessing_seconds = sum(preprocessed.steps_ms.values()) / 1000
+
+    print(f"{path}: {image.size[0]}x{image.size[1]} -> {preprocessed.image.size[0]}x{preprocessed.image.size[1]}, "
+          f"skew {preprocessed.skew_angle} degrees")
+    print(f"   preprocessing steps (ms): {preprocessed.steps_ms}")
+    print(f"   OCR original:     {raw_seconds:.3f}s")
+    print(f"   OCR preprocessed: {preprocessed_seconds:.3f}s (+ {preprocessing_seconds:.3f}s preprocessing)")
+    if reference is not None:
+        print(f"   character accuracy: original {character_accuracy(reference, raw_text):.3f}   "
+              f"preprocessed {character_accuracy(reference, preprocessed_text):.3f}")
+    else:
+        print(f"   character accuracy: n/a (no {os.path.basename(reference_path)})")
+
+
+if __name__ == "__main__":
+    """
+    Confronta tempo e accuratezza dell'OCR sulle immagini originali e su quelle preparate da
+    preprocess_image_for_ocr. Il testo atteso di `immagine.png` va in `immagine.gt.txt`.
+
+    dalla root del progetto:
+
+    python test/benchmark_ocr.py [immagine ...] --lang ita
+    """
+    parser = argparse.ArgumentParser(description="Benchmark of OCR time and accuracy with and without preprocessing")
+    parser.add_argument('images', nargs='*', help="Images to benchmark (default: images in test/)")
+    parser.add_argument('--lang', default=OCR_DEFAULT_LANGUAGE, help="Tesseract language pack")
+    parser.add_argument('--target-dpi', type=int, default=OCR_TARGET_DPI)
+    args = parser.parse_args()
+
+    images = args.images or sorted(path for path in glob.glob(os.path.join(os.path.dirname(__file__), '*'))
+                                   if path.lower().endswith(IMAGE_EXTENSIONS))
+    for image_path in images:
+        benchmark_image(image_path, args.lang, args.target_dpi)
@@ -0,0 +1,12 @@
+import os
+import sys
+import tempfile
+
+# I moduli di lib leggono i percorsi di log e database all'import: i test usano una cartella temporanea
+_test_data_dir = tempfile.mkdtemp(prefix='yt-reference-finder-test-')
+os.environ.setdefault("LOG_FILE_PATH", os.path.join(_test_data_dir, "app.log"))
+os.environ.setdefault("CACHE_DB_PATH", os.path.join(_test_data_dir, "cache.sqlite3"))
+os.environ.setdefault("JOBS_DB_PATH", os.path.join(_test_data_dir, "jobs.sqlite3"))
+os.environ.setdefault("NLTK_ALLOW_DOWNLOAD", "False")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,124 @@
+import argparse
+import json
+import os
+import threading
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_TEXT = ("La CPU è l'unità centrale di elaborazione del computer: esegue le istruzioni dei programmi, "
+                "mentre la memoria RAM contiene i dati su cui lavorano. ") * 20
+
+
+class ActiveStreams:
+    """Conta gli stream che hanno ricevuto il primo evento e non sono ancora terminati"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+
+    def started(self):
+        with self._lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+
+    def finished(self):
+        with self._lock:
+            self.active -= 1
+
+
+def run_stream(url: str, text: str, timeout: float, active_streams: ActiveStreams, start_event: threading.Event) -> dict:
+    """Una richiesta in streaming a /process: tempo al primo evento, tempo totale ed esito"""
+    body = urllib.parse.urlencode({'text': text, 'response_as_stream': 'true'}).encode()
+    start_event.wait()
+    start = time.perf_counter()
+    result = {'ok': False, 'first_event_seconds': None, 'total_seconds': None, 'error': None}
+    streaming = False
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, data=body), timeout=timeout) as response:
+            for line in response:
+                if not line.strip():
+                    continue
+                if not streaming:
+                    streaming = True
+                    active_streams.started()
+                    result['first_event_seconds'] = time.perf_counter() - start
+                event = json.loads(line)
+                if event.get('status') == 'error':
+                    result['error'] = event.get('message')
+                    break
+                if event.get('status') == 'processing_complete':
+                    result['ok'] = True
+    except Exception as e:
+        result['error'] = str(e)
+    finally:
+        if streaming:
+            active_streams.finished()
+    result['total_seconds'] = time.perf_counter() - start
+    return result
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def format_seconds(value):
+    return f"{value:7.2f}" if value is not None else "    n/a"
+
+
+def run_level(url: str, concurrency: int, text: str, timeout: float):
+    active_streams = ActiveStreams()
+    start_event = threading.Event()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(run_stream, url, text, timeout, active_streams, start_event)
+                   for _ in range(concurrency)]
+        start = time.perf_counter()
+        start_event.set()
+        results = [future.result() for future in futures]
+    wall_seconds = time.perf_counter() - start
+
+    succeeded = [r for r in results if r['ok']]
+    first_event = [r['first_event_seconds'] for r in results if r['first_event_seconds'] is not None]
+    total = [r['total_seconds'] for r in succeeded]
+    print(f"{concurrency:11d} {len(succeeded):4d} {len(results) - len(succeeded):6d} "
+          f"{format_seconds(percentile(first_event, 0.5))} {format_seconds(percentile(first_event, 0.95))} "
+          f"{format_seconds(percentile(total, 0.5))} {format_seconds(percentile(total, 0.95))} "
+          f"{active_streams.max_active:10d} {len(succeeded) / wall_seconds:9.2f}")
+    errors = {r['error'] for r in results if r['error']}
+    for error in list(errors)[:3]:
+        print(f"            error: {error}")
+
+
+if __name__ == "__main__":
+    """
+    Misura quante richieste in streaming a /process il server riesce a servire contemporaneamente.
+    Per ogni livello di concorrenza invia insieme N richieste e riporta il tempo al primo evento e il tempo
+    totale (p50/p95), gli stream serviti contemporaneamente e il throughput.
+
+    Per confrontare le modalità di gunicorn, avviare il server con GUNICORN_WORKER_CLASS=sync e poi con
+    GUNICORN_WORKER_CLASS=gevent (gunicorn --config gunicorn.conf.py app:app), quindi dalla root del progetto:
+
+    python test/load_test.py --url http://localhost:5000/process --levels 1 2 4 8 16 32
+    """
+    parser = argparse.ArgumentParser(description="Concurrent-request load test of the streaming /process endpoint")
+    parser.add_argument('--url', default=os.environ.get("LOAD_TEST_URL", "http://localhost:5000/process"))
+    parser.add_argument('--levels', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32],
+                        help="Numbers of simultaneous requests to test")
+    parser.add_argument('--text-file', help="Text sent in each request (default: a short sample)")
+    parser.add_argument('--timeout', type=float, default=300, help="Socket timeout of each request in seconds")
+    args = parser.parse_args()
+
+    request_text = DEFAULT_TEXT
+    if args.text_file:
+        with open(args.text_file, 'r', encoding='utf-8') as f:
+            request_text = f.read()
+
+    print(f"Load test of {args.url}")
+    print("concurrency   ok failed  first p50 first p95  total p50 total p95 max_active  req/s")
+    for level in args.levels:
+        run_level(args.url, level, request_text, args.timeout)
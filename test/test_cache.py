@@ -0,0 +1,178 @@
+from types import SimpleNamespace
+
+import pytest
+
+from lib import cache as cache_module
+from lib.cache import SetSimilarityCache, SQLiteCacheBackend, TTLCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Orologio controllato dai test, usato dalla cache sia per time.monotonic che per time.time"""
+    fake_clock = SimpleNamespace(now=1_000_000.0)
+    monkeypatch.setattr(cache_module, 'time', SimpleNamespace(monotonic=lambda: fake_clock.now,
+                                                              time=lambda: fake_clock.now))
+    return fake_clock
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / 'cache.sqlite3')
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = TTLCache('test', ttl_seconds=10)
+    cache.set('a', 1)
+
+    clock.now += 9
+    assert cache.get('a') == 1
+    clock.now += 2
+    assert cache.get('a') is None
+    assert cache.stats()['size'] == 0
+
+
+def test_ttl_override_per_entry(clock):
+    cache = TTLCache('test', ttl_seconds=100)
+    cache.set_many({'found': 1, 'missing': None}, ttl_seconds=5)
+    cache.set('other', 2)
+
+    clock.now += 6
+    assert cache.get_many(['found', 'missing', 'other']) == {'other': 2}
+
+
+def test_cached_none_is_a_hit(clock):
+    cache = TTLCache('test')
+    cache.set('missing', None)
+
+    assert cache.get_many(['missing']) == {'missing': None}
+    assert cache.stats()['hits'] == 1
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = TTLCache('test', max_size=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+
+    assert cache.get_many(['a', 'b', 'c']) == {'a': 1, 'c': 3}
+
+
+def test_stats_count_hits_and_misses(clock):
+    cache = TTLCache('test')
+    cache.set('a', 1)
+    cache.get_many(['a', 'b'])
+
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['hit_rate']) == (1, 1, 0.5)
+
+
+def test_shared_backend_is_read_by_other_workers(clock, db_path):
+    writer = TTLCache('test', backend=SQLiteCacheBackend('test', db_path=db_path), compress=True)
+    reader = TTLCache('test', backend=SQLiteCacheBackend('test', db_path=db_path), compress=True)
+    writer.set('a', {'value': [1, 2]})
+
+    assert reader.get('a') == {'value': [1, 2]}
+    assert reader.stats()['shared_hits'] == 1
+
+
+def test_shared_entry_keeps_its_remaining_ttl(clock, db_path):
+    writer = TTLCache('test', ttl_seconds=100, backend=SQLiteCacheBackend('test', db_path=db_path))
+    reader = TTLCache('test', ttl_seconds=100, backend=SQLiteCacheBackend('test', db_path=db_path))
+    writer.set('missing', None, ttl_seconds=10)
+
+    clock.now += 5
+    assert reader.get_many(['missing']) == {'missing': None}
+    # La copia locale scade con la voce condivisa, non dopo il TTL della cache
+    clock.now += 6
+    assert reader.get_many(['missing']) == {}
+
+
+def test_namespaces_are_separate(clock, db_path):
+    first = TTLCache('first', backend=SQLiteCacheBackend('first', db_path=db_path))
+    second = TTLCache('second', backend=SQLiteCacheBackend('second', db_path=db_path))
+    first.set('a', 1)
+
+    assert second.get('a') is None
+
+
+def test_backend_expired_entries_are_not_returned(clock, db_path):
+    backend = SQLiteCacheBackend('test', db_path=db_path)
+    backend.set_many({'a': b'1'}, ttl_seconds=10)
+
+    clock.now += 11
+    assert backend.get_many(['a']) == {}
+    assert backend.count() == 0
+
+
+def test_backend_keeps_only_the_newest_entries(clock, db_path):
+    backend = SQLiteCacheBackend('test', db_path=db_path, max_entries=2)
+    for key in ['a', 'b', 'c']:
+        clock.now += 1
+        backend.set_many({key: key.encode()}, ttl_seconds=100)
+
+    assert set(backend.get_many(['a', 'b', 'c'])) == {'b', 'c'}
+
+
+def test_similarity_exact_match_ignores_order(clock):
+    cache = SetSimilarityCache('test')
+    cache.set(['cpu', 'ram', 'bus'], 'it', ['query'])
+
+    assert cache.get(['bus', 'cpu', 'ram'], 'it') == (['query'], 1.0)
+    assert cache.stats()['exact_hits'] == 1
+
+
+def test_similarity_returns_most_similar_set_above_threshold(clock):
+    cache = SetSimilarityCache('test', min_similarity=0.6)
+    cache.set(['a', 'b', 'c', 'd'], 'it', 'four')
+    cache.set(['a', 'b', 'x', 'y'], 'it', 'two')
+
+    # Jaccard con {a, b, c, d}: 3 / 5 = 0.6; con {a, b, x, y}: 2 / 6
+    assert cache.get(['a', 'b', 'c', 'e'], 'it') == ('four', 0.6)
+    assert cache.stats()['similar_hits'] == 1
+
+
+def test_similarity_below_threshold_is_a_miss(clock):
+    cache = SetSimilarityCache('test', min_similarity=0.7)
+    cache.set(['a', 'b', 'c'], 'it', 'value')
+
+    assert cache.get(['a', 'b', 'd'], 'it') == (None, 0.0)
+    assert cache.get(['x'], 'it') == (None, 0.0)
+    assert cache.stats()['misses'] == 2
+
+
+def test_similarity_scopes_are_separate(clock):
+    cache = SetSimilarityCache('test')
+    cache.set(['a', 'b'], 'it', 'italian')
+
+    assert cache.get(['a', 'b'], 'en') == (None, 0.0)
+
+
+def test_similarity_entries_expire(clock):
+    cache = SetSimilarityCache('test', ttl_seconds=10)
+    cache.set(['a', 'b'], 'it', 'value')
+
+    clock.now += 11
+    assert cache.get(['a', 'b'], 'it') == (None, 0.0)
+
+
+def test_similarity_eviction_removes_entry_from_index(clock):
+    cache = SetSimilarityCache('test', max_size=2)
+    cache.set(['a'], 'it', 'first')
+    cache.set(['b'], 'it', 'second')
+    cache.set(['c'], 'it', 'third')
+
+    assert cache.get(['a'], 'it') == (None, 0.0)
+    assert ('it', 'a') not in cache._index
+    assert cache.get(['c'], 'it') == ('third', 1.0)
+
+
+def test_similarity_shared_backend_syncs_new_entries(clock, db_path):
+    writer = SetSimilarityCache('test', backend=SQLiteCacheBackend('test', db_path=db_path))
+    reader = SetSimilarityCache('test', backend=SQLiteCacheBackend('test', db_path=db_path))
+    assert reader.get(['a', 'b'], 'it') == (None, 0.0)
+
+    clock.now += 1
+    writer.set(['a', 'b', 'c'], 'it', ['query'])
+
+    assert reader.get(['a', 'b', 'c'], 'it') == (['query'], 1.0)
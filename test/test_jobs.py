@@ -0,0 +1,159 @@
+import json
+import time
+
+import pytest
+
+from lib.jobs import JOB_FINISHED_STATUSES, JobQueue, JobQueueFullError
+
+
+def event(status: str, **fields) -> str:
+    return json.dumps({'status': status, **fields}) + '\n'
+
+
+def completing_pipeline(file_bytes, filename, text):
+    yield event('file_received')
+    yield event('processing_complete', queries=[text])
+
+
+def failing_pipeline(file_bytes, filename, text):
+    yield event('extracting_keywords')
+    yield event('error', message='No text provided')
+
+
+@pytest.fixture
+def make_queue(tmp_path):
+    queues = []
+
+    def make(**kwargs) -> JobQueue:
+        job_queue = JobQueue(db_path=str(tmp_path / 'jobs.sqlite3'), **kwargs)
+        queues.append(job_queue)
+        return job_queue
+
+    yield make
+    for job_queue in queues:
+        job_queue.stop()
+
+
+def wait_finished(job_queue: JobQueue, job_id: str, timeout=5.0) -> dict:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = job_queue.get(job_id)
+        if job['status'] in JOB_FINISHED_STATUSES:
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"Job {job_id} did not finish: {job_queue.get(job_id)}")
+
+
+def make_stale(job_queue: JobQueue, job_id: str):
+    """Simula un job in esecuzione in un processo terminato, senza heartbeat da molto tempo"""
+    job_queue._connection().execute('UPDATE jobs SET heartbeat_at = ? WHERE id = ?', (time.time() - 3600, job_id))
+
+
+def test_jobs_are_queued_in_order(make_queue):
+    job_queue = make_queue()
+    first = job_queue.submit(None, None, 'first')
+    second = job_queue.submit(b'%PDF', 'notes.pdf', '')
+
+    assert job_queue.get(first)['queue_position'] == 1
+    assert job_queue.get(second)['queue_position'] == 2
+    assert job_queue.get(second)['filename'] == 'notes.pdf'
+    assert job_queue._claim()[0] == first
+    assert job_queue.get(first)['status'] == 'running'
+    assert job_queue.get(second)['queue_position'] == 1
+
+
+def test_submit_is_rejected_when_the_queue_is_full(make_queue):
+    job_queue = make_queue(max_queued=2)
+    job_queue.submit(None, None, 'a')
+    job_queue.submit(None, None, 'b')
+
+    with pytest.raises(JobQueueFullError):
+        job_queue.submit(None, None, 'c')
+    assert job_queue.stats()['jobs']['queued'] == 2
+
+
+def test_unknown_job(make_queue):
+    assert make_queue().get('missing') is None
+
+
+def test_job_runs_and_stores_its_events(make_queue):
+    job_queue = make_queue(max_workers=1)
+    job_queue.start(completing_pipeline)
+    job_id = job_queue.submit(None, None, 'cpu')
+
+    job = wait_finished(job_queue, job_id)
+
+    assert job['status'] == 'completed'
+    assert job['events'] == 2
+    assert job['last_event']['queries'] == ['cpu']
+    assert [seq for seq, _ in job_queue.get_events(job_id)] == [1, 2]
+    assert [json.loads(line)['status'] for _, line in job_queue.get_events(job_id, after=1)] == ['processing_complete']
+
+
+def test_error_event_fails_the_job(make_queue):
+    job_queue = make_queue(max_workers=1)
+    job_queue.start(failing_pipeline)
+    job_id = job_queue.submit(None, None, '')
+
+    job = wait_finished(job_queue, job_id)
+
+    assert (job['status'], job['error']) == ('failed', 'No text provided')
+    assert job_queue.stats()['failed_in_worker'] == 1
+
+
+def test_stale_job_is_requeued_without_its_old_events(make_queue):
+    job_queue = make_queue(max_attempts=2, stale_after_seconds=60)
+    job_id = job_queue.submit(None, None, 'cpu')
+    job_queue._claim()
+    for seq in (1, 2, 3):
+        job_queue._append_event(job_id, seq, event('file_page_processed'))
+    make_stale(job_queue, job_id)
+
+    job_queue._recover_stale_jobs(time.time())
+
+    job = job_queue.get(job_id)
+    assert (job['status'], job['attempts'], job['events']) == ('queued', 1, 0)
+    assert job_queue.stats()['recovered_in_worker'] == 1
+
+    job_queue.start(completing_pipeline)
+    job = wait_finished(job_queue, job_id)
+    assert (job['status'], job['attempts'], job['events']) == ('completed', 2, 2)
+    assert [seq for seq, _ in job_queue.get_events(job_id)] == [1, 2]
+
+
+def test_stale_job_fails_after_max_attempts(make_queue):
+    job_queue = make_queue(max_attempts=1, stale_after_seconds=60)
+    job_id = job_queue.submit(None, None, 'cpu')
+    job_queue._claim()
+    make_stale(job_queue, job_id)
+
+    job_queue._recover_stale_jobs(time.time())
+
+    job = job_queue.get(job_id)
+    assert job['status'] == 'failed'
+    assert job['error'] == 'The worker running the job stopped'
+
+
+def test_job_with_recent_heartbeat_is_not_recovered(make_queue):
+    job_queue = make_queue(stale_after_seconds=60)
+    job_id = job_queue.submit(None, None, 'cpu')
+    job_queue._claim()
+
+    job_queue._recover_stale_jobs(time.time())
+
+    assert job_queue.get(job_id)['status'] == 'running'
+    assert job_queue.stats()['recovered_in_worker'] == 0
+
+
+def test_stale_job_is_recovered_by_one_worker_only(make_queue):
+    first_worker = make_queue(stale_after_seconds=60)
+    second_worker = make_queue(stale_after_seconds=60)
+    job_id = first_worker.submit(None, None, 'cpu')
+    first_worker._claim()
+    make_stale(first_worker, job_id)
+
+    now = time.time()
+    first_worker._recover_stale_jobs(now)
+    second_worker._recover_stale_jobs(now)
+
+    assert first_worker.stats()['recovered_in_worker'] + second_worker.stats()['recovered_in_worker'] == 1
@@ -0,0 +1,135 @@
+import logging
+import os
+from functools import partial
+
+import pytest
+
+from lib import log_reader
+from lib.log_reader import parse_log_cursor, read_log_forward, read_log_tail
+
+
+def make_record(index: int, level='INFO', extra_lines=()) -> str:
+    lines = [f"2026-10-17 10:00:{index:02d},000 {level} lib.app_logger module function : message {index}"]
+    lines.extend(extra_lines)
+    return '\n'.join(lines) + '\n'
+
+
+@pytest.fixture
+def log_path(tmp_path, monkeypatch):
+    """Log in una cartella temporanea, con due file ruotati al massimo"""
+    path = str(tmp_path / 'app.log')
+    monkeypatch.setattr(log_reader, 'get_log_segments', partial(log_reader.get_log_segments, path, 2))
+    return path
+
+
+def write_log(path: str, *records: str, mode='a'):
+    with open(path, mode, encoding='utf-8') as f:
+        f.write(''.join(records))
+
+
+def rotate(path: str):
+    """Ruota il log come RotatingFileHandler con backup_count 2"""
+    if os.path.exists(f"{path}.1"):
+        os.replace(f"{path}.1", f"{path}.2")
+    os.replace(path, f"{path}.1")
+
+
+def messages(page) -> list[str]:
+    return [record.text.split(' : ')[1].split('\n')[0] for record in page.records]
+
+
+def test_tail_returns_last_records_in_order(log_path):
+    write_log(log_path, *(make_record(index) for index in range(10)))
+
+    page = read_log_tail(limit=3)
+
+    assert messages(page) == ['message 7', 'message 8', 'message 9']
+    assert page.prev_cursor == page.records[0].start_cursor
+
+
+def test_tail_pages_backwards_with_prev_cursor(log_path):
+    write_log(log_path, *(make_record(index) for index in range(5)))
+
+    first_page = read_log_tail(limit=2)
+    second_page = read_log_tail(limit=2, before=first_page.prev_cursor)
+    third_page = read_log_tail(limit=2, before=second_page.prev_cursor)
+
+    assert messages(second_page) == ['message 1', 'message 2']
+    assert messages(third_page) == ['message 0']
+    assert third_page.prev_cursor is None
+
+
+def test_multiline_record_and_incomplete_last_line(log_path):
+    write_log(log_path, make_record(0), make_record(1, 'ERROR', ['Traceback (most recent call last):', '  boom']),
+              "2026-10-17 10:00:02,000 INFO partial line")
+
+    page = read_log_tail(limit=10)
+
+    assert len(page.records) == 2
+    assert page.records[1].text.endswith('  boom')
+    assert page.records[1].level == 'ERROR'
+
+
+def test_level_and_since_filters(log_path):
+    write_log(log_path, make_record(0, 'ERROR'), make_record(1, 'INFO'), make_record(2, 'WARNING'),
+              make_record(3, 'INFO'))
+
+    assert messages(read_log_tail(min_level=logging.WARNING)) == ['message 0', 'message 2']
+    assert messages(read_log_tail(since='2026-10-17 10:00:02,000')) == ['message 2', 'message 3']
+
+
+def test_forward_cursor_returns_only_new_records(log_path):
+    write_log(log_path, make_record(0), make_record(1))
+    cursor = read_log_tail(limit=10).next_cursor
+
+    assert read_log_forward(cursor).records == []
+
+    write_log(log_path, make_record(2))
+    page = read_log_forward(cursor)
+    assert messages(page) == ['message 2']
+    assert read_log_forward(page.next_cursor).records == []
+
+
+def test_forward_cursor_survives_rotation(log_path):
+    write_log(log_path, make_record(0), make_record(1))
+    cursor = read_log_forward(None, limit=1).next_cursor
+    rotate(log_path)
+    write_log(log_path, make_record(2), make_record(3))
+
+    page = read_log_forward(cursor)
+
+    assert messages(page) == ['message 1', 'message 2', 'message 3']
+    assert parse_log_cursor(page.next_cursor)[0] == os.stat(log_path).st_ino
+
+
+def test_forward_cursor_of_deleted_file_restarts_from_oldest(log_path):
+    write_log(log_path, make_record(0))
+    cursor = read_log_forward(None).next_cursor
+    # Il file resta aperto, così il filesystem non assegna il suo inode ad uno dei nuovi file
+    with open(log_path, 'rb'):
+        for index in range(1, 4):
+            rotate(log_path)
+            write_log(log_path, make_record(index))
+
+        page = read_log_forward(cursor)
+
+    # Il file del cursore è stato eliminato: restano app.log.2, app.log.1 e app.log
+    assert messages(page) == ['message 1', 'message 2', 'message 3']
+
+
+def test_tail_continues_into_rotated_files(log_path):
+    write_log(log_path, make_record(0), make_record(1))
+    rotate(log_path)
+    write_log(log_path, make_record(2))
+
+    page = read_log_tail(limit=3)
+
+    assert messages(page) == ['message 0', 'message 1', 'message 2']
+    assert messages(read_log_tail(limit=2, before=read_log_tail(limit=1).prev_cursor)) == ['message 0', 'message 1']
+
+
+def test_invalid_cursor():
+    with pytest.raises(ValueError):
+        parse_log_cursor('not-a-cursor')
+    with pytest.raises(ValueError):
+        parse_log_cursor('12:-1')
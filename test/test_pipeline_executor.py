@@ -0,0 +1,154 @@
+import io
+import os
+import time
+
+import pytest
+from PIL import Image
+
+from lib import word_extraction
+from lib.pipeline_executor import PipelineBusyError, PipelineExecutor, PipelineTaskTimeoutError
+
+
+def sleep_ignoring_errors(seconds: float):
+    """Come l'estrazione di un PDF, che prosegue alla pagina successiva dopo ogni errore"""
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        try:
+            time.sleep(0.01)
+        except Exception:
+            pass
+
+
+def slow_ocr(image, language: str) -> str:
+    """Sostituisce tesseract: impiega un tempo fisso e restituisce il processo che ha letto la striscia"""
+    time.sleep(0.5)
+    return str(os.getpid())
+
+
+def fail(message: str):
+    raise ValueError(message)
+
+
+@pytest.fixture
+def make_executor():
+    executors = []
+
+    def make(**kwargs) -> PipelineExecutor:
+        executor = PipelineExecutor(**{'max_workers': 1, 'max_queue_size': 0, 'max_memory_mb': 0, **kwargs})
+        executor.start()
+        executors.append(executor)
+        # Attende che il processo del pool sia pronto, anche con un request_timeout_seconds breve
+        executor.result(executor.submit(len, []), deadline=time.monotonic() + 30)
+        return executor
+
+    yield make
+    for executor in executors:
+        if executor._pool is not None:
+            executor._pool.shutdown(cancel_futures=True)
+
+
+def test_run_returns_the_result_and_records_stats(make_executor):
+    executor = make_executor()
+
+    assert executor.run(sum, [1, 2, 3]) == 6
+    assert executor.stats()['tasks']['sum']['calls'] == 1
+    assert executor.stats()['in_progress'] == 0
+
+
+def test_task_exception_is_raised_by_result(make_executor):
+    executor = make_executor()
+
+    with pytest.raises(ValueError, match='broken'):
+        executor.run(fail, 'broken')
+    assert executor.stats()['tasks']['fail']['failures'] == 1
+
+
+def test_submit_is_rejected_when_the_queue_is_full(make_executor):
+    executor = make_executor(max_queue_size=1)
+    running = executor.submit(time.sleep, 0.3)
+    queued = executor.submit(time.sleep, 0)
+
+    with pytest.raises(PipelineBusyError):
+        executor.submit(time.sleep, 0)
+    assert executor.stats()['rejected'] == 1
+
+    executor.result(running)
+    executor.result(queued)
+    assert executor.run(sum, [1]) == 1
+
+
+def test_task_is_interrupted_after_its_timeout(make_executor):
+    executor = make_executor(task_timeout_seconds=0.2)
+    start = time.monotonic()
+
+    with pytest.raises(PipelineTaskTimeoutError):
+        executor.run(time.sleep, 10)
+    assert time.monotonic() - start < 5
+    assert executor.stats()['timeouts'] == 1
+    assert executor.run(sum, [1]) == 1
+
+
+def test_task_timeout_is_not_swallowed_by_the_task(make_executor):
+    executor = make_executor(task_timeout_seconds=0.2)
+    start = time.monotonic()
+
+    with pytest.raises(PipelineTaskTimeoutError):
+        executor.run(sleep_ignoring_errors, 10)
+    assert time.monotonic() - start < 5
+
+
+def test_result_waits_at_most_until_the_request_deadline(make_executor):
+    executor = make_executor(max_queue_size=2, request_timeout_seconds=0.2)
+    running = executor.submit(time.sleep, 1)
+    next_up = executor.submit(time.sleep, 0)  # Già passato al processo del pool, non più annullabile
+    queued = executor.submit(time.sleep, 10)
+    start = time.monotonic()
+
+    with pytest.raises(PipelineTaskTimeoutError):
+        executor.result(queued)
+    assert time.monotonic() - start < 1
+    # Il task ancora in coda viene annullato e non verrà eseguito
+    assert queued.cancelled()
+    assert executor.stats()['in_progress'] == 2
+
+    executor.result(running, deadline=time.monotonic() + 5)
+    executor.result(next_up, deadline=time.monotonic() + 5)
+    assert executor.stats()['in_progress'] == 0
+
+
+def test_shared_deadline_is_not_extended_by_later_results(make_executor):
+    executor = make_executor(max_queue_size=1)
+    deadline = time.monotonic() + 0.3
+    executor.result(executor.submit(time.sleep, 0.2), deadline)
+
+    with pytest.raises(PipelineTaskTimeoutError):
+        executor.result(executor.submit(time.sleep, 0.5), deadline)
+
+
+def test_without_workers_tasks_run_in_the_current_process():
+    executor = PipelineExecutor(max_workers=0)
+
+    assert executor.run(sum, [1, 2]) == 3
+    with pytest.raises(ValueError):
+        executor.run(fail, 'broken')
+    with pytest.raises(ValueError):
+        executor.submit(fail, 'broken').result()
+
+
+def test_image_tiles_are_ocr_in_parallel_inside_the_pool(make_executor, monkeypatch):
+    # I processi del pool vengono creati dopo, quindi ereditano le sostituzioni
+    monkeypatch.setattr(word_extraction, '_ocr_image', slow_ocr)
+    monkeypatch.setattr(word_extraction, 'OCR_PREPROCESS', False)
+    image_file = io.BytesIO()
+    Image.new('L', (400, word_extraction.OCR_TILE_HEIGHT_PX * 4), color=255).save(image_file, format='PNG')
+    executor = make_executor(ocr_workers=4)
+    executor.run(word_extraction.read_file_from_bytes, image_file.getvalue(), 'warm-up.png')
+
+    start = time.monotonic()
+    success, text = executor.run(word_extraction.read_file_from_bytes, image_file.getvalue(), 'notes.png')
+
+    tile_processes = text.split('\n')
+    assert success and len(tile_processes) == 4
+    assert len(set(tile_processes)) > 1
+    # In sequenza le 4 strisce richiederebbero 2 secondi
+    assert time.monotonic() - start < 1.5
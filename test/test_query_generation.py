@@ -0,0 +1,70 @@
+import json
+
+import pytest
+
+from lib.query_generation import InvalidQueriesOutputError, JsonQueriesStreamParser, parse_queries_json
+
+
+def feed_in_chunks(parser: JsonQueriesStreamParser, text: str, chunk_size: int) -> list[list[str]]:
+    return [parser.feed(text[start:start + chunk_size]) for start in range(0, len(text), chunk_size)]
+
+
+def test_queries_are_returned_as_soon_as_complete():
+    parser = JsonQueriesStreamParser()
+
+    assert parser.feed('{"queries": ["cos\'è una') == []
+    assert parser.feed(' cpu", "memoria ') == ["cos'è una cpu"]
+    assert parser.feed('ram"') == ['memoria ram']
+    assert not parser.finished
+    assert parser.feed(']}') == []
+    assert parser.finished
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 7, 1000])
+def test_any_chunking_gives_the_same_queries(chunk_size):
+    queries = ['architettura del processore', 'memoria cache \\"L1\\"', 'bus di sistema']
+    text = '{\n  "queries" : [\n    ' + ',\n    '.join(f'"{query}"' for query in queries) + '\n  ]\n}'
+    parser = JsonQueriesStreamParser()
+
+    parsed = [query for chunk_queries in feed_in_chunks(parser, text, chunk_size) for query in chunk_queries]
+
+    assert parsed == ['architettura del processore', 'memoria cache "L1"', 'bus di sistema']
+    assert parser.finished
+
+
+def test_escaped_unicode_and_whitespace_are_normalized():
+    parser = JsonQueriesStreamParser()
+
+    assert parser.feed(json.dumps({'queries': ['  unità   centrale\n']})) == ['unità centrale']
+
+
+def test_text_after_the_array_is_ignored():
+    parser = JsonQueriesStreamParser()
+
+    assert parser.feed('{"queries": ["a"], "other": ["b"]}') == ['a']
+    assert parser.feed('"c"') == []
+
+
+def test_non_string_query_is_rejected():
+    parser = JsonQueriesStreamParser()
+
+    with pytest.raises(InvalidQueriesOutputError):
+        parser.feed('{"queries": ["a", 42]}')
+
+
+@pytest.mark.parametrize('query', ['', '   ', 'x' * 121])
+def test_empty_or_too_long_query_is_rejected(query):
+    parser = JsonQueriesStreamParser()
+
+    with pytest.raises(InvalidQueriesOutputError):
+        parser.feed(json.dumps({'queries': [query]}))
+
+
+def test_parse_queries_json_limits_the_number_of_queries():
+    assert parse_queries_json('{"queries": ["a", "b", "c"]}', num_queries=2) == ['a', 'b']
+
+
+@pytest.mark.parametrize('response_text', ['{"queries": ["a"', '{"other": []}', '{"queries": []}', '[]'])
+def test_parse_queries_json_rejects_invalid_output(response_text):
+    with pytest.raises(InvalidQueriesOutputError):
+        parse_queries_json(response_text)
@@ -0,0 +1,22 @@
+from lib import text_processing
+from lib.text_processing import detect_section_languages, extract_keywords_by_sections
+
+ITALIAN_SECTION = ' '.join(["Il processore esegue le istruzioni del programma leggendole dalla memoria centrale. "
+                            "La memoria cache conserva i dati usati più di frequente, così il processore non deve "
+                            "attendere la memoria principale, che è molto più lenta."] * 3)
+ENGLISH_SECTION = ' '.join(["The operating system schedules the processes and decides which one runs on each core. "
+                            "Every process has its own virtual memory, mapped to the physical memory by the page "
+                            "table, so that processes cannot read each other's data."] * 3)
+
+
+def test_section_languages_are_detected_once_per_section():
+    cache_stats = text_processing.detected_language_cache.stats()
+
+    section_languages = detect_section_languages([ITALIAN_SECTION, ENGLISH_SECTION])
+
+    assert [section['language'] for section in section_languages] == ['it', 'en']
+    assert [section['chars'] for section in section_languages] == [len(ITALIAN_SECTION), len(ENGLISH_SECTION)]
+    # L'estrazione per sezioni trova le lingue delle stesse sezioni già nella cache
+    extract_keywords_by_sections(ITALIAN_SECTION + '\n\n' + ENGLISH_SECTION, top_n=5,
+                                 section_size=max(len(ITALIAN_SECTION), len(ENGLISH_SECTION)) + 10)
+    assert text_processing.detected_language_cache.stats()['hits'] == cache_stats['hits'] + 2
@@ -0,0 +1,41 @@
+import time
+
+import pytest
+
+from lib.youtube_interactions import ConcurrentYouTubeSearch
+
+
+@pytest.fixture
+def make_search(monkeypatch):
+    def make(search_seconds: float, **kwargs) -> ConcurrentYouTubeSearch:
+        youtube_search = ConcurrentYouTubeSearch(**kwargs)
+        # Sostituisce la chiamata all'API: ogni ricerca impiega un tempo fisso e non trova video
+        monkeypatch.setattr(youtube_search, '_search', lambda query: time.sleep(search_seconds) or [])
+        return youtube_search
+
+    return make
+
+
+def test_queries_submitted_late_still_get_the_whole_deadline(make_search):
+    youtube_search = make_search(0.2, deadline_seconds=0.6, stats_reserved_seconds=0.3)
+    youtube_search.submit('first')
+    # Come una query generata per ultima, accodata dopo deadline_seconds - stats_reserved_seconds
+    time.sleep(0.4)
+    assert youtube_search.poll_completed() == [('first', [])]
+    youtube_search.submit('last')
+    youtube_search.start_deadline()
+
+    assert list(youtube_search.as_completed()) == [('last', [])]
+    assert youtube_search.failed_queries == []
+    assert youtube_search.is_complete
+
+
+def test_searches_still_running_at_the_search_deadline_are_abandoned(make_search):
+    youtube_search = make_search(1, deadline_seconds=0.5, stats_reserved_seconds=0.3)
+    youtube_search.submit('slow')
+    start = time.monotonic()
+
+    assert list(youtube_search.as_completed()) == []
+    assert time.monotonic() - start < 0.5
+    assert youtube_search.failed_queries == ['slow']
+    assert not youtube_search.is_complete